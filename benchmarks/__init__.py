@@ -0,0 +1,3 @@
+"""
+Benchmarks for the HTTP server, run with: python -m benchmarks --help
+"""
@@ -0,0 +1,75 @@
+import argparse
+import json
+import platform
+import sys
+
+from .load import SCENARIOS, SETTINGS, run_with_settings
+from .micro import BENCHMARKS, run_micro
+
+
+def _csv(value):
+    return [v for v in value.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="benchmark the HTTP server over loopback, results are written as JSON",
+    )
+    parser.add_argument(
+        "--scenarios", type=_csv, default=list(SCENARIOS),
+        help=f"comma separated, from: {','.join(SCENARIOS)}",
+    )
+    parser.add_argument(
+        "--concurrency", type=_csv, default=["1", "16", "64"],
+        help="comma separated client connection counts",
+    )
+    parser.add_argument(
+        "--settings", type=_csv, default=["default"],
+        help=f"comma separated server settings to compare, from: {','.join(SETTINGS)}",
+    )
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds per run")
+    parser.add_argument(
+        "--micro", type=_csv, default=list(BENCHMARKS),
+        help=f"comma separated, from: {','.join(BENCHMARKS)}",
+    )
+    parser.add_argument("--no-load", action="store_true", help="only run microbenchmarks")
+    parser.add_argument("--no-micro", action="store_true", help="only run load scenarios")
+    parser.add_argument(
+        "--trace-memory", action="store_true",
+        help="report peak traced memory, slows the server down",
+    )
+    parser.add_argument("--output", help="write results to file instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = {
+        "python": platform.python_implementation() + " " + platform.python_version(),
+        "load": [],
+        "micro": [],
+    }
+    if not args.no_load:
+        for name in args.scenarios:
+            for concurrency in args.concurrency:
+                for settings in args.settings:
+                    result = run_with_settings(
+                        name,
+                        int(concurrency),
+                        args.duration,
+                        settings,
+                        trace_memory=args.trace_memory,
+                    )
+                    results["load"].append(result)
+                    print(json.dumps(result), file=sys.stderr)
+    if not args.no_micro:
+        results["micro"] = run_micro(args.micro)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as fo:
+            fo.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import json
+import os
+
+from httpserver import HTTPServer
+from httpserver.constants import STATUS_OK_200
+from httpserver.logger import LEVEL_NONE, Logger
+
+STREAM_CHUNKS = 64
+FILE_SIZE = 1024 * 1024
+
+
+def make_file(directory):
+    path = os.path.join(directory, "download.bin")
+    with open(path, "wb") as fo:
+        fo.write(os.urandom(FILE_SIZE))
+    return path
+
+
+def build_server(file_path, **options):
+    """
+    The application every load scenario runs against
+    """
+    options.setdefault("logger", Logger(LEVEL_NONE))
+    server = HTTPServer(**options)
+
+    @server.route("/")
+    def get_index(ctx):
+        return ctx.response.text(STATUS_OK_200, "Hello World!")
+
+    @server.route("/form", "POST")
+    def post_form(ctx):
+        form = ctx.request.form()
+        return ctx.response.text(STATUS_OK_200, f"Hello {form['name'].decode()}!")
+
+    @server.route("/json", "POST")
+    def post_json(ctx):
+        body = ctx.request.json()
+        return ctx.response.json(STATUS_OK_200, {"message": f"Hello {body['name']}!"})
+
+    @server.route("/stream")
+    def get_stream(ctx):
+        def stream():
+            for i in range(STREAM_CHUNKS):
+                yield b"chunk %d\n" % i
+
+        return ctx.response.content_stream(STATUS_OK_200, "text/plain", stream())
+
+    @server.route("/file")
+    def get_file(ctx):
+        return ctx.response.file(file_path)
+
+    return server
+
+
+FORM_BODY = b"name=" + b"x" * 32
+JSON_BODY = json.dumps({"name": "x" * 32}).encode()
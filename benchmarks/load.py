@@ -0,0 +1,175 @@
+import asyncio
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+from .app import FORM_BODY, JSON_BODY, build_server, make_file
+
+HOST = "127.0.0.1"
+
+
+def _request(method, path, content_type=None, body=b""):
+    lines = [f"{method} {path} HTTP/1.1", "Host: bench"]
+    if content_type is not None:
+        lines.append(f"Content-Type: {content_type}")
+        lines.append(f"Content-Length: {len(body)}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode() + body
+
+
+# {"name": (raw request, pipeline depth), ...}
+SCENARIOS = {
+    "get": (_request("GET", "/"), 1),
+    "get_pipelined": (_request("GET", "/"), 16),
+    "post_form": (
+        _request("POST", "/form", "application/x-www-form-urlencoded", FORM_BODY),
+        1,
+    ),
+    "post_json": (_request("POST", "/json", "application/json", JSON_BODY), 1),
+    "stream": (_request("GET", "/stream"), 1),
+    "file": (_request("GET", "/file"), 1),
+}
+
+
+# {"name": (loop, start options), ...} server settings to compare
+SETTINGS = {
+    "default": ("asyncio", {}),
+    "nodelay_off": ("asyncio", {"nodelay": False}),
+    "keepalive": ("asyncio", {"keepalive": True}),
+    "small_buffers": ("asyncio", {"recv_buffer": 4096, "send_buffer": 4096}),
+    "large_buffers": ("asyncio", {"recv_buffer": 1 << 20, "send_buffer": 1 << 20}),
+    "backlog_1024": ("asyncio", {"backlog": 1024}),
+    "defer_accept": ("asyncio", {"defer_accept": 1}),
+    "uvloop": ("uvloop", {}),
+}
+
+
+def _loop_factory(name):
+    if name == "uvloop":
+        import uvloop
+
+        return uvloop.new_event_loop
+    return asyncio.new_event_loop
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    content_length = None
+    chunked = False
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            content_length = int(value)
+        elif name == b"transfer-encoding" and b"chunked" in value:
+            chunked = True
+    if chunked:
+        while True:
+            size = int((await reader.readuntil(b"\r\n"))[:-2], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                return
+    elif content_length:
+        await reader.readexactly(content_length)
+
+
+async def _client(port, raw, depth, deadline, latencies):
+    reader, writer = await asyncio.open_connection(HOST, port)
+    batch = raw * depth
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            writer.write(batch)
+            await writer.drain()
+            for _ in range(depth):
+                await read_response(reader)
+                latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_with_settings(name, concurrency, duration, settings="default", trace_memory=False):
+    """
+    Run one scenario on a fresh event loop using the given SETTINGS entry
+
+    :return: dict of results, with "error" set if the settings are unavailable
+    """
+    loop_name, start_options = SETTINGS[settings]
+    try:
+        loop = _loop_factory(loop_name)()
+    except ImportError as err:
+        return {"scenario": name, "concurrency": concurrency, "settings": settings, "error": str(err)}
+    try:
+        result = loop.run_until_complete(
+            run_scenario(
+                name,
+                concurrency,
+                duration,
+                start_options=start_options,
+                trace_memory=trace_memory,
+            )
+        )
+    except ValueError as err:
+        # option not supported on this platform
+        return {"scenario": name, "concurrency": concurrency, "settings": settings, "error": str(err)}
+    finally:
+        loop.close()
+    result["settings"] = settings
+    return result
+
+
+async def run_scenario(name, concurrency, duration, server_options=None, start_options=None, trace_memory=False):
+    """
+    Run one scenario against an in-process server
+
+    :return: dict of results
+    """
+    raw, depth = SCENARIOS[name]
+    with tempfile.TemporaryDirectory() as directory:
+        server = build_server(make_file(directory), **(server_options or {}))
+        await server.start(HOST, 0, **(start_options or {}))
+        port = server._server.sockets[0].getsockname()[1]
+        if trace_memory:
+            tracemalloc.start()
+        latencies = []
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(
+                *(
+                    _client(port, raw, depth, started + duration, latencies)
+                    for _ in range(concurrency)
+                )
+            )
+        finally:
+            elapsed = time.perf_counter() - started
+            peak_memory = None
+            if trace_memory:
+                peak_memory = tracemalloc.get_traced_memory()[1] // 1024
+                tracemalloc.stop()
+            await server.stop()
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+        "peak_memory_kb": peak_memory,
+        # process wide high-water mark, so only ever grows between runs
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if resource is not None
+        else None,
+    }
@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+from httpserver import HTTPServer, helpers
+from httpserver.request import HTTPRequest, Request
+from httpserver.response import ResponseMaker
+
+HEAD = (
+    b"GET /api/items?page=2&sort=name HTTP/1.1\r\n"
+    b"Host: localhost:8000\r\n"
+    b"User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0\r\n"
+    b"Accept: text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8\r\n"
+    b"Accept-Language: en-GB,en;q=0.5\r\n"
+    b"Accept-Encoding: gzip, deflate, br\r\n"
+    b"Connection: keep-alive\r\n"
+    b"\r\n"
+)
+QUERY_STRING = "&".join(f"filter{i}=value%20number+{i}%21" for i in range(50))
+LONG_VALUE = "%E2%9C%93+long+value+" * 200
+LONG_VALUE_BYTES = LONG_VALUE.encode()
+PLAIN_VALUE = b"plain-value-" * 200
+JSON_OBJECT = {"items": [{"id": i, "name": f"item {i}"} for i in range(20)]}
+QUERY_REQUEST = HTTPRequest(
+    "HTTP/1.1", "GET", "/api/items?" + QUERY_STRING, {}, None
+)
+
+
+class _Reader:
+    def __init__(self, data):
+        self._data = data
+
+    async def read(self, n):
+        data, self._data = self._data[:n], self._data[n:]
+        return data
+
+
+class _Writer:
+    def write(self, data):
+        pass
+
+    def writelines(self, parts):
+        pass
+
+    async def drain(self):
+        pass
+
+
+def _parse_request():
+    request = Request(HTTPRequest(*helpers.parse_head(HEAD)[:4], None))
+    return request.path, request.headers.get("Connection")
+
+
+async def _read_head():
+    await helpers.BufferedReader(_Reader(HEAD)).read_head(8192)
+
+
+_server = HTTPServer()
+_writer = _Writer()
+
+
+async def _write_message():
+    response = ResponseMaker("HTTP/1.1", {"Connection": "keep-alive"}).text(
+        200, "Hello World!"
+    )
+    await _server._write_message(_writer, response)
+
+
+def _time(fn, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return time.perf_counter() - start
+
+
+def _time_async(fn, number):
+    async def run():
+        start = time.perf_counter()
+        for _ in range(number):
+            await fn()
+        return time.perf_counter() - start
+
+    return asyncio.run(run())
+
+
+# {"name": (callable, is_async, iterations), ...}
+BENCHMARKS = {
+    "read_head": (_read_head, True, 20000),
+    "parse_request": (_parse_request, False, 20000),
+    "perc_decode": (lambda: helpers.perc_decode(LONG_VALUE, True), False, 200),
+    "perc_decode_bytes": (
+        lambda: helpers.perc_decode(memoryview(LONG_VALUE_BYTES), True),
+        False,
+        200,
+    ),
+    "perc_decode_plain": (lambda: helpers.perc_decode(PLAIN_VALUE, True), False, 2000),
+    "process_query_string": (
+        lambda: helpers.process_query_string(QUERY_STRING),
+        False,
+        2000,
+    ),
+    # query is only parsed when a handler reads it
+    "request_unused_query": (lambda: Request(QUERY_REQUEST), False, 20000),
+    "request_query": (lambda: Request(QUERY_REQUEST).query, False, 2000),
+    "write_message": (_write_message, True, 20000),
+    "json_response": (
+        lambda: ResponseMaker("HTTP/1.1", {}).json(200, JSON_OBJECT),
+        False,
+        20000,
+    ),
+}
+
+
+def run_micro(names=None):
+    results = []
+    for name, (fn, is_async, number) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        elapsed = (_time_async if is_async else _time)(fn, number)
+        results.append(
+            {
+                "name": name,
+                "iterations": number,
+                "us_per_op": round(elapsed / number * 1e6, 3),
+                "ops_per_sec": round(number / elapsed, 1),
+            }
+        )
+    return results
@@ -0,0 +1,140 @@
+import asyncio
+
+from .constants import METHOD_GET, METHOD_HEAD
+from .helpers import LRUCache, monotonic
+from .response import RawResponse
+
+DEFAULT_CACHE_MAX_ENTRIES = 128
+DEFAULT_CACHE_MAX_SIZE = 1048576
+# statuses cacheable by default, following RFC 9111
+CACHEABLE_STATUS = (200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501)
+
+
+def _cacheable(response):
+    if response.status_code not in CACHEABLE_STATUS:
+        return False
+    payload = response.payload
+    if payload is not None and not isinstance(payload, (bytes, bytearray)):
+        # streams and files are left alone
+        return False
+    headers = response.headers
+    if "Set-Cookie" in headers:
+        return False
+    cache_control = headers.get("Cache-Control", "").lower()
+    return "no-store" not in cache_control and "private" not in cache_control
+
+
+class _Flight:
+    """
+    A miss being handled, that requests for the same key wait on
+    """
+    def __init__(self) -> None:
+        self.event = asyncio.Event()
+        self.raw = None
+
+
+class ResponseCache:
+    """
+    Caches rendered responses of GET routes registered with cache_ttl,
+    keyed by path, query string and the route's vary headers.
+    Concurrent misses for a key run the handler once.
+    """
+    def __init__(
+        self,
+        max_entries=DEFAULT_CACHE_MAX_ENTRIES,
+        max_size=DEFAULT_CACHE_MAX_SIZE,
+    ) -> None:
+        # {key: (RawResponse, expires_at), ...} sized by rendered length
+        self._entries = LRUCache(max_entries, max_size)
+        # {key: _Flight, ...}
+        self._flights = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._entries.size
+
+    def clear(self):
+        self._entries.clear()
+
+    def _store(self, key, response, ttl, request_headers):
+        # only headers set by the endpoint, ones set before it for this
+        # request (e.g. by middleware) are set again on each hit
+        headers = {}
+        for name, value in response.headers.items():
+            if request_headers.get(name) != value:
+                headers[name] = value
+        # the connection header is set per request when rendered
+        headers.pop("Connection", None)
+        payload = response.payload
+        if payload is not None:
+            payload = bytes(payload)
+            # set from the payload by RawResponse
+            headers.pop("Content-Length", None)
+        raw = RawResponse(response.status_code, headers, payload)
+        size = len(payload or b"") + sum(
+            len(name) + len(value) + 4 for name, value in headers.items()
+        )
+        self._entries.set(key, (raw, monotonic() + ttl), size)
+        return raw
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        raw, expires_at = entry
+        if monotonic() >= expires_at:
+            self._entries.pop(key)
+            return None
+        return raw
+
+    def wrap(self, endpoint, ttl, vary=()):
+        """
+        Wrap a route's endpoint, caching its responses for ttl seconds
+
+        :param vary: request header names whose values are part of the key
+        """
+        vary = tuple(vary)
+
+        async def cached_endpoint(ctx):
+            request = ctx.request
+            if request.method not in (METHOD_GET, METHOD_HEAD):
+                return await endpoint(ctx)
+            key = (request.path, request.query_string)
+            if vary:
+                headers = request.headers
+                key += tuple(headers.get(name) for name in vary)
+
+            raw = self._lookup(key)
+            waited = False
+            if raw is None:
+                flight = self._flights.get(key)
+                if flight is not None:
+                    # another request is already running the handler
+                    await flight.event.wait()
+                    raw = flight.raw
+                    waited = True
+            if raw is not None:
+                self.hits += 1
+                return ctx.response.raw_cached(raw)
+
+            self.misses += 1
+            if waited:
+                # the other request's response could not be cached
+                return await endpoint(ctx)
+            flight = self._flights[key] = _Flight()
+            request_headers = dict(ctx.response.headers)
+            try:
+                response = await endpoint(ctx)
+                if _cacheable(response):
+                    flight.raw = self._store(key, response, ttl, request_headers)
+                return response
+            finally:
+                del self._flights[key]
+                flight.event.set()
+
+        return cached_endpoint
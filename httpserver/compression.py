@@ -0,0 +1,204 @@
+try:
+    import zlib
+except ImportError:
+    zlib = None
+
+try:
+    import deflate
+except ImportError:
+    # CPython, or a MicroPython build without it
+    deflate = None
+
+from .helpers import accepted_encodings
+from .response import HTTPResponse, RawResponse, ResponseFile, ResponseStream
+
+# HTTP "deflate" is zlib wrapped, not raw deflate
+_WBITS = {"gzip": 31, "deflate": 15}
+
+DEFAULT_MIN_SIZE = 512
+# content types not worth compressing again, matched by prefix
+DEFAULT_SKIP_TYPES = (
+    "image/",
+    "video/",
+    "audio/",
+    "font/woff",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/octet-stream",
+    "application/pdf",
+    "application/wasm",
+    # events must reach the client as sent, MicroPython can't sync flush
+    "text/event-stream",
+)
+# exceptions to DEFAULT_SKIP_TYPES
+DEFAULT_KEEP_TYPES = ("image/svg+xml",)
+
+
+def _starts_with_any(value, prefixes):
+    for prefix in prefixes:
+        if value.startswith(prefix):
+            return True
+    return False
+
+
+def compression_available():
+    return zlib is not None or deflate is not None
+
+
+class _Sink:
+    """
+    Collects the output of a MicroPython DeflateIO
+    """
+    def __init__(self) -> None:
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+class Encoder:
+    """
+    An incremental gzip or deflate compressor
+    """
+    def __init__(self, encoding, level=6) -> None:
+        if zlib is not None:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS[encoding])
+            self._sink = None
+        elif deflate is not None:
+            fmt = deflate.GZIP if encoding == "gzip" else deflate.ZLIB
+            self._sink = _Sink()
+            self._compressor = deflate.DeflateIO(self._sink, fmt)
+        else:
+            raise ValueError("no compression module available")
+
+    def compress(self, data):
+        """
+        Compress data, returning all output so far so that the client
+        can decode everything given up to now; each call adds a flush
+        marker, so give it as much data at once as possible
+        """
+        if self._sink is None:
+            return self._compressor.compress(data) + self._compressor.flush(
+                zlib.Z_SYNC_FLUSH
+            )
+        # DeflateIO has no sync flush, output comes as its window fills
+        self._compressor.write(data)
+        return self._sink.take()
+
+    def finish(self, data=b""):
+        """
+        Compress any last data and end the compressed stream
+        """
+        if self._sink is None:
+            return self._compressor.compress(data) + self._compressor.flush()
+        if data:
+            self._compressor.write(data)
+        self._compressor.close()
+        return self._sink.take()
+
+
+class Compression:
+    """
+    Compresses response payloads for clients accepting gzip or deflate,
+    given to HTTPServer or to a single route as compress=
+
+    :param min_size: payloads smaller than this (in bytes) are sent as-is,
+                     streamed payloads are always compressed
+    :param encodings: supported encodings, in order of preference
+    :param level: zlib compression level, ignored on MicroPython
+    :param skip_types: content type prefixes to never compress
+    """
+    def __init__(
+        self,
+        min_size=DEFAULT_MIN_SIZE,
+        encodings=("gzip", "deflate"),
+        level=6,
+        skip_types=DEFAULT_SKIP_TYPES,
+        keep_types=DEFAULT_KEEP_TYPES,
+    ) -> None:
+        if not compression_available():
+            raise ValueError("no compression module available")
+        for encoding in encodings:
+            if encoding not in _WBITS:
+                raise ValueError(f"unsupported encoding '{encoding}'")
+        self.min_size = min_size
+        self.encodings = tuple(encodings)
+        self.level = level
+        self.skip_types = tuple(skip_types)
+        self.keep_types = tuple(keep_types)
+
+    def _compressible_type(self, content_type):
+        content_type = content_type.split(";", 1)[0].strip().lower()
+        if _starts_with_any(content_type, self.keep_types):
+            return True
+        return not _starts_with_any(content_type, self.skip_types)
+
+    def negotiate(self, accept_encoding):
+        """
+        :return: the preferred encoding the client accepts, or None
+        """
+        if not accept_encoding:
+            return None
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in self.encodings:
+            if encoding in accepted:
+                return encoding
+        if "*" in accepted:
+            return self.encodings[0]
+        return None
+
+    async def __call__(self, ctx, call_next):
+        # usable as middleware, e.g. group.middleware(Compression())
+        return self.apply(ctx.request, await call_next(ctx))
+
+    def apply(self, request, response):
+        """
+        :return: the response, compressed if worthwhile and accepted
+        """
+        payload = response.payload
+        if (
+            payload is None
+            or isinstance(payload, (RawResponse, ResponseFile))
+            or response.status_code < 200
+            or response.status_code in (204, 206, 304)
+        ):
+            return response
+        headers = response.headers
+        if "Content-Encoding" in headers or "Content-Range" in headers:
+            return response
+        if not self._compressible_type(headers.get("Content-Type", "")):
+            return response
+        is_stream = isinstance(payload, ResponseStream)
+        if not is_stream and len(payload) < self.min_size:
+            return response
+
+        # varies on Accept-Encoding, whether compressed for this client or not
+        vary = headers.get("Vary")
+        if not vary:
+            headers["Vary"] = "Accept-Encoding"
+        elif "accept-encoding" not in vary.lower():
+            headers["Vary"] = vary + ", Accept-Encoding"
+
+        encoding = self.negotiate(request.headers.get("Accept-Encoding"))
+        if encoding is None:
+            return response
+
+        encoder = Encoder(encoding, self.level)
+        if is_stream:
+            payload.compress_with(encoder)
+        else:
+            payload = encoder.finish(payload)
+            headers["Content-Length"] = str(len(payload))
+        headers["Content-Encoding"] = encoding
+        etag = headers.get("ETag")
+        if etag and not etag.startswith("W/"):
+            # no longer byte-for-byte the same representation
+            headers["ETag"] = "W/" + etag
+        return HTTPResponse(response.proto, response.status_code, headers, payload)
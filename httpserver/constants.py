@@ -7,6 +7,16 @@ except ImportError:
 
 
 NEWLINE = const(b"\r\n")
+HEAD_END = const(b"\r\n\r\n")
+DEFAULT_BLOCK_SIZE = const(4096)
+DEFAULT_MAX_HEAD_SIZE = const(8192)
+DEFAULT_MAX_PIPELINE = const(16)
+DEFAULT_MAX_BODY_SIZE = const(1048576)
+DEFAULT_STREAM_FLUSH_SIZE = const(4096)
+DEFAULT_FILE_BLOCK_SIZE = const(8192)
+DEFAULT_STREAM_FLUSH_INTERVAL = 0.05
+DEFAULT_MAX_MESSAGE_SIZE = const(65536)
+DEFAULT_PING_INTERVAL = const(20)
 HTTP_1_0 = const("HTTP/1.0")
 HTTP_1_1 = const("HTTP/1.1")
 
@@ -97,3 +107,69 @@ STATUS_LOOP_DETECTED_508 = const(508)
 STATUS_NOT_EXTENDED_510 = const(510)
 STATUS_NETWORK_AUTHENTICATION_REQUIRED_511 = const(511)
 # END STATUS CODES
+
+# {status_code: "Reason Phrase", ...}
+REASON_PHRASES = {
+    STATUS_CONTINUE_100: "Continue",
+    STATUS_SWITCHING_PROTOCOLS_101: "Switching Protocols",
+    STATUS_PROCESSING_102: "Processing",
+    STATUS_EARLY_HINTS_103: "Early Hints",
+    STATUS_OK_200: "OK",
+    STATUS_CREATED_201: "Created",
+    STATUS_ACCEPTED_202: "Accepted",
+    STATUS_NON_AUTHORITATIVE_INFORMATION_203: "Non-Authoritative Information",
+    STATUS_NO_CONTENT_204: "No Content",
+    STATUS_RESET_CONTENT_205: "Reset Content",
+    STATUS_PARTIAL_CONTENT_206: "Partial Content",
+    STATUS_MULTI_STATUS_207: "Multi-Status",
+    STATUS_ALREADY_REPORTED_208: "Already Reported",
+    STATUS_IM_USED_226: "IM Used",
+    STATUS_MULTIPLE_CHOICES_300: "Multiple Choices",
+    STATUS_MOVED_PERMANENTLY_301: "Moved Permanently",
+    STATUS_FOUND_302: "Found",
+    STATUS_SEE_OTHER_303: "See Other",
+    STATUS_NOT_MODIFIED_304: "Not Modified",
+    STATUS_USE_PROXY_305: "Use Proxy",
+    STATUS_TEMPORARY_REDIRECT_307: "Temporary Redirect",
+    STATUS_PERMANENT_REDIRECT_308: "Permanent Redirect",
+    STATUS_BAD_REQUEST_400: "Bad Request",
+    STATUS_UNAUTHORIZED_401: "Unauthorized",
+    STATUS_PAYMENT_REQUIRED_402: "Payment Required",
+    STATUS_FORBIDDEN_403: "Forbidden",
+    STATUS_NOT_FOUND_404: "Not Found",
+    STATUS_METHOD_NOT_ALLOWED_405: "Method Not Allowed",
+    STATUS_NOT_ACCEPTABLE_406: "Not Acceptable",
+    STATUS_PROXY_AUTHENTICATION_REQUIRED_407: "Proxy Authentication Required",
+    STATUS_REQUEST_TIMEOUT_408: "Request Timeout",
+    STATUS_CONFLICT_409: "Conflict",
+    STATUS_GONE_410: "Gone",
+    STATUS_LENGTH_REQUIRED_411: "Length Required",
+    STATUS_PRECONDITION_FAILED_412: "Precondition Failed",
+    STATUS_CONTENT_TOO_LARGE_413: "Content Too Large",
+    STATUS_URI_TOO_LONG_414: "URI Too Long",
+    STATUS_UNSUPPORTED_MEDIA_TYPE_415: "Unsupported Media Type",
+    STATUS_RANGE_NOT_SATISFIABLE_416: "Range Not Satisfiable",
+    STATUS_EXPECTATION_FAILED_417: "Expectation Failed",
+    STATUS_IM_A_TEAPOT_418: "I'm a teapot",
+    STATUS_MISDIRECTED_REQUEST_421: "Misdirected Request",
+    STATUS_UNPROCESSABLE_ENTITY_422: "Unprocessable Entity",
+    STATUS_LOCKED_423: "Locked",
+    STATUS_FAILED_DEPENDENCY_424: "Failed Dependency",
+    STATUS_TOO_EARLY_425: "Too Early",
+    STATUS_UPGRADE_REQUIRED_426: "Upgrade Required",
+    STATUS_PRECONDITION_REQUIRED_428: "Precondition Required",
+    STATUS_TOO_MANY_REQUESTS_429: "Too Many Requests",
+    STATUS_REQUEST_HEADER_FIELDS_TOO_LARGE_431: "Request Header Fields Too Large",
+    STATUS_UNAVAILABLE_FOR_LEGAL_REASONS_451: "Unavailable For Legal Reasons",
+    STATUS_INTERNAL_SERVER_ERROR_500: "Internal Server Error",
+    STATUS_NOT_IMPLEMENTED_501: "Not Implemented",
+    STATUS_BAD_GATEWAY_502: "Bad Gateway",
+    STATUS_SERVICE_UNAVAILABLE_503: "Service Unavailable",
+    STATUS_GATEWAY_TIMEOUT_504: "Gateway Timeout",
+    STATUS_HTTP_VERSION_NOT_SUPPORTED_505: "HTTP Version Not Supported",
+    STATUS_VARIANT_ALSO_NEGOTIATES_506: "Variant Also Negotiates",
+    STATUS_INSUFFICIENT_STORAGE_507: "Insufficient Storage",
+    STATUS_LOOP_DETECTED_508: "Loop Detected",
+    STATUS_NOT_EXTENDED_510: "Not Extended",
+    STATUS_NETWORK_AUTHENTICATION_REQUIRED_511: "Network Authentication Required",
+}
@@ -0,0 +1,193 @@
+from .constants import DEFAULT_MAX_HEAD_SIZE, HEAD_END, NEWLINE
+from .helpers import LimitExceeded, decode_field_name, perc_decode
+
+DEFAULT_MAX_FIELD_SIZE = 65536
+
+
+def parse_header_params(value):
+    """
+    Split a header value such as 'form-data; name="file"; filename="a.txt"'
+
+    :return: ("form-data", {"name": "file", "filename": "a.txt"})
+    """
+    parts = value.split(";")
+    params = {}
+    for part in parts[1:]:
+        key, sep, param = part.partition("=")
+        if not sep:
+            continue
+        param = param.strip()
+        if len(param) >= 2 and param[0] == '"' and param[-1] == '"':
+            param = param[1:-1]
+        params[key.strip().lower()] = param
+    return parts[0].strip().lower(), params
+
+
+class UrlEncodedParser:
+    """
+    Yields (name, value) pairs from an urlencoded payload stream as each
+    field arrives, without holding more than one field in memory
+    """
+    def __init__(self, body, max_field_size=DEFAULT_MAX_FIELD_SIZE) -> None:
+        self._body = body
+        self._max_field_size = max_field_size
+        self._buffer = b""
+        self._eof = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            i = self._buffer.find(b"&")
+            if i != -1:
+                field = self._buffer[:i]
+                self._buffer = self._buffer[i + 1 :]
+            elif self._eof:
+                if not self._buffer:
+                    raise StopAsyncIteration
+                field, self._buffer = self._buffer, b""
+            else:
+                if len(self._buffer) > self._max_field_size:
+                    raise LimitExceeded("form field too large")
+                data = await self._body.read_chunk()
+                if data:
+                    self._buffer += data
+                else:
+                    self._eof = True
+                continue
+            if not field:
+                continue
+            name, _, value = field.partition(b"=")
+            return decode_field_name(name), perc_decode(value, True)
+
+
+class Part:
+    """
+    A single part of a multipart payload, its data must be read
+    (or is skipped) before the parser moves to the next part
+    """
+    def __init__(self, parser, headers) -> None:
+        self._parser = parser
+        # {"content-disposition": "...", ...} names are lower case
+        self.headers = headers
+        _, params = parse_header_params(headers.get("content-disposition", ""))
+        self.name = params.get("name")
+        self.filename = params.get("filename")
+        self.content_type = headers.get("content-type", "text/plain")
+        self.done = False
+
+    async def read_chunk(self):
+        """
+        Read some of the part's data, returns b"" once all has been read
+        """
+        if self.done:
+            return b""
+        return await self._parser._read_part_data(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        data = await self.read_chunk()
+        if not data:
+            raise StopAsyncIteration
+        return data
+
+    async def read(self, max_size=DEFAULT_MAX_FIELD_SIZE):
+        chunks = []
+        size = 0
+        while True:
+            data = await self.read_chunk()
+            if not data:
+                return b"".join(chunks)
+            size += len(data)
+            if max_size is not None and size > max_size:
+                raise LimitExceeded("part too large")
+            chunks.append(data)
+
+    async def discard(self):
+        while await self.read_chunk():
+            pass
+
+
+class MultipartParser:
+    """
+    Yields each Part of a multipart/form-data payload stream,
+    part data is streamed so files need not fit in memory
+    """
+    def __init__(self, body, boundary, max_header_size=DEFAULT_MAX_HEAD_SIZE) -> None:
+        self._body = body
+        self._delimiter = NEWLINE + b"--" + boundary
+        self._max_header_size = max_header_size
+        # the opening boundary has no preceding newline, add one so it matches
+        self._buffer = NEWLINE
+        self._part = None
+        self._done = False
+
+    async def _fill(self):
+        data = await self._body.read_chunk()
+        if not data:
+            raise ValueError("multipart payload ended early")
+        self._buffer += data
+
+    async def _read_part_data(self, part):
+        delimiter = self._delimiter
+        while True:
+            i = self._buffer.find(delimiter)
+            if i != -1:
+                data = self._buffer[:i]
+                # leave the delimiter for the next part
+                self._buffer = self._buffer[i:]
+                if not data:
+                    part.done = True
+                return data
+            # keep enough back to match a delimiter split across reads
+            safe = len(self._buffer) - len(delimiter) + 1
+            if safe > 0:
+                data = self._buffer[:safe]
+                self._buffer = self._buffer[safe:]
+                return data
+            await self._fill()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._part is not None:
+            await self._part.discard()
+            self._part = None
+        if self._done:
+            raise StopAsyncIteration
+
+        # skip the preamble (first part) and find the delimiter
+        i = self._buffer.find(self._delimiter)
+        while i == -1:
+            # only the possible start of a delimiter needs keeping
+            self._buffer = self._buffer[-len(self._delimiter) :]
+            await self._fill()
+            i = self._buffer.find(self._delimiter)
+        self._buffer = self._buffer[i + len(self._delimiter) :]
+        while len(self._buffer) < 2:
+            await self._fill()
+        if self._buffer.startswith(b"--"):
+            self._done = True
+            raise StopAsyncIteration
+
+        # part headers, the buffer starts at the end of the delimiter line
+        i = self._buffer.find(HEAD_END)
+        while i == -1:
+            if len(self._buffer) > self._max_header_size:
+                raise LimitExceeded("part headers too large")
+            await self._fill()
+            i = self._buffer.find(HEAD_END)
+        lines = self._buffer[:i].decode().split("\r\n")
+        self._buffer = self._buffer[i + len(HEAD_END) :]
+        headers = {}
+        # first line is the rest of the delimiter line, e.g. transport padding
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        self._part = Part(self, headers)
+        return self._part
@@ -1,48 +1,611 @@
 from collections import OrderedDict
+from time import gmtime
 
+try:
+    from time import monotonic
+except ImportError:
+    # MicroPython
+    from time import ticks_diff, ticks_ms
 
-async def readuntil(reader, separator):
-    buffer = b""
-    while (char := await reader.read(1)):
-        buffer += char
-        if buffer.endswith(separator):
-            break
-    return buffer
+    _last_ticks = ticks_ms()
+    _elapsed_ms = 0
+
+    def monotonic():
+        # ticks_ms() wraps around every few days, which would leave
+        # deadlines unreachable, so add up the ticks since the last call
+        # instead; correct while called at least every few days
+        global _last_ticks, _elapsed_ms
+        now = ticks_ms()
+        _elapsed_ms += ticks_diff(now, _last_ticks)
+        _last_ticks = now
+        return _elapsed_ms / 1000
+
+from .constants import DEFAULT_BLOCK_SIZE, HEAD_END, NEWLINE
+
+
+class LimitExceeded(ValueError):
+    """
+    Raised when a client sends more data than a configured limit allows
+    """
+
+
+class LRUCache:
+    """
+    A least recently used mapping, bounded by entry count
+    and optionally by the total of each entry's given size
+    """
+    def __init__(self, max_entries=128, max_size=None) -> None:
+        # {key: (value, size), ...} oldest first
+        self._data = OrderedDict()
+        self._max_entries = max_entries
+        self._max_size = max_size
+        self.size = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return default
+        # re-insert as most recently used,
+        # MicroPython's OrderedDict has no move_to_end()
+        self._data[key] = entry
+        return entry[0]
+
+    def set(self, key, value, size=0):
+        self.pop(key)
+        if self._max_size is not None and size > self._max_size:
+            return
+        self._data[key] = (value, size)
+        self.size += size
+        while len(self._data) > self._max_entries or (
+            self._max_size is not None and self.size > self._max_size
+        ):
+            self.pop(next(iter(self._data)))
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return default
+        self.size -= entry[1]
+        return entry[0]
+
+    def clear(self):
+        self._data.clear()
+        self.size = 0
+
+
+class BufferedReader:
+    """
+    Wraps a stream reader with a per-connection buffer,
+    reading in large blocks and keeping leftover bytes
+    for the payload or the next pipelined request
+    """
+    def __init__(self, reader, block_size=DEFAULT_BLOCK_SIZE) -> None:
+        self._reader = reader
+        self._block_size = block_size
+        # bytes rather than bytearray, as MicroPython's bytearray has no find()
+        self._buffer = b""
+        # offset of the first unconsumed byte in the buffer
+        self._start = 0
+        self.at_eof = False
+
+    def buffered(self):
+        return len(self._buffer) - self._start
+
+    def has_head(self):
+        """
+        Whether a whole message head is buffered,
+        so reading it won't wait on the socket
+        """
+        start = self._start
+        while self._buffer.startswith(NEWLINE, start):
+            start += len(NEWLINE)
+        return self._buffer.find(HEAD_END, start) != -1
+
+    async def _fill(self):
+        if self.at_eof:
+            return False
+        data = await self._reader.read(self._block_size)
+        if not data:
+            self.at_eof = True
+            return False
+        # drop consumed bytes while growing the buffer, one copy per block
+        self._buffer = self._buffer[self._start:] + data
+        self._start = 0
+        return True
+
+    def _consume(self, end):
+        data = self._buffer[self._start:end]
+        self._start = end
+        if self._start == len(self._buffer):
+            self._buffer = b""
+            self._start = 0
+        return data
+
+    async def readuntil(self, separator, limit):
+        """
+        Read up to and including separator, raising LimitExceeded
+        if more than limit bytes are buffered without finding it.
+        On EOF whatever remains is returned (may be empty).
+        """
+        # relative offset already searched, avoids rescanning the buffer
+        searched = 0
+        while True:
+            i = self._buffer.find(separator, self._start + searched)
+            if i != -1:
+                if i + len(separator) - self._start > limit:
+                    raise LimitExceeded("limit exceeded before separator found")
+                return self._consume(i + len(separator))
+            if self.buffered() > limit:
+                raise LimitExceeded("limit exceeded before separator found")
+            searched = max(0, self.buffered() - len(separator) + 1)
+            if not await self._fill():
+                return self._consume(len(self._buffer))
+
+    async def read_head(self, limit):
+        """
+        Read a full message head (start line and headers), skipping
+        any empty lines sent before it, returns b"" on connection close
+        """
+        while True:
+            # skip any leading empty lines
+            while self._buffer.startswith(NEWLINE, self._start):
+                self._start += len(NEWLINE)
+            if self.buffered() >= len(NEWLINE):
+                break
+            if not await self._fill():
+                return self._consume(len(self._buffer))
+        return await self.readuntil(HEAD_END, limit)
+
+    async def read(self, n):
+        """
+        Read up to n bytes, returns b"" on EOF
+        """
+        if self.buffered() == 0 and not await self._fill():
+            return b""
+        return self._consume(min(self._start + n, len(self._buffer)))
+
+    async def readexactly(self, n):
+        while self.buffered() < n:
+            if not await self._fill():
+                raise EOFError("connection closed before payload was read")
+        return self._consume(self._start + n)
+
+
+def write_parts(writer, parts):
+    """
+    Queue several byte strings for writing without joining them
+    """
+    if hasattr(writer, "writelines"):
+        writer.writelines(parts)
+    else:
+        # MicroPython streams have no writelines
+        for part in parts:
+            writer.write(part)
+
+
+async def drain_if_needed(writer):
+    """
+    Drain only once the transport's write buffer passes its high-water mark
+    """
+    transport = getattr(writer, "transport", None)
+    if transport is None:
+        # MicroPython streams only send on drain
+        await writer.drain()
+    elif (
+        transport.is_closing()
+        or transport.get_write_buffer_size() > transport.get_write_buffer_limits()[1]
+    ):
+        # drain raises if the connection was lost, rather than
+        # writes being silently dropped
+        await writer.drain()
+
+
+_WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_MONTHS = (
+    "Jan", "Feb", "Mar", "Apr", "May", "Jun",
+    "Jul", "Aug", "Sep", "Oct", "Nov", "Dec",
+)
+
+
+def format_http_date(timestamp):
+    """
+    Format a timestamp as an IMF-fixdate, e.g. "Sun, 06 Nov 1994 08:49:37 GMT"
+    """
+    t = gmtime(int(timestamp))
+    return "{}, {:02d} {} {:04d} {:02d}:{:02d}:{:02d} GMT".format(
+        _WEEKDAYS[t[6]], t[2], _MONTHS[t[1] - 1], t[0], t[3], t[4], t[5]
+    )
+
+
+def accepted_encodings(header):
+    """
+    Content codings from an Accept-Encoding header, leaving out any refused with q=0
+
+    :return: {"gzip", "br", ...} in lower case
+    """
+    encodings = set()
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        encodings.add(coding.strip().lower())
+    return encodings
+
+
+def parse_range(value, size):
+    """
+    Parse a single "bytes=" Range header value against a resource size
+
+    :raises ValueError: when malformed or has multiple ranges
+    :return: (offset, count) or None if the range is not satisfiable
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise ValueError("unsupported range")
+    start, sep, end = spec.strip().partition("-")
+    if not sep:
+        raise ValueError("malformed range")
+    if not start:
+        # suffix range, the last n bytes
+        suffix = int(end)
+        if suffix <= 0 or size == 0:
+            return None
+        start = max(size - suffix, 0)
+        return start, size - start
+    start = int(start)
+    if end:
+        end = int(end)
+        if end < start:
+            raise ValueError("malformed range")
+    else:
+        end = size - 1
+    if start >= size:
+        return None
+    return start, min(end, size - 1) - start + 1
+
+
+def decode_latin1(data):
+    """
+    Decode bytes as ISO-8859-1, header values may have any byte (obs-text)
+    """
+    try:
+        text = data.decode("latin-1")
+    except (LookupError, UnicodeError):
+        text = None
+    # MicroPython decodes as UTF-8 whatever the codec,
+    # which only gives the same text for ASCII
+    if text is None or len(text) != len(data):
+        text = "".join(chr(c) for c in data)
+    return text
+
+
+# characters allowed in a token, besides letters and digits
+_TOKEN_SYMBOLS = "!#$%&'*+-.^_`|~"
+
+
+def is_token_list(value):
+    """
+    Whether a header value is a comma separated list of tokens, e.g. Connection
+    """
+    for part in value.split(","):
+        for char in part.strip():
+            if ord(char) > 127:
+                return False
+            if not (char.isalpha() or char.isdigit() or char in _TOKEN_SYMBOLS):
+                return False
+    return True
+
+
+class Headers:
+    """
+    Request headers kept as the raw message head, with an index of where
+    each value is built on first lookup and values decoded once used.
+    Names are case-insensitive, repeated headers are joined with ", ".
+    """
+    def __init__(self, head=b"", start=0) -> None:
+        self._head = head
+        # offset the header lines start at, after the request line
+        self._start = start
+        # {b"name": (start, end) | [(start, end), ...] | "value", ...}
+        self._index = None
+
+    def _build(self):
+        index = {}
+        head = self._head
+        pos = self._start
+        end = len(head)
+        while pos < end:
+            line_end = head.find(NEWLINE, pos)
+            if line_end == -1:
+                line_end = end
+            if line_end != pos:
+                sep_i = head.find(b":", pos, line_end)
+                if sep_i == -1:
+                    raise ValueError("malformed header line")
+                name = head[pos:sep_i].lower()
+                span = (sep_i + 1, line_end)
+                existing = index.get(name)
+                if existing is None:
+                    index[name] = span
+                elif isinstance(existing, list):
+                    existing.append(span)
+                else:
+                    index[name] = [existing, span]
+            pos = line_end + 2
+        self._index = index
+        return index
+
+    def _key(self, name):
+        return name.lower().encode()
+
+    def get(self, name, default=None):
+        index = self._index
+        if index is None:
+            index = self._build()
+        key = self._key(name)
+        value = index.get(key)
+        if value is None:
+            return default
+        if isinstance(value, str):
+            return value
+        head = self._head
+        if isinstance(value, list):
+            value = ", ".join(decode_latin1(head[s:e]).strip() for s, e in value)
+        else:
+            value = decode_latin1(head[value[0] : value[1]]).strip()
+        index[key] = value
+        return value
+
+    def __getitem__(self, name):
+        value = self.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name, value):
+        if self._index is None:
+            self._build()
+        self._index[self._key(name)] = value
+
+    def __contains__(self, name):
+        if self._index is None:
+            self._build()
+        return self._key(name) in self._index
+
+    def __len__(self):
+        if self._index is None:
+            self._build()
+        return len(self._index)
+
+    def __iter__(self):
+        if self._index is None:
+            self._build()
+        return (decode_latin1(name) for name in self._index)
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        """
+        (name, value) for each header, names in lower case
+        """
+        return [(name, self.get(name)) for name in self]
+
+    def __eq__(self, other):
+        return dict(self.items()) == {
+            name.lower(): value for name, value in dict(other).items()
+        }
+
+    def __repr__(self) -> str:
+        return f"Headers({self.items()})"
+
+
+def parse_head(head):
+    """
+    Parse a raw message head, only the request line is decoded here
+
+    :return: (method, path, proto, Headers)
+    """
+    line_end = head.find(NEWLINE)
+    if line_end == -1:
+        line_end = len(head)
+    method, path, proto_ver = head[:line_end].decode().split(" ", 2)
+    return method, path, proto_ver, Headers(head, line_end + 2)
+
+
+def header_has_token(value, token):
+    """
+    Whether a comma separated header value, such as Connection, has token
+    """
+    for part in value.split(","):
+        if part.strip().lower() == token:
+            return True
+    return False
+
+
+# value of each hex digit by byte, 255 for anything else
+_HEX_VALUES = bytearray(b"\xff" * 256)
+for _i, _c in enumerate(b"0123456789abcdef"):
+    _HEX_VALUES[_c] = _i
+for _i, _c in enumerate(b"ABCDEF"):
+    _HEX_VALUES[_c] = 10 + _i
+del _i, _c
+# single byte bytes for each value, decoded escapes share these
+_BYTE_VALUES = [bytes((i,)) for i in range(256)]
+
+
+def parse_content_length(value):
+    """
+    Parse a Content-Length value, unlike int() refusing signs,
+    underscores and whitespace that other servers may read differently
+    """
+    if not value or not value.isdigit():
+        raise ValueError("invalid Content-Length")
+    return int(value)
+
+
+def parse_chunk_size(line):
+    """
+    Parse the hex size from a chunk-size line, ignoring any extensions
+    """
+    size, sep, _ = line.partition(b";")
+    if sep:
+        # whitespace is only allowed before an extension
+        size = size.rstrip(b" \t")
+    if not size:
+        raise ValueError("malformed chunk size")
+    for c in size:
+        if _HEX_VALUES[c] == 255:
+            raise ValueError("malformed chunk size")
+    return int(size, 16)
 
 
 def perc_decode(v, from_form=False):
-    decoded = b""
-    i = 0
-    while i < len(v):
-        if v[i] == "%":
-            encoded = v[i+1:i+3]
-            decoded += bytes.fromhex(encoded)
-            i += 2
-        elif from_form and v[i] == "+":
-            decoded += b" "
+    """
+    Decode a percent-encoded str, bytes or memoryview into bytes,
+    malformed escapes are kept as they are
+
+    :param from_form: also decode "+" as a space
+    """
+    if isinstance(v, str):
+        v = v.encode()
+    elif not isinstance(v, bytes):
+        v = bytes(v)
+    if from_form and v.find(b"+") != -1:
+        v = v.replace(b"+", b" ")
+    if v.find(b"%") == -1:
+        return v
+
+    hex_values = _HEX_VALUES
+    byte_values = _BYTE_VALUES
+    parts = v.split(b"%")
+    decoded = [parts[0]]
+    append = decoded.append
+    for part in parts[1:]:
+        if len(part) > 1:
+            high = hex_values[part[0]]
+            low = hex_values[part[1]]
+            if high | low < 16:
+                append(byte_values[high << 4 | low])
+                append(part[2:])
+                continue
+        append(b"%")
+        append(part)
+    return b"".join(decoded)
+
+
+class MultiDict:
+    """
+    An ordered mapping that keeps every value given for a key,
+    indexing returns the last one like a dict would
+    """
+    def __init__(self, items=None) -> None:
+        # {"name": [value, ...], ...}
+        self._values = OrderedDict()
+        if items is not None:
+            for key, value in items:
+                self.add(key, value)
+
+    def add(self, key, value):
+        values = self._values.get(key)
+        if values is None:
+            self._values[key] = [value]
         else:
-            decoded += v[i].encode()
-        i += 1
-    return decoded
+            values.append(value)
+
+    def getall(self, key):
+        """
+        Every value for key, in the order given
+        """
+        return list(self._values.get(key, ()))
+
+    def get(self, key, default=None):
+        values = self._values.get(key)
+        if values is None:
+            return default
+        return values[-1]
+
+    def __getitem__(self, key):
+        return self._values[key][-1]
+
+    def __setitem__(self, key, value):
+        self._values[key] = [value]
+
+    def __delitem__(self, key):
+        del self._values[key]
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def keys(self):
+        return self._values.keys()
+
+    def values(self):
+        return [values[-1] for values in self._values.values()]
+
+    def items(self):
+        return [(key, values[-1]) for key, values in self._values.items()]
+
+    def multi_items(self):
+        """
+        Every (key, value) pair, in the order given
+        """
+        return [(key, value) for key, values in self._values.items() for value in values]
+
+    def __eq__(self, other):
+        if isinstance(other, MultiDict):
+            return self.multi_items() == other.multi_items()
+        return dict(self.items()) == other
+
+    def __repr__(self) -> str:
+        return f"MultiDict({self.multi_items()})"
+
+
+def decode_field_name(name):
+    """
+    Percent-decode an urlencoded field name from bytes to str,
+    kept undecoded where it doesn't decode to valid UTF-8
+    """
+    try:
+        return perc_decode(name, True).decode()
+    except UnicodeError:
+        return decode_latin1(name)
 
 
 def process_query_string(query_string):
-    query = OrderedDict()
-    query_string = query_string.split("&")
-    if len(query_string) == 1 and query_string[0] == "":
-        return query
-    query_string = map(lambda v:v.split("="), query_string)
-    for key, value in query_string:
-        query[key] = perc_decode(value, True)
+    """
+    Parse an urlencoded str or bytes, keys without a value are given b""
+
+    :return: MultiDict of {"name": b"value", ...}
+    """
+    if isinstance(query_string, str):
+        query_string = query_string.encode()
+    elif not isinstance(query_string, bytes):
+        query_string = bytes(query_string)
+    query = MultiDict()
+    for field in query_string.split(b"&"):
+        if not field:
+            continue
+        key, _, value = field.partition(b"=")
+        query.add(decode_field_name(key), perc_decode(value, True))
     return query
 
 
 def seperate_path_and_query(path):
-    path_split = path.split("?")
-    query = None
-    if len(path_split) > 1:
-        path, query_string = path_split
-        query = process_query_string(query_string)
-    else:
-        query = OrderedDict()
-    return path, query
+    """
+    :return: ("/path", MultiDict of the query)
+    """
+    path, _, query_string = path.partition("?")
+    return path, process_query_string(query_string)
@@ -0,0 +1,124 @@
+import json
+
+
+class JSONCodec:
+    """
+    Encodes objects to JSON bytes and decodes JSON bytes,
+    given to HTTPServer as json_codec
+    """
+    def __init__(self, dumps, loads, name="custom") -> None:
+        # obj -> bytes
+        self.dumps = dumps
+        # bytes -> obj
+        self.loads = loads
+        self.name = name
+
+    def __repr__(self) -> str:
+        return f"JSONCodec({self.name})"
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj).encode()
+
+
+# json.loads takes bytes on both CPython and MicroPython
+STDLIB_CODEC = JSONCodec(_stdlib_dumps, json.loads, "json")
+
+_default_codec = None
+
+
+def detect_codec():
+    """
+    :return: a codec using orjson or ujson when installed, otherwise json
+    """
+    try:
+        import orjson
+    except ImportError:
+        pass
+    else:
+        # stdlib json allows non-str dict keys, e.g. ints
+        option = orjson.OPT_NON_STR_KEYS
+
+        def orjson_dumps(obj):
+            return orjson.dumps(obj, option=option)
+
+        return JSONCodec(orjson_dumps, orjson.loads, "orjson")
+    try:
+        import ujson
+    except ImportError:
+        pass
+    else:
+        def ujson_dumps(obj):
+            return ujson.dumps(obj).encode()
+
+        return JSONCodec(ujson_dumps, ujson.loads, "ujson")
+    return STDLIB_CODEC
+
+
+def default_codec():
+    """
+    The detected codec, used where no other is given
+    """
+    global _default_codec
+    if _default_codec is None:
+        _default_codec = detect_codec()
+    return _default_codec
+
+
+class _JSONArrayIterator:
+    def __init__(self, iterator, dumps) -> None:
+        self._iterator = iterator
+        self._dumps = dumps
+        self._started = False
+        self._done = False
+
+    def _encode(self, item):
+        data = self._dumps(item)
+        if self._started:
+            return b"," + data
+        self._started = True
+        return b"[" + data
+
+    def _end(self):
+        self._done = True
+        return b"]" if self._started else b"[]"
+
+    def close(self):
+        close = getattr(self._iterator, "close", None)
+        if close is not None:
+            close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        try:
+            item = next(self._iterator)
+        except StopIteration:
+            return self._end()
+        return self._encode(item)
+
+
+class _JSONArrayAsyncIterator(_JSONArrayIterator):
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._done:
+            raise StopAsyncIteration
+        try:
+            item = await self._iterator.__anext__()
+        except StopAsyncIteration:
+            return self._end()
+        return self._encode(item)
+
+
+def json_array_stream(iterable, dumps):
+    """
+    Encode a normal or async iterable as a JSON array, one item at a time
+    """
+    if hasattr(iterable, "__aiter__"):
+        return _JSONArrayAsyncIterator(iterable.__aiter__(), dumps)
+    return _JSONArrayIterator(iter(iterable), dumps)
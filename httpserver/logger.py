@@ -0,0 +1,142 @@
+import asyncio
+import sys
+
+try:
+    from micropython import const
+except ImportError:
+
+    def const(v):
+        return v
+
+
+LEVEL_DEBUG = const(10)
+LEVEL_INFO = const(20)
+LEVEL_WARNING = const(30)
+LEVEL_ERROR = const(40)
+# disables all but access logging
+LEVEL_NONE = const(100)
+
+LEVEL_NAMES = {
+    LEVEL_DEBUG: "DEBUG",
+    LEVEL_INFO: "INFO",
+    LEVEL_WARNING: "WARNING",
+    LEVEL_ERROR: "ERROR",
+}
+
+
+class PrintSink:
+    """
+    Writes each line straight away
+    """
+    def write(self, line):
+        print(line)
+
+    def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class BufferedSink:
+    """
+    Keeps lines in memory, writing them in batches from a background task
+    every flush_interval seconds or once max_lines are buffered
+    """
+    def __init__(self, stream=None, max_lines=256, flush_interval=1.0) -> None:
+        self._stream = stream if stream is not None else sys.stdout
+        self._max_lines = max_lines
+        self._flush_interval = flush_interval
+        self._lines = []
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def write(self, line):
+        self._lines.append(line)
+        if len(self._lines) >= self._max_lines:
+            if self._task is None or len(self._lines) >= self._max_lines * 4:
+                # no task running or it is falling behind, keep memory bounded
+                self.flush()
+            else:
+                self._wake.set()
+
+    def flush(self):
+        if self._lines:
+            lines = self._lines
+            self._lines = []
+            lines.append("")
+            self._stream.write("\n".join(lines))
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.flush()
+
+
+class Logger:
+    """
+    Leveled logger, messages below the level are dropped before
+    any formatting, with optional access log lines for each response
+    """
+    def __init__(self, level=LEVEL_INFO, sink=None, access_log=False) -> None:
+        self.level = level
+        self.access_log = access_log
+        self._sink = sink if sink is not None else PrintSink()
+
+    def log(self, level, msg, *args):
+        if level >= self.level:
+            if args:
+                msg = msg % args
+            self._sink.write(LEVEL_NAMES.get(level, "") + " " + msg)
+
+    def debug(self, msg, *args):
+        self.log(LEVEL_DEBUG, msg, *args)
+
+    def info(self, msg, *args):
+        self.log(LEVEL_INFO, msg, *args)
+
+    def warning(self, msg, *args):
+        self.log(LEVEL_WARNING, msg, *args)
+
+    def error(self, msg, *args):
+        self.log(LEVEL_ERROR, msg, *args)
+
+    def access(self, request, response, timestamp):
+        """
+        Write an access line, e.g.: 127.0.0.1 "GET /" 200 12 0.4ms
+        """
+        size = response.headers.get("Content-Length", "-")
+        if request is None:
+            self._sink.write(f'- "-" {response.status_code} {size} -')
+            return
+        duration = "-"
+        if request.received_at:
+            duration = "%.1fms" % ((timestamp - request.received_at) * 1000)
+        self._sink.write(
+            f'{request.remote_addr or "-"} "{request.method} {request.path}" '
+            f"{response.status_code} {size} {duration}"
+        )
+
+    def start(self):
+        self._sink.start()
+
+    async def close(self):
+        await self._sink.close()
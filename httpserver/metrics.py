@@ -0,0 +1,153 @@
+from .constants import STATUS_OK_200
+
+# upper bounds in seconds, a final +Inf bucket is implied
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+class Histogram:
+    """
+    Fixed bucket histogram, counts are per bucket (not cumulative)
+    """
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+class Metrics:
+    """
+    Collects request counters and latency histograms through the server's
+    instrumentation hooks, servers without it installed pay nothing
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS) -> None:
+        self._buckets = buckets
+        self.active_connections = 0
+        self.connections_total = 0
+        # {(route, method, status_code): count, ...}
+        self.requests_total = {}
+        # {route: Histogram, ...} for each phase of handling a request
+        self.parse_seconds = {}
+        self.handler_seconds = {}
+        self.write_seconds = {}
+        self.duration_seconds = {}
+
+    def install(self, server, path="/metrics"):
+        """
+        Register hooks on a server, and a route exposing the
+        metrics in Prometheus text format unless path is None
+        """
+        server.on_conn_open(self._conn_open)
+        server.on_conn_close(self._conn_close)
+        server.on_request_start(self._request_start)
+        server.on_handler_done(self._handler_done)
+        server.on_response_written(self._response_written)
+        if path is not None:
+            server.route(path)(self.handle_metrics)
+
+    def _observe(self, histograms, route, value):
+        histogram = histograms.get(route)
+        if histogram is None:
+            histogram = histograms[route] = Histogram(self._buckets)
+        histogram.observe(value)
+
+    def _conn_open(self, peer_name, timestamp):
+        self.active_connections += 1
+        self.connections_total += 1
+
+    def _conn_close(self, peer_name, timestamp):
+        self.active_connections -= 1
+
+    def _request_start(self, request, received_at, parsed_at):
+        self._observe(self.parse_seconds, request.route, parsed_at - received_at)
+
+    def _handler_done(self, request, response, timestamp):
+        # both are set on the request by the server before its hooks run
+        self._observe(self.handler_seconds, request.route, timestamp - request.parsed_at)
+
+    def _response_written(self, request, response, timestamp):
+        if request is None:
+            key = (None, None, response.status_code)
+        else:
+            key = (request.route, request.method, response.status_code)
+            if request.handler_done_at:
+                self._observe(
+                    self.write_seconds, request.route, timestamp - request.handler_done_at
+                )
+                self._observe(
+                    self.duration_seconds, request.route, timestamp - request.received_at
+                )
+        self.requests_total[key] = self.requests_total.get(key, 0) + 1
+
+    def _render_histograms(self, lines, name, help_text, histograms):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for route, histogram in histograms.items():
+            route = route or ""
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(route=route, le=bound)} {cumulative}")
+            lines.append(
+                f"{name}_bucket{_labels(route=route, le='+Inf')} {histogram.count}"
+            )
+            lines.append(f"{name}_sum{_labels(route=route)} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(route=route)} {histogram.count}")
+
+    def render(self):
+        """
+        The metrics in Prometheus text exposition format
+        """
+        lines = [
+            "# HELP http_active_connections Currently open connections",
+            "# TYPE http_active_connections gauge",
+            f"http_active_connections {self.active_connections}",
+            "# HELP http_connections_total Accepted connections",
+            "# TYPE http_connections_total counter",
+            f"http_connections_total {self.connections_total}",
+            "# HELP http_requests_total Responses written",
+            "# TYPE http_requests_total counter",
+        ]
+        for (route, method, status_code), count in self.requests_total.items():
+            labels = _labels(route=route or "", method=method or "", status=status_code)
+            lines.append(f"http_requests_total{labels} {count}")
+        self._render_histograms(
+            lines, "http_request_parse_seconds",
+            "Time from message head arriving to being routed", self.parse_seconds,
+        )
+        self._render_histograms(
+            lines, "http_request_handler_seconds",
+            "Time from being routed to the response being made, including "
+            "reading the payload", self.handler_seconds,
+        )
+        self._render_histograms(
+            lines, "http_response_write_seconds",
+            "Time spent writing the response", self.write_seconds,
+        )
+        self._render_histograms(
+            lines, "http_request_duration_seconds",
+            "Time from message head arriving to response written", self.duration_seconds,
+        )
+        lines.append("")
+        return "\n".join(lines)
+
+    def handle_metrics(self, ctx):
+        return ctx.response.content(
+            STATUS_OK_200, "text/plain; version=0.0.4", self.render().encode()
+        )
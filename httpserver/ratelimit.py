@@ -0,0 +1,96 @@
+from .constants import STATUS_TOO_MANY_REQUESTS_429
+from .helpers import LRUCache, monotonic
+
+DEFAULT_MAX_KEYS = 256
+
+
+def _by_ip(request):
+    return request.remote_addr
+
+
+def _by_route(request):
+    # requests matching no route share one bucket
+    return request.route
+
+
+def _by_ip_and_route(request):
+    return (request.remote_addr, request.route)
+
+
+KEY_FUNCS = {
+    "ip": _by_ip,
+    "route": _by_route,
+    "ip_route": _by_ip_and_route,
+}
+
+
+class RateLimit:
+    """
+    Token bucket rate limiting, usable as middleware on the server or a
+    RouteGroup, or given to a single route as rate_limit=. Requests over
+    the limit are answered with 429 and a Retry-After header.
+
+    Buckets are kept for the max_keys most recently seen keys, checking
+    a request is a dict lookup and refilling its bucket by the time
+    passed since, so there's nothing to run in the background.
+
+    :param rate: tokens added per second, each request takes one
+    :param burst: bucket size, requests allowed at once after being idle,
+                  defaults to rate rounded up
+    :param key: "ip", "route", "ip_route", or fn(request) returning
+                a hashable key, None to not limit that request
+    :param max_keys: buckets kept, the least recently used is evicted
+    """
+    def __init__(self, rate, burst=None, key="ip", max_keys=DEFAULT_MAX_KEYS) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        if burst is None:
+            burst = max(1, -(-rate // 1))
+        if burst < 1:
+            raise ValueError("burst must be at least 1")
+        if not callable(key):
+            if key not in KEY_FUNCS:
+                raise ValueError(f"unknown rate limit key '{key}'")
+            key = KEY_FUNCS[key]
+        self.rate = rate
+        self.burst = burst
+        self._key_func = key
+        # {key: [tokens, updated_at], ...}
+        self._buckets = LRUCache(max_keys)
+        self.limited = 0
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def acquire(self, key, now=None):
+        """
+        Take a token from the key's bucket
+
+        :return: 0 if allowed, otherwise seconds until a token is available
+        """
+        if now is None:
+            now = monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._buckets.set(key, [self.burst - 1, now])
+            return 0
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return (1 - tokens) / self.rate
+        bucket[0] = tokens - 1
+        return 0
+
+    async def __call__(self, ctx, call_next):
+        key = self._key_func(ctx.request)
+        if key is not None:
+            wait = self.acquire(key)
+            if wait:
+                self.limited += 1
+                # whole seconds, rounded up
+                ctx.response.set_header("Retry-After", str(int(-(-wait // 1))))
+                return ctx.response.html(
+                    STATUS_TOO_MANY_REQUESTS_429, "<h1>Too Many Requests</h1>"
+                )
+        return await call_next(ctx)
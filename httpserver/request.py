@@ -1,33 +1,312 @@
-import json
+import asyncio
 from collections import namedtuple
 
-from .helpers import seperate_path_and_query, process_query_string
+from .constants import DEFAULT_BLOCK_SIZE, NEWLINE
+from .helpers import LimitExceeded, parse_chunk_size, process_query_string
+from .jsoncodec import default_codec
 
 
 HTTPRequest = namedtuple("HTTPRequest", ("proto", "method", "path", "headers", "payload"))
 
+CONTINUE_100 = b"HTTP/1.1 100 Continue\r\n\r\n"
+
+
+class RequestBody:
+    """
+    The request payload as an async stream of chunks,
+    framed by Content-Length or chunked transfer encoding
+    """
+    def __init__(
+        self,
+        reader,
+        length=0,
+        chunked=False,
+        timeout=None,
+        continue_writer=None,
+    ) -> None:
+        self._reader = reader
+        # bytes left when framed by Content-Length
+        self.length = None if chunked else length
+        self._remaining = length
+        self._chunked = chunked
+        # bytes left in the current chunk, None before the first
+        self._chunk_remaining = None
+        self._timeout = timeout
+        # writer to send "100 Continue" on, if the client expects it
+        self._continue_writer = continue_writer
+        self.max_size = None
+        self.received = 0
+        self.done = not chunked and length == 0
+
+    def is_buffered(self):
+        """
+        Whether the rest of the payload can be read without
+        waiting on the socket or sending "100 Continue"
+        """
+        if self.done:
+            return True
+        if self._chunked or self._continue_writer is not None:
+            return False
+        return self._reader.buffered() >= self._remaining
+
+    async def _read(self, coro):
+        if self._timeout is None:
+            return await coro
+        return await asyncio.wait_for(coro, self._timeout)
+
+    async def _next_chunk_size(self):
+        if self._chunk_remaining is not None:
+            # end of the previous chunk's data
+            if await self._read(self._reader.readexactly(2)) != NEWLINE:
+                raise ValueError("malformed chunk")
+        line = await self._read(self._reader.readuntil(NEWLINE, 1024))
+        if not line.endswith(NEWLINE):
+            raise EOFError("connection closed before payload was read")
+        size = parse_chunk_size(line[: -len(NEWLINE)])
+        if size == 0:
+            # skip any trailers
+            while line != NEWLINE:
+                line = await self._read(self._reader.readuntil(NEWLINE, 8192))
+                if not line.endswith(NEWLINE):
+                    raise EOFError("connection closed before payload was read")
+        return size
+
+    async def read_chunk(self, n=DEFAULT_BLOCK_SIZE):
+        """
+        Read up to n bytes of the payload, returns b"" once all is read
+
+        :raises LimitExceeded: when the payload is larger than max_size
+        """
+        if self.done:
+            return b""
+        if self._continue_writer is not None:
+            self._continue_writer.write(CONTINUE_100)
+            await self._continue_writer.drain()
+            self._continue_writer = None
+
+        if self._chunked:
+            if not self._chunk_remaining:
+                self._chunk_remaining = await self._next_chunk_size()
+                if self._chunk_remaining == 0:
+                    self.done = True
+                    return b""
+            n = min(n, self._chunk_remaining)
+        else:
+            n = min(n, self._remaining)
+
+        data = await self._read(self._reader.read(n))
+        if not data:
+            raise EOFError("connection closed before payload was read")
+        self.received += len(data)
+        if self.max_size is not None and self.received > self.max_size:
+            raise LimitExceeded("payload too large")
+
+        if self._chunked:
+            self._chunk_remaining -= len(data)
+        else:
+            self._remaining -= len(data)
+            if self._remaining == 0:
+                self.done = True
+        return data
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        data = await self.read_chunk()
+        if not data:
+            raise StopAsyncIteration
+        return data
+
+    async def read(self):
+        """
+        Read the whole remaining payload into memory
+        """
+        chunks = []
+        while True:
+            data = await self.read_chunk()
+            if not data:
+                return b"".join(chunks)
+            chunks.append(data)
+
+    async def discard(self):
+        """
+        Read and drop any unread payload, so the next request can be read
+        """
+        while await self.read_chunk():
+            pass
+
+
+class BytesBody:
+    """
+    An already read payload, with the same interface as RequestBody
+    """
+    def __init__(self, payload) -> None:
+        self._payload = payload or b""
+        self.done = not self._payload
+
+    async def read_chunk(self, n=DEFAULT_BLOCK_SIZE):
+        data = self._payload[:n]
+        self._payload = self._payload[n:]
+        self.done = not self._payload
+        return data
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        data = await self.read_chunk()
+        if not data:
+            raise StopAsyncIteration
+        return data
+
+    async def read(self):
+        data, self._payload = self._payload, b""
+        self.done = True
+        return data
+
+    async def discard(self):
+        await self.read()
+
+
+# marks a lazily computed attribute not yet worked out
+_UNSET = object()
+
 
 class Request:
+    __slots__ = (
+        "proto",
+        "method",
+        "target",
+        "_path",
+        "_query_string",
+        "_query",
+        "_form",
+        "_json",
+        "params",
+        "route",
+        "remote_addr",
+        "received_at",
+        "parsed_at",
+        "handler_done_at",
+        "json_codec",
+        "headers",
+        "body",
+        "payload",
+    )
+
     def __init__(self, http_request):
+        self.proto = http_request.proto
         # "GET"
         self.method = http_request.method.upper()
-        # "/" {"name": "value", ...}
-        self.path, self.query = seperate_path_and_query(http_request.path)
-        # {"name": "value", ...}
+        # "/path?query" as requested, split once path or query is used
+        self.target = http_request.path
+        self._path = None
+        self._query_string = None
+        self._query = None
+        self._form = _UNSET
+        self._json = _UNSET
+        # {"name": value, ...} set from path parameters once routed
+        self.params = {}
+        # matched route pattern e.g. "/users/<int:id>", set once routed
+        self.route = None
+        # client address and monotonic time the message arrived (0 if not measured)
+        self.remote_addr = None
+        self.received_at = 0
+        # monotonic times the handler started and finished,
+        # measured only while hooks are registered for them
+        self.parsed_at = 0
+        self.handler_done_at = 0
+        # JSONCodec decoding json(), set by the server
+        self.json_codec = None
+        # Headers, case-insensitive and decoded as used
         self.headers = http_request.headers
-        self.payload = http_request.payload
+        # unread payload stream, for routes registered with stream_body=True
+        self.body = http_request.payload
+        # read payload bytes, for other routes
+        self.payload = None
+
+    def _split_target(self):
+        self._path, _, self._query_string = self.target.partition("?")
+
+    @property
+    def path(self):
+        """
+        "/path" without the query string
+        """
+        if self._path is None:
+            self._split_target()
+        return self._path
+
+    @property
+    def query_string(self):
+        if self._query_string is None:
+            self._split_target()
+        return self._query_string
+
+    @property
+    def query(self):
+        """
+        MultiDict of {"name": b"value", ...} from the query string
+        """
+        if self._query is None:
+            self._query = process_query_string(self.query_string)
+        return self._query
+
+    def _media_type(self):
+        # "application/json; charset=utf-8" -> "application/json"
+        return self.headers.get("Content-Type", "").split(";", 1)[0].strip().lower()
+
+    def stream(self):
+        """
+        The payload as an async iterable of chunks, whether already read or not
+        """
+        if self.payload is not None:
+            return BytesBody(self.payload)
+        return self.body
 
     def form(self):
-        if self.headers.get("Content-Type") == "application/x-www-form-urlencoded":
-            return process_query_string(self.payload.decode())
-        raise ValueError("not valid form")
+        """
+        MultiDict of an urlencoded payload, parsed on first use
+        """
+        if self._form is _UNSET:
+            if self._media_type() != "application/x-www-form-urlencoded":
+                raise ValueError("not valid form")
+            self._form = process_query_string(self.payload or b"")
+        return self._form
+
+    def form_stream(self):
+        """
+        Incrementally parse an urlencoded payload, yielding (name, value) pairs
+        """
+        from .forms import UrlEncodedParser
+
+        if self._media_type() != "application/x-www-form-urlencoded":
+            raise ValueError("not valid form")
+        return UrlEncodedParser(self.stream())
+
+    def multipart(self):
+        """
+        Incrementally parse a multipart/form-data payload, yielding each part
+        """
+        from .forms import MultipartParser, parse_header_params
+
+        content_type, params = parse_header_params(self.headers.get("Content-Type", ""))
+        if content_type != "multipart/form-data" or not params.get("boundary"):
+            raise ValueError("not multipart form")
+        return MultipartParser(self.stream(), params["boundary"].encode())
 
     def json(self, force=False):
-        if (self.headers.get("Content-Type") == "application/json") or force:
-            if not self.payload:
-                return
-            return json.loads(self.payload.decode())
-        raise ValueError("not json content type")
+        """
+        The decoded JSON payload, parsed on first use
+        """
+        if self._json is _UNSET:
+            if not force and self._media_type() != "application/json":
+                raise ValueError("not json content type")
+            codec = self.json_codec or default_codec()
+            # decoded straight from the payload bytes
+            self._json = codec.loads(self.payload) if self.payload else None
+        return self._json
 
     def __repr__(self) -> str:
-        return f"{self.method}\n{self.path} {self.query}\n{self.headers}"
+        return f"{self.method}\n{self.target}\n{self.headers}"
@@ -1,7 +1,21 @@
-import json
+import asyncio
+import os
 from collections import namedtuple
 
-from .constants import NEWLINE, HTTP_1_1, STATUS_OK_200
+from .constants import (
+    DEFAULT_FILE_BLOCK_SIZE,
+    DEFAULT_STREAM_FLUSH_INTERVAL,
+    DEFAULT_STREAM_FLUSH_SIZE,
+    HTTP_1_1,
+    METHOD_HEAD,
+    NEWLINE,
+    REASON_PHRASES,
+    STATUS_OK_200,
+    STATUS_PARTIAL_CONTENT_206,
+    STATUS_RANGE_NOT_SATISFIABLE_416,
+)
+from .jsoncodec import default_codec, json_array_stream
+from .helpers import drain_if_needed, monotonic, parse_range, write_parts
 
 # (int, dict[str, str], bytes | ResponseStream | None)
 HTTPResponse = namedtuple(
@@ -9,26 +23,287 @@ HTTPResponse = namedtuple(
 )
 
 
+# {(proto, status_code): b"HTTP/1.1 200 OK\r\n", ...}
+_status_lines = {}
+
+
+def encode_status_line(proto, status_code):
+    line = _status_lines.get((proto, status_code))
+    if line is None:
+        reason = REASON_PHRASES.get(status_code, "")
+        line = f"{proto} {status_code} {reason}".encode() + NEWLINE
+        _status_lines[(proto, status_code)] = line
+    return line
+
+
+def encode_headers(headers):
+    """
+    Encode headers into a block ending with an empty line. Not cached,
+    most blocks have per-response values such as Content-Length,
+    fixed responses are cached whole as a RawResponse instead.
+    """
+    lines = [f"{name}: {value}\r\n" for name, value in headers.items()]
+    return "".join(lines).encode() + NEWLINE
+
+
+def encode_head(proto, status_code, headers):
+    return encode_status_line(proto, status_code) + encode_headers(headers)
+
+
 def create_chunk(data):
     return format(len(data), "x").encode("ascii") + NEWLINE + data + NEWLINE
 
 
+LAST_CHUNK = create_chunk(b"")
+
+
 class ResponseStream:
-    def __init__(self, stream) -> None:
+    """
+    A chunked response body, from either a normal or async iterable of bytes.
+    Small chunks are coalesced into one HTTP chunk up to flush_size bytes,
+    or until buffered data has waited flush_interval seconds.
+
+    For HTTP/1.0 clients chunked is False, the payload is sent
+    unframed and ends when the connection is closed.
+    """
+    def __init__(
+        self,
+        stream,
+        flush_size=DEFAULT_STREAM_FLUSH_SIZE,
+        flush_interval=DEFAULT_STREAM_FLUSH_INTERVAL,
+    ) -> None:
         self._stream = stream
+        self._flush_size = flush_size
+        self._flush_interval = flush_interval
+        self._pending = []
+        self._pending_size = 0
+        self._pending_since = 0
+        self._encoder = None
+        self.chunked = True
+
+    def wrap(self, wrapper):
+        """
+        Replace the source iterable with wrapper(source), e.g. to transform each chunk
+        """
+        self._stream = wrapper(self._stream)
+
+    def compress_with(self, encoder):
+        """
+        Compress the payload with a compression.Encoder,
+        flushed once for each HTTP chunk written
+        """
+        self._encoder = encoder
+
+    def _add(self, chunk):
+        if not chunk:
+            # an empty chunk would signal EOF
+            return
+        if not self._pending:
+            self._pending_since = monotonic()
+        self._pending.append(chunk)
+        self._pending_size += len(chunk)
+
+    def _should_flush(self):
+        return self._pending_size >= self._flush_size or (
+            not self._flush_interval
+            or monotonic() - self._pending_since >= self._flush_interval
+        )
 
-    def read(self):
-        for chunk in self._stream:
-            yield create_chunk(chunk)
+    async def _write_chunk(self, writer, parts, size):
+        if self.chunked:
+            parts.insert(0, format(size, "x").encode() + NEWLINE)
+            parts.append(NEWLINE)
+        write_parts(writer, parts)
+        await drain_if_needed(writer)
+
+    async def _flush(self, writer):
+        if not self._pending:
+            return
+        parts = self._pending
+        size = self._pending_size
+        self._pending = []
+        self._pending_size = 0
+        if self._encoder is not None:
+            data = self._encoder.compress(b"".join(parts))
+            if not data:
+                # MicroPython's compressor is still filling its window
+                return
+            parts = [data]
+            size = len(data)
+        await self._write_chunk(writer, parts, size)
+
+    async def _write_async(self, writer):
+        iterator = self._stream.__aiter__()
+        if not hasattr(asyncio, "shield"):
+            # MicroPython, cannot wait on the next chunk with a timeout
+            # without cancelling it, so flush each chunk
+            while True:
+                try:
+                    chunk = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                self._add(chunk)
+                await self._flush(writer)
+
+        next_chunk = None
+        try:
+            while True:
+                if next_chunk is None:
+                    next_chunk = asyncio.ensure_future(iterator.__anext__())
+                try:
+                    if self._pending:
+                        # flush anything buffered if the source stalls
+                        remaining = self._flush_interval - (
+                            monotonic() - self._pending_since
+                        )
+                        chunk = await asyncio.wait_for(
+                            asyncio.shield(next_chunk), max(remaining, 0)
+                        )
+                    else:
+                        chunk = await next_chunk
+                except asyncio.TimeoutError:
+                    await self._flush(writer)
+                    continue
+                except StopAsyncIteration:
+                    next_chunk = None
+                    return
+                next_chunk = None
+                self._add(chunk)
+                if self._should_flush():
+                    await self._flush(writer)
+        finally:
+            if next_chunk is not None:
+                next_chunk.cancel()
+
+    async def write_to(self, writer):
+        """
+        Write the stream as chunked payload, ending with the last chunk.
+        A source with a close() method is closed once done, even on error.
+        """
+        try:
+            if hasattr(self._stream, "__aiter__"):
+                await self._write_async(writer)
+            else:
+                for chunk in self._stream:
+                    self._add(chunk)
+                    if self._should_flush():
+                        await self._flush(writer)
+        finally:
+            close = getattr(self._stream, "close", None)
+            if close is not None:
+                close()
+        await self._flush(writer)
+        if self._encoder is not None:
+            data = self._encoder.finish()
+            if data:
+                await self._write_chunk(writer, [data], len(data))
         # EOF
-        yield create_chunk(b"")
+        if self.chunked:
+            writer.write(LAST_CHUNK)
+        await writer.drain()
+
+
+class ResponseFile:
+    """
+    A file payload of known length, sent with sendfile
+    on CPython or in fixed size blocks otherwise
+    """
+    def __init__(self, path, offset, count, block_size=DEFAULT_FILE_BLOCK_SIZE) -> None:
+        self._path = path
+        self._offset = offset
+        self._count = count
+        self._block_size = block_size
+
+    async def write_to(self, writer):
+        with open(self._path, "rb") as fo:
+            transport = getattr(writer, "transport", None)
+            if transport is not None:
+                # zero-copy where the transport supports it,
+                # asyncio falls back to buffered reads where not (e.g. TLS)
+                await writer.drain()
+                try:
+                    await asyncio.get_running_loop().sendfile(
+                        transport, fo, self._offset, self._count
+                    )
+                    return
+                except (NotImplementedError, AttributeError):
+                    # event loops without sendfile, e.g. uvloop
+                    pass
+
+            fo.seek(self._offset)
+            buffer = bytearray(self._block_size)
+            view = memoryview(buffer)
+            remaining = self._count
+            while remaining > 0:
+                n = fo.readinto(buffer)
+                if not n:
+                    raise EOFError("file shorter than expected")
+                n = min(n, remaining)
+                writer.write(view[:n])
+                await writer.drain()
+                remaining -= n
+
+
+class RawResponse:
+    """
+    A response rendered to bytes once, then written
+    as-is for every request it is returned for
+    """
+    def __init__(self, status_code, headers, payload=None) -> None:
+        self.status_code = status_code
+        self._headers = dict(headers)
+        self._payload = payload
+        if payload is not None:
+            self._headers["Content-Length"] = str(len(payload))
+        # {(proto, connection): b"...", ...}
+        self._rendered = {}
+        self._head = None
+
+    def head(self):
+        """
+        The same response without its payload, for HEAD requests
+        """
+        if self._head is None:
+            self._head = RawResponse(self.status_code, self._headers)
+        return self._head
+
+    def render_with(self, proto, headers):
+        """
+        Render with extra headers, e.g. added by middleware, not cached.
+        These take precedence, apart from Content-Length.
+        """
+        headers = dict(headers)
+        for name, value in self._headers.items():
+            if name not in headers or name == "Content-Length":
+                headers[name] = value
+        rendered = encode_head(proto, self.status_code, headers)
+        if self._payload:
+            rendered += self._payload
+        return rendered
+
+    def render(self, proto, connection):
+        rendered = self._rendered.get((proto, connection))
+        if rendered is None:
+            headers = {"Connection": connection}
+            headers.update(self._headers)
+            rendered = encode_head(proto, self.status_code, headers)
+            if self._payload:
+                rendered += self._payload
+            self._rendered[(proto, connection)] = rendered
+        return rendered
 
 
 class ResponseMaker:
-    def __init__(self, proto, headers) -> None:
+    def __init__(self, proto, headers, request=None, json_codec=None) -> None:
         self._proto = proto
         # type: (dict[str, str]) -> (dict[str, str])
         self._headers = headers
+        self._request = request
+        self._json_codec = json_codec if json_codec is not None else default_codec()
+
+    @property
+    def headers(self):
+        return self._headers
 
     def get_header(self, key):
         return self._headers.get(key)
@@ -53,6 +328,20 @@ class ResponseMaker:
             stream = ResponseStream(stream)
         return HTTPResponse(self._proto, status_code, self._headers, stream)
 
+    def _stream(self, status_code, content_type, stream):
+        """
+        content_stream, but for HTTP/1.0 clients sent unframed
+        and ended by closing the connection
+        """
+        if self._proto == HTTP_1_1:
+            return self.content_stream(status_code, content_type, stream)
+        if not isinstance(stream, ResponseStream):
+            stream = ResponseStream(stream)
+        stream.chunked = False
+        self._headers["Content-Type"] = content_type
+        self._headers["Connection"] = "close"
+        return HTTPResponse(self._proto, status_code, self._headers, stream)
+
     def text(self, status_code, text):
         return self.content(status_code, "text/plain", text.encode())
 
@@ -60,16 +349,96 @@ class ResponseMaker:
         return self.content(status_code, "text/html", html.encode())
 
     def json(self, status_code, obj):
-        data = json.dumps(obj).encode()
+        return self.json_bytes(status_code, self._json_codec.dumps(obj))
+
+    def json_bytes(self, status_code, data):
+        """
+        Send already serialized JSON, e.g. cached or made elsewhere
+        """
         return self.content(status_code, "application/json", data)
 
+    def json_stream(self, status_code, iterable):
+        """
+        Stream a normal or async iterable as a JSON array, encoding
+        one item at a time rather than building the whole list
+        """
+        return self._stream(
+            status_code,
+            "application/json",
+            json_array_stream(iterable, self._json_codec.dumps),
+        )
+
     def file(self, path, content_type="application/octet-stream"):
-        def stream():
-            with open(path, "rb") as fo:
-                for chunk in fo:
-                    yield chunk
+        """
+        Send a file with a Content-Length, honouring
+        a single "Range" request header and HEAD requests
+        """
+        size = os.stat(path)[6]
+        self._headers["Content-Type"] = content_type
+        self._headers["Accept-Ranges"] = "bytes"
+        status_code = STATUS_OK_200
+        offset, count = 0, size
+
+        range_header = None
+        if self._request is not None:
+            range_header = self._request.headers.get("Range")
+        if range_header:
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                # malformed ranges are ignored, sending the full file
+                pass
+            else:
+                if byte_range is None:
+                    self._headers["Content-Range"] = f"bytes */{size}"
+                    self._headers["Content-Length"] = "0"
+                    return self.no_content(STATUS_RANGE_NOT_SATISFIABLE_416)
+                offset, count = byte_range
+                status_code = STATUS_PARTIAL_CONTENT_206
+                self._headers["Content-Range"] = (
+                    f"bytes {offset}-{offset + count - 1}/{size}"
+                )
+
+        self._headers["Content-Length"] = str(count)
+        if count == 0 or (
+            self._request is not None and self._request.method == METHOD_HEAD
+        ):
+            return HTTPResponse(self._proto, status_code, self._headers, None)
+        return HTTPResponse(
+            self._proto, status_code, self._headers, ResponseFile(path, offset, count)
+        )
+
+    def sse(self, source):
+        """
+        Stream Server-Sent Events, source is either an EventHub,
+        subscribed to with the request's Last-Event-ID, or a normal
+        or async iterable of encoded events (see sse.format_event)
+        """
+        self._headers["Cache-Control"] = "no-cache"
+        if hasattr(source, "subscribe"):
+            if self._request is not None and self._request.method == METHOD_HEAD:
+                # nothing will be sent, so don't leave a subscription behind
+                source = ()
+            else:
+                last_event_id = None
+                if self._request is not None:
+                    last_event_id = self._request.headers.get("Last-Event-ID")
+                source = source.subscribe(last_event_id)
+        # each event is sent as soon as it is available
+        return self._stream(
+            STATUS_OK_200,
+            "text/event-stream",
+            ResponseStream(source, flush_interval=0),
+        )
 
-        return self.content_stream(STATUS_OK_200, content_type, stream())
+    def raw_cached(self, raw_response):
+        """
+        Return a pre-rendered RawResponse, only the
+        protocol and connection header are taken from this request
+        """
+        return HTTPResponse(
+            self._proto, raw_response.status_code, self._headers, raw_response
+        )
 
     def redirect(self, status_code, url):
         if status_code < 300 or status_code >= 400:
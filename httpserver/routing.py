@@ -1,4 +1,184 @@
-from .constants import METHOD_GET
+from .constants import (
+    DEFAULT_MAX_MESSAGE_SIZE,
+    DEFAULT_PING_INTERVAL,
+    METHOD_GET,
+    METHOD_HEAD,
+)
+from .helpers import perc_decode
+
+
+def _convert_str(v):
+    if not v:
+        raise ValueError("empty segment")
+    return v
+
+
+def _convert_int(v):
+    if not v.isdigit():
+        raise ValueError("not an integer")
+    return int(v)
+
+
+async def _coroutine_function():
+    pass
+
+
+def _is_coroutine_function(fn):
+    try:
+        from inspect import iscoroutinefunction
+    except ImportError:
+        # MicroPython, where coroutine functions have their own type
+        return type(fn) is type(_coroutine_function)
+    return iscoroutinefunction(fn)
+
+
+def _decode_segment(segment):
+    """
+    :raises UnicodeError: when it doesn't decode to valid UTF-8
+    """
+    if segment.find("%") == -1:
+        return segment
+    return perc_decode(segment).decode()
+
+
+# converters for single segment path parameters, "path" is handled separately
+CONVERTERS = {
+    "str": _convert_str,
+    "int": _convert_int,
+}
+
+
+class _Node:
+    __slots__ = ("static", "params", "wildcard", "catch_all", "methods", "pattern")
+
+    def __init__(self) -> None:
+        # {"segment": _Node, ...}
+        self.static = {}
+        # [(name, converter, _Node), ...]
+        self.params = []
+        # _Node for a "*" segment
+        self.wildcard = None
+        # (name, _Node) for a trailing <path:name>
+        self.catch_all = None
+        # {"GET": func, ...}
+        self.methods = {}
+        # the route path as registered, e.g. "/users/<int:id>"
+        self.pattern = None
+
+
+class Router:
+    """
+    Segment based trie built from registered routes,
+    supporting path parameters such as "/users/<int:id>",
+    "*" wildcard segments and trailing "<path:rest>" captures
+    """
+    def __init__(self, routes=None) -> None:
+        self._root = _Node()
+        if routes:
+            for (path, method), handler in routes.items():
+                self.add(path, method, handler)
+
+    def add(self, path, method, handler):
+        node = self._root
+        segments = path.split("/")[1:]
+        for i, segment in enumerate(segments):
+            if segment.startswith("<") and segment.endswith(">"):
+                converter_name, _, name = segment[1:-1].rpartition(":")
+                converter_name = converter_name or "str"
+                if converter_name == "path":
+                    if i != len(segments) - 1:
+                        raise ValueError("<path:...> must be the last segment")
+                    if node.catch_all is None:
+                        node.catch_all = (name, _Node())
+                    elif node.catch_all[0] != name:
+                        raise ValueError("conflicting path parameter names")
+                    node = node.catch_all[1]
+                    break
+                converter = CONVERTERS.get(converter_name)
+                if converter is None:
+                    raise ValueError(f"unknown converter '{converter_name}'")
+                for param_name, param_converter, child in node.params:
+                    if param_name == name and param_converter is converter:
+                        node = child
+                        break
+                else:
+                    child = _Node()
+                    node.params.append((name, converter, child))
+                    node = child
+            elif segment == "*":
+                if node.wildcard is None:
+                    node.wildcard = _Node()
+                node = node.wildcard
+            else:
+                child = node.static.get(segment)
+                if child is None:
+                    child = node.static[segment] = _Node()
+                node = child
+        node.methods[method] = handler
+        node.pattern = path
+
+    def _match(self, node, segments, i, params):
+        if i == len(segments):
+            if node.methods:
+                return node
+            return None
+        segment = segments[i]
+        # static segments take priority, then parameters, then wildcards
+        child = node.static.get(segment)
+        if child is not None:
+            matched = self._match(child, segments, i + 1, params)
+            if matched is not None:
+                return matched
+        param_nodes = node.params
+        if param_nodes:
+            try:
+                decoded = _decode_segment(segment)
+            except UnicodeError:
+                # can't be a parameter
+                param_nodes = ()
+        for name, converter, child in param_nodes:
+            try:
+                value = converter(decoded)
+            except ValueError:
+                continue
+            matched = self._match(child, segments, i + 1, params)
+            if matched is not None:
+                params[name] = value
+                return matched
+        if node.wildcard is not None:
+            matched = self._match(node.wildcard, segments, i + 1, params)
+            if matched is not None:
+                return matched
+        if node.catch_all is not None and segment:
+            name, matched = node.catch_all
+            try:
+                params[name] = "/".join(_decode_segment(s) for s in segments[i:])
+            except UnicodeError:
+                return None
+            return matched
+        return None
+
+    def match(self, path, method):
+        """
+        Find the handler for a path and method
+
+        :return: (handler, params, allowed_methods, pattern), handler is None
+                 when nothing matched, allowed_methods and pattern are None
+                 if the path is unknown
+        """
+        params = {}
+        node = self._match(self._root, path.split("/")[1:], 0, params)
+        if node is None:
+            return None, params, None, None
+        methods = node.methods
+        handler = methods.get(method)
+        if handler is None and method == METHOD_HEAD:
+            # HEAD is answered by the GET handler, without a payload
+            handler = methods.get(METHOD_GET)
+        allowed_methods = set(methods)
+        if METHOD_GET in allowed_methods:
+            allowed_methods.add(METHOD_HEAD)
+        return handler, params, allowed_methods, node.pattern
 
 
 class RouteGroup:
@@ -8,18 +188,160 @@ class RouteGroup:
     def __init__(self, url_prefix = "/") -> None:
         # {("/", "GET"): func, ... }
         self.routes = {}
+        # {("/", "GET"): {"blocking": False, "stream_body": False, ...}, ... }
+        self.route_options = {}
+        # [middleware, ...] wrapping this group's routes, outermost first
+        self.middlewares = []
         if not url_prefix.endswith("/"):
             url_prefix = url_prefix + "/"
         self._url_prefix = url_prefix
 
-    def route(self, path, method=METHOD_GET):
+    def route(
+        self,
+        path,
+        method=METHOD_GET,
+        blocking=False,
+        stream_body=False,
+        max_body_size=None,
+        compress=None,
+        cache_ttl=None,
+        cache_vary=(),
+        rate_limit=None,
+    ):
+        """
+        Register a handler for a path and method,
+        the handler may be a normal or coroutine function
+
+        :param blocking: run the (non-async) handler in a worker thread,
+                         only supported on CPython
+        :param stream_body: leave the payload unread, for the handler
+                            to consume through request.body
+        :param max_body_size: payload size limit in bytes,
+                              overriding the server's
+        :param compress: a Compression to use for this route, True for
+                         the server's (or the defaults), False to disable,
+                         None to follow the server
+        :param cache_ttl: seconds to cache the rendered response for,
+                          only for GET routes
+        :param cache_vary: request header names the response depends on,
+                           cached separately for each of their values
+        :param rate_limit: a RateLimit for this route alone
+        """
+        if cache_ttl and method.upper() != METHOD_GET:
+            raise ValueError("only GET routes can be cached")
         path = self._url_prefix + path.lstrip("/")
         def decorator(fn):
-            self.routes[(path, method.upper())] = fn
+            if blocking and _is_coroutine_function(fn):
+                raise ValueError("blocking handlers can't be coroutine functions")
+            key = (path, method.upper())
+            self.routes[key] = fn
+            self.route_options[key] = {
+                "blocking": blocking,
+                "stream_body": stream_body,
+                "max_body_size": max_body_size,
+                "compress": compress,
+                "cache_ttl": cache_ttl,
+                "cache_vary": cache_vary,
+                "rate_limit": rate_limit,
+            }
+            return fn
         return decorator
 
+    def websocket(
+        self,
+        path,
+        max_message_size=DEFAULT_MAX_MESSAGE_SIZE,
+        ping_interval=DEFAULT_PING_INTERVAL,
+        subprotocols=(),
+    ):
+        """
+        Register coroutine fn(ctx, ws) for WebSocket connections to a path,
+        it runs once the upgrade is sent, the connection closing when it
+        returns. Requests that are not upgrades are answered with 426.
+
+        :param max_message_size: larger messages close the connection with 1009
+        :param ping_interval: seconds the client can be quiet before being
+                              pinged, a ping unanswered for as long again
+                              closes the connection, 0 to disable
+        :param subprotocols: supported Sec-WebSocket-Protocol values,
+                             in order of preference
+        """
+        path = self._url_prefix + path.lstrip("/")
+        def decorator(fn):
+            key = (path, METHOD_GET)
+            self.routes[key] = fn
+            self.route_options[key] = {
+                "websocket": True,
+                "max_message_size": max_message_size,
+                "ping_interval": ping_interval,
+                "subprotocols": tuple(subprotocols),
+                "compress": False,
+            }
+            return fn
+        return decorator
+
+    def middleware(self, fn):
+        """
+        Register coroutine fn(ctx, call_next) around this group's routes,
+        it can return its own response or await call_next(ctx) and
+        transform the result. Middleware run in the order registered,
+        the server's before any group's.
+        """
+        self.middlewares.append(fn)
+        return fn
+
+    def before_request(self, fn):
+        """
+        Register fn(ctx) to run before each handler in this group,
+        returning a response from it skips the handler
+        """
+        async def middleware(ctx, call_next):
+            response = fn(ctx)
+            if response is not None and not isinstance(response, tuple):
+                # fn was a coroutine function
+                response = await response
+            if response is not None:
+                return response
+            return await call_next(ctx)
+
+        self.middlewares.append(middleware)
+        return fn
+
+    def after_request(self, fn):
+        """
+        Register fn(ctx, response) to run after each handler in this group,
+        returning the response to send
+        """
+        async def middleware(ctx, call_next):
+            response = fn(ctx, await call_next(ctx))
+            if not isinstance(response, tuple):
+                response = await response
+            return response
+
+        self.middlewares.append(middleware)
+        return fn
+
+    def mount_static(self, prefix, directory, **options):
+        """
+        Serve files under a directory at the given url prefix,
+        options are passed to StaticFiles
+        """
+        from .static import StaticFiles
+
+        handler = StaticFiles(directory, **options)
+        prefix = prefix.rstrip("/")
+        self.route(prefix + "/")(handler)
+        self.route(prefix + "/<path:path>")(handler)
+        return handler
+
     def get_route_handler(self, path, method):
         return self.routes.get((path, method))
 
     def register_route_group(self, group):
         self.routes.update(group.routes)
+        for key in group.routes:
+            options = dict(group.route_options.get(key, {}))
+            # groups whose middleware wrap the route, outermost first,
+            # resolved when the server compiles its routes
+            options["groups"] = (group,) + options.get("groups", ())
+            self.route_options[key] = options
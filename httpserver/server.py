@@ -1,24 +1,147 @@
 import asyncio
+import gc
 from collections import OrderedDict, namedtuple
 
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # MicroPython, blocking handlers will run on the event loop
+    ThreadPoolExecutor = None
+
 from .constants import (
+    DEFAULT_BLOCK_SIZE,
+    DEFAULT_MAX_BODY_SIZE,
+    DEFAULT_MAX_HEAD_SIZE,
+    DEFAULT_MAX_PIPELINE,
+    HEAD_END,
     HTTP_1_0,
     HTTP_1_1,
+    METHOD_HEAD,
     METHODS,
-    NEWLINE,
+    STATUS_BAD_REQUEST_400,
+    STATUS_CONTENT_TOO_LARGE_413,
     STATUS_HTTP_VERSION_NOT_SUPPORTED_505,
     STATUS_INTERNAL_SERVER_ERROR_500,
+    STATUS_METHOD_NOT_ALLOWED_405,
     STATUS_NOT_FOUND_404,
     STATUS_NOT_IMPLEMENTED_501,
+    STATUS_REQUEST_HEADER_FIELDS_TOO_LARGE_431,
+    STATUS_SERVICE_UNAVAILABLE_503,
+    STATUS_SWITCHING_PROTOCOLS_101,
+)
+from .helpers import (
+    BufferedReader,
+    LimitExceeded,
+    header_has_token,
+    is_token_list,
+    monotonic,
+    parse_content_length,
+    parse_head,
+    write_parts,
+)
+from .jsoncodec import default_codec
+from .logger import Logger
+from .request import HTTPRequest, Request, RequestBody
+from .response import (
+    HTTPResponse,
+    RawResponse,
+    ResponseFile,
+    ResponseMaker,
+    ResponseStream,
+    encode_headers,
+    encode_status_line,
 )
-from .helpers import readuntil
-from .request import HTTPRequest, Request
-from .response import ResponseMaker, ResponseStream
-from .routing import RouteGroup
+from .routing import RouteGroup, Router
 
 HandlerContext = namedtuple("HandlerContext", ("request", "response", "globals"))
 
 
+class _Conn:
+    """
+    An open connection, tracked for limits and reaping when idle
+    """
+    __slots__ = ("task", "remote_addr", "reaped")
+
+    def __init__(self, task, remote_addr) -> None:
+        self.task = task
+        self.remote_addr = remote_addr
+        # closed by the server rather than the client
+        self.reaped = False
+
+
+def _stop_on_signals(loop):
+    """
+    Stop the loop on SIGTERM or SIGHUP, where the platform supports it,
+    a single process has no workers to replace so SIGHUP stops it
+    for its process manager to restart
+    """
+    try:
+        import signal
+
+        for signum in (signal.SIGTERM, signal.SIGHUP):
+            loop.add_signal_handler(signum, loop.stop)
+    except (ImportError, AttributeError, NotImplementedError):
+        # MicroPython or Windows
+        pass
+
+
+async def _discard_input(reader):
+    while await reader.read(DEFAULT_BLOCK_SIZE):
+        pass
+
+
+def _middleware_endpoint(middleware, call_next):
+    async def endpoint(ctx):
+        return await middleware(ctx, call_next)
+
+    return endpoint
+
+
+def default_loop_factory():
+    """
+    A new uvloop event loop when installed, otherwise asyncio's
+    """
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.new_event_loop()
+    return uvloop.new_event_loop()
+
+
+def _socket_options(
+    nodelay, keepalive, recv_buffer, send_buffer, defer_accept
+):
+    """
+    :return: ([(level, option, value), ...] for each connection,
+              [(level, option, value), ...] for the listening socket)
+    """
+    import socket
+
+    conn_options = []
+    listen_options = []
+    if nodelay is not None:
+        conn_options.append(
+            (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 if nodelay else 0)
+        )
+    if keepalive is not None:
+        conn_options.append(
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1 if keepalive else 0)
+        )
+    # accepted sockets inherit buffer sizes from the listening socket
+    if recv_buffer is not None:
+        listen_options.append((socket.SOL_SOCKET, socket.SO_RCVBUF, recv_buffer))
+    if send_buffer is not None:
+        listen_options.append((socket.SOL_SOCKET, socket.SO_SNDBUF, send_buffer))
+    if defer_accept is not None:
+        # Linux only, wake the server only once the client has sent data
+        if not hasattr(socket, "TCP_DEFER_ACCEPT"):
+            raise ValueError("TCP_DEFER_ACCEPT is not supported on this platform")
+        listen_options.append(
+            (socket.IPPROTO_TCP, socket.TCP_DEFER_ACCEPT, int(defer_accept))
+        )
+    return conn_options, listen_options
+
+
 class HTTPServer(RouteGroup):
     """
     The HTTP/1.1 async server, with an internal RouteGroup
@@ -28,199 +151,1021 @@ class HTTPServer(RouteGroup):
         self,
         timeout=5,
         keep_alive_timeout=25,
+        max_head_size=DEFAULT_MAX_HEAD_SIZE,
+        max_pipeline=DEFAULT_MAX_PIPELINE,
+        pipeline_concurrent=False,
+        max_blocking_workers=4,
+        max_body_size=DEFAULT_MAX_BODY_SIZE,
+        compression=None,
+        response_cache=None,
+        max_connections=None,
+        max_connections_per_ip=None,
+        queue_connections=False,
+        retry_after=1,
+        reap_interval=1,
+        min_free_memory=None,
+        shutdown_timeout=10,
         request_handler=Request,
         response_maker=ResponseMaker,
+        json_codec=None,
         globals=None,
+        logger=None,
     ):
         super().__init__()
         self._server = None
+        self._router = None
+        # [(level, option, value), ...] set on each accepted socket
+        self._conn_socket_options = []
+        self._executor = None
+        self._max_blocking_workers = max_blocking_workers
         self._timeout = timeout
         self._keep_alive_timeout = keep_alive_timeout
+        self._max_head_size = max_head_size
+        self._max_body_size = max_body_size
+        # {endpoint: (stream_body, max_body_size), ...} for routes not using defaults
+        self._body_options = {}
+        # {endpoint, ...} of websocket routes
+        self._websocket_endpoints = set()
+        # {WebSocket: _Conn, ...} open websocket connections
+        self._websockets = {}
+        # Compression applied to every route not opting out, None to disable
+        self._compression = compression
+        # ResponseCache for routes registered with cache_ttl,
+        # one is made when needed if not given
+        self.response_cache = response_cache
+        # server middleware wrapped around requests matching no route
+        self._unmatched_endpoint = None
+        # connections over these limits are sent 503 and closed,
+        # or wait up to timeout for a slot with queue_connections
+        self._max_connections = max_connections
+        self._max_connections_per_ip = max_connections_per_ip
+        self._queue_connections = queue_connections
+        self._overloaded_response = RawResponse(
+            STATUS_SERVICE_UNAVAILABLE_503,
+            {"Retry-After": str(retry_after), "Content-Type": "text/html"},
+            b"<h1>Service Unavailable</h1>",
+        ).render(HTTP_1_1, "close")
+        # set as connections close, for ones waiting on a slot
+        self._slot_free = asyncio.Event()
+        # {Task, ...} handling connections, until fully closed
+        self._tasks = set()
+        # {_Conn, ...} and {"remote_addr": count, ...}
+        self._connections = set()
+        self._ip_connections = {}
+        # {_Conn: deadline, ...} connections waiting on their next
+        # message, oldest first as every wait has the same timeout
+        self._idle = OrderedDict()
+        self._reap_interval = reap_interval
+        # MicroPython only, idle connections are closed while free memory is lower
+        self._min_free_memory = min_free_memory
+        self._reaper = None
+        # seconds stop() waits on open connections before closing them
+        self._shutdown_timeout = shutdown_timeout
+        self._draining = False
+        # set once the last connection closes while draining
+        self._drained = None
+        self._max_pipeline = max_pipeline
+        self._pipeline_concurrent = pipeline_concurrent
         self._request_handler = request_handler
         self._response_maker = response_maker
+        # JSONCodec for request and response bodies, orjson or ujson
+        # when installed
+        self.json_codec = json_codec if json_codec is not None else default_codec()
+        # instrumentation hooks, each is skipped entirely while empty
+        self._on_conn_open = []
+        self._on_conn_close = []
+        self._on_request_start = []
+        self._on_handler_done = []
+        self._on_response_written = []
+
+        self.logger = logger if logger is not None else Logger()
+        if self.logger.access_log:
+            self.on_response_written(self.logger.access)
 
         if globals is not None:
             self.globals = globals
         else:
             self.globals = {}
 
-    async def _read_headers(self, reader, proto_ver):
-        headers = OrderedDict()
+    def on_conn_open(self, fn):
+        """
+        Register fn(peer_name, timestamp), called when a connection is accepted
+        """
+        self._on_conn_open.append(fn)
+        return fn
 
-        # set default connection header based on protocol version
-        # may be overridden by client headers later
-        if proto_ver == HTTP_1_0:
-            headers["Connection"] = "close"
-        else:
-            headers["Connection"] = "keep-alive"
+    def on_conn_close(self, fn):
+        """
+        Register fn(peer_name, timestamp), called once a connection has closed
+        """
+        self._on_conn_close.append(fn)
+        return fn
+
+    def on_request_start(self, fn):
+        """
+        Register fn(request, received_at, parsed_at), called once routed,
+        before the payload is read; received_at is when the message head
+        arrived, parsed_at when the request had been parsed and routed
+        """
+        self._on_request_start.append(fn)
+        return fn
+
+    def on_handler_done(self, fn):
+        """
+        Register fn(request, response, timestamp), called once a response is made
+        """
+        self._on_handler_done.append(fn)
+        return fn
 
-        while (
-            line := await asyncio.wait_for(readuntil(reader, NEWLINE), self._timeout)
-        ) != NEWLINE:
-            line = line.strip(NEWLINE).decode()
-            sep_i = line.find(":")
-            headers[line[0:sep_i]] = line[sep_i + 2 :]
+    def on_response_written(self, fn):
+        """
+        Register fn(request, response, timestamp), called after the response
+        is written; request is None for messages rejected before routing
+        """
+        self._on_response_written.append(fn)
+        return fn
 
-        return headers
+    async def _read_message(self, reader, writer=None):
+        # an idle timeout is enforced by the reaper
+        head = await reader.read_head(self._max_head_size)
+        if len(head) == 0:
+            return None, 0
+        received_at = 0
+        if self._on_request_start or self._on_response_written:
+            received_at = monotonic()
+        if not head.endswith(HEAD_END):
+            raise ValueError("message head incomplete")
+        method, path, proto_ver, headers = parse_head(head)
+
+        # set default connection header based on protocol version
+        # if not given by client
+        connection = headers.get("Connection")
+        if connection is None:
+            if proto_ver == HTTP_1_0:
+                headers["Connection"] = "close"
+            else:
+                headers["Connection"] = "keep-alive"
+        elif not is_token_list(connection):
+            raise ValueError("invalid Connection header")
 
-    async def _read_message(self, reader):
-        start_line = await asyncio.wait_for(
-            readuntil(reader, NEWLINE),
-            self._keep_alive_timeout or self._timeout,
+        # payload is left unread until the request has been routed
+        transfer_encoding = headers.get("Transfer-Encoding")
+        if transfer_encoding is not None:
+            if "Content-Length" in headers:
+                raise ValueError("both Content-Length and Transfer-Encoding given")
+            if transfer_encoding.strip().lower() != "chunked":
+                raise ValueError("unsupported Transfer-Encoding")
+            payload_length, chunked = 0, True
+        else:
+            payload_length = parse_content_length(headers.get("Content-Length", "0"))
+            chunked = False
+        continue_writer = None
+        if (
+            writer is not None
+            and proto_ver == HTTP_1_1
+            and headers.get("Expect", "").lower() == "100-continue"
+        ):
+            continue_writer = writer
+        request_payload = RequestBody(
+            reader, payload_length, chunked, self._timeout, continue_writer
         )
-        start_line = start_line.strip(NEWLINE).decode()
-        if len(start_line) == 0:
-            return None
-        method, path, proto_ver = start_line.split(" ", 3)
-        headers = await self._read_headers(reader, proto_ver)
-        request_payload = None
-        if (request_payload_length := int(headers.get("Content-Length", "0"))) != 0:
-            request_payload = await asyncio.wait_for(
-                reader.readexactly(request_payload_length), self._timeout
-            )
-        return HTTPRequest(proto_ver, method, path, headers, request_payload)
+        return HTTPRequest(proto_ver, method, path, headers, request_payload), received_at
 
-    async def _write_message(self, writer, response):
-        raw_message = (f"{response.proto} {response.status_code}").encode() + NEWLINE
-        for key, value in response.headers.items():
-            raw_message += key.encode() + b": " + value.encode() + NEWLINE
-        raw_message += NEWLINE
+    async def _write_message(self, writer, response, drain=True):
+        payload = response.payload
+        if isinstance(payload, RawResponse):
+            if len(response.headers) == 1:
+                writer.write(
+                    payload.render(response.proto, response.headers["Connection"])
+                )
+            else:
+                writer.write(payload.render_with(response.proto, response.headers))
+        else:
+            status_line = encode_status_line(response.proto, response.status_code)
+            header_block = encode_headers(response.headers)
+            if isinstance(payload, (ResponseStream, ResponseFile)):
+                # streamed payload, head is sent along with the first chunk
+                write_parts(writer, (status_line, header_block))
+                await payload.write_to(writer)
+                return
+            elif payload:
+                write_parts(writer, (status_line, header_block, payload))
+            else:
+                write_parts(writer, (status_line, header_block))
 
-        if isinstance(response.payload, ResponseStream):
-            # chunked payload
-            writer.write(raw_message)
+        if drain:
             await writer.drain()
-            for chunk in response.payload.read():
-                writer.write(chunk)
-                await writer.drain()
-            return
-        elif response.payload:
-            # normal payload
-            raw_message += response.payload
-
-        writer.write(raw_message)
-        await writer.drain()
 
-    def build_response_maker(self, proto, keep_alive):
+    def build_response_maker(self, proto, keep_alive, request=None):
         return self._response_maker(
             proto,
             {
                 "Connection": "keep-alive" if keep_alive else "close",
             },
+            request,
+            json_codec=self.json_codec,
+        )
+
+    def _build_endpoint(self, handler, options):
+        """
+        Wrap a route handler into a coroutine function taking a HandlerContext
+        """
+        if options.get("blocking") and ThreadPoolExecutor is not None:
+
+            async def endpoint(ctx):
+                return await asyncio.get_running_loop().run_in_executor(
+                    self._executor, handler, ctx
+                )
+
+            return endpoint
+
+        async def endpoint(ctx):
+            response = handler(ctx)
+            if not isinstance(response, tuple):
+                # handler was a coroutine function
+                response = await response
+            return response
+
+        return endpoint
+
+    def _build_websocket_endpoint(self, handler, options):
+        """
+        Wrap a websocket handler into an endpoint answering the upgrade
+        """
+        from .websocket import handshake
+
+        subprotocols = options.get("subprotocols", ())
+        max_message_size = options["max_message_size"]
+        ping_interval = options["ping_interval"]
+
+        async def endpoint(ctx):
+            return handshake(
+                ctx, handler, subprotocols, max_message_size, ping_interval
+            )
+
+        return endpoint
+
+    def _wrap_middlewares(self, endpoint, middlewares):
+        """
+        Precompose middleware around an endpoint, outermost first
+        """
+        for middleware in reversed(middlewares):
+            endpoint = _middleware_endpoint(middleware, endpoint)
+        return endpoint
+
+    def _compile_routes(self):
+        endpoints = {}
+        self._body_options = {}
+        self._websocket_endpoints = set()
+        # shared by routes enabling compression when the server has none
+        default_compression = None
+        for key, handler in self.routes.items():
+            options = self.route_options.get(key, {})
+            if options.get("blocking") and ThreadPoolExecutor is not None:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self._max_blocking_workers)
+            if options.get("websocket"):
+                endpoint = self._build_websocket_endpoint(handler, options)
+            else:
+                endpoint = self._build_endpoint(handler, options)
+
+            compress = options.get("compress")
+            if compress is None:
+                compress = self._compression
+            elif compress is True:
+                if self._compression is not None:
+                    compress = self._compression
+                else:
+                    if default_compression is None:
+                        from .compression import Compression
+
+                        default_compression = Compression()
+                    compress = default_compression
+            if compress:
+                endpoint = _middleware_endpoint(compress, endpoint)
+
+            if options.get("cache_ttl"):
+                if self.response_cache is None:
+                    from .cache import ResponseCache
+
+                    self.response_cache = ResponseCache()
+                vary = tuple(options.get("cache_vary", ()))
+                if compress:
+                    # compressed responses are cached per encoding
+                    vary += ("Accept-Encoding",)
+                endpoint = self.response_cache.wrap(
+                    endpoint, options["cache_ttl"], vary
+                )
+
+            rate_limit = options.get("rate_limit")
+            if rate_limit is not None:
+                # checked before the cache, so cached responses count too
+                endpoint = _middleware_endpoint(rate_limit, endpoint)
+
+            middlewares = list(self.middlewares)
+            for group in options.get("groups", ()):
+                middlewares.extend(group.middlewares)
+            if middlewares:
+                endpoint = self._wrap_middlewares(endpoint, middlewares)
+            if options.get("websocket"):
+                self._websocket_endpoints.add(endpoint)
+
+            max_body_size = options.get("max_body_size")
+            if options.get("stream_body") or max_body_size is not None:
+                if max_body_size is None:
+                    max_body_size = self._max_body_size
+                self._body_options[endpoint] = (
+                    options.get("stream_body", False),
+                    max_body_size,
+                )
+            endpoints[key] = endpoint
+        self._unmatched_endpoint = None
+        if self.middlewares:
+            self._unmatched_endpoint = self._wrap_middlewares(
+                self._unmatched, self.middlewares
+            )
+        return Router(endpoints)
+
+    def _route(self, http_request, received_at=0, remote_addr=None):
+        """
+        Convert a raw request into a request object and find its handler
+
+        :return: (request, handler or None, allowed methods)
+        """
+        request = self._request_handler(http_request)
+        request.received_at = received_at
+        request.remote_addr = remote_addr
+        request.json_codec = self.json_codec
+
+        # get route handler function, if one exists
+        handler, request.params, allowed_methods, request.route = (
+            self._router.match(request.path, request.method)
+        )
+        return request, handler, allowed_methods
+
+    def _not_found_response(self, response_maker, allowed_methods):
+        if allowed_methods:
+            response_maker.set_header("Allow", ", ".join(sorted(allowed_methods)))
+            return response_maker.html(
+                STATUS_METHOD_NOT_ALLOWED_405, "<h1>Method Not Allowed</h1>"
+            )
+        return response_maker.html(STATUS_NOT_FOUND_404, "<h1>Page Not Found</h1>")
+
+    async def _unmatched(self, ctx):
+        """
+        Endpoint for requests matching no route, used when
+        server middleware need to see them (e.g. CORS preflights)
+        """
+        request = ctx.request
+        allowed_methods = self._router.match(request.path, request.method)[2]
+        return self._not_found_response(ctx.response, allowed_methods)
+
+    def _too_large_response(self, proto):
+        return self.build_response_maker(proto, False).html(
+            STATUS_CONTENT_TOO_LARGE_413, "<h1>Content Too Large</h1>"
+        )
+
+    async def _handle_request(self, request, handler, allowed_methods, keep_alive):
+        """
+        Run a routed request's handler
+
+        :return: (request, response, error) where error
+                 is any exception the handler raised
+        """
+        # check if a handler is actually registered
+        err = None
+        if not handler:
+            handler = self._unmatched_endpoint
+        if not handler:
+            response = self._not_found_response(
+                self.build_response_maker(request.proto, keep_alive),
+                allowed_methods,
+            )
+        else:
+            # run handler, construct response
+            # and handle if handler raises an exception and handle it
+            try:
+                response_maker = self.build_response_maker(
+                    request.proto, keep_alive, request
+                )
+                response = await handler(
+                    HandlerContext(request, response_maker, self.globals)
+                )
+            except LimitExceeded:
+                # streamed payload went over its limit
+                response = self._too_large_response(request.proto)
+            except Exception as handler_err:
+                err = handler_err
+                response_maker = self.build_response_maker(request.proto, False)
+                response = response_maker.html(
+                    STATUS_INTERNAL_SERVER_ERROR_500,
+                    "<h1>Internal Server Error</h1>",
+                )
+
+        if request.method == METHOD_HEAD and response.payload is not None:
+            # headers are kept as they would be for GET
+            payload = None
+            if isinstance(response.payload, RawResponse):
+                payload = response.payload.head()
+            response = HTTPResponse(
+                response.proto, response.status_code, response.headers, payload
+            )
+
+        if self._on_handler_done:
+            now = request.handler_done_at = monotonic()
+            for hook in self._on_handler_done:
+                hook(request, response, now)
+        return request, response, err
+
+    async def _flush_responses(self, writer, pending):
+        """
+        Write queued responses back in request order,
+        waiting on any that are still being handled
+
+        :return: False once a response closes the connection
+        """
+        try:
+            while pending:
+                entry = pending.pop(0)
+                if not isinstance(entry, tuple):
+                    # handler still running as a task
+                    entry = await entry
+                request, response, err = entry
+                if self._draining:
+                    # shutting down, unwritten responses are dropped and
+                    # the client retries them on a new connection
+                    response.headers["Connection"] = "close"
+                    pending.clear()
+                await self._write_message(writer, response, drain=False)
+                if self._on_response_written:
+                    now = monotonic()
+                    for hook in self._on_response_written:
+                        hook(request, response, now)
+                if err is not None:
+                    raise err
+                if response.headers.get("Connection") == "close":
+                    # e.g. a payload ended by closing the connection,
+                    # later requests are dropped for the client to retry
+                    await writer.drain()
+                    return False
+            await writer.drain()
+            return True
+        finally:
+            for entry in pending:
+                if not isinstance(entry, tuple):
+                    entry.cancel()
+            pending.clear()
+
+    def _read_error_response(self, err, peer_name):
+        if isinstance(err, LimitExceeded):
+            self.logger.warning("message head too large from %s", peer_name)
+            return self.build_response_maker(HTTP_1_1, False).html(
+                STATUS_REQUEST_HEADER_FIELDS_TOO_LARGE_431,
+                "<h1>Request Header Fields Too Large</h1>",
+            )
+        self.logger.warning("malformed message received from %s", peer_name)
+        return self.build_response_maker(HTTP_1_1, False).html(
+            STATUS_BAD_REQUEST_400,
+            "<h1>Bad Request</h1>",
         )
 
+    def _release(self, conn):
+        self._idle.pop(conn, None)
+        if conn not in self._connections:
+            return
+        self._connections.remove(conn)
+        if self._drained is not None and not self._connections:
+            self._drained.set()
+        if self._max_connections_per_ip is not None:
+            count = self._ip_connections.pop(conn.remote_addr, 1) - 1
+            if count:
+                self._ip_connections[conn.remote_addr] = count
+        self._slot_free.set()
+
+    def _reap(self, conn):
+        """
+        Close a connection waiting on its next message,
+        its slot is released once its task has closed it
+        """
+        conn.reaped = True
+        self._idle.pop(conn, None)
+        conn.task.cancel()
+
+    async def _admit(self, conn):
+        """
+        :return: whether the connection is within the limits, once admitted
+        """
+        if self._max_connections_per_ip is not None:
+            count = self._ip_connections.get(conn.remote_addr, 0)
+            if count >= self._max_connections_per_ip:
+                self.logger.warning("too many connections from %s", conn.remote_addr)
+                return False
+        if self._max_connections is not None:
+            deadline = None
+            while len(self._connections) >= self._max_connections:
+                if self._idle:
+                    # make room by closing the longest idle connection,
+                    # waiting for it to finish closing
+                    self._reap(next(iter(self._idle)))
+                    wait = self._timeout
+                elif not self._queue_connections:
+                    self.logger.warning("connection limit reached")
+                    return False
+                else:
+                    now = monotonic()
+                    if deadline is None:
+                        deadline = now + self._timeout
+                    elif now >= deadline:
+                        self.logger.warning("connection limit reached")
+                        return False
+                    wait = deadline - now
+                self._slot_free.clear()
+                try:
+                    await asyncio.wait_for(self._slot_free.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        self._connections.add(conn)
+        if self._max_connections_per_ip is not None:
+            self._ip_connections[conn.remote_addr] = (
+                self._ip_connections.get(conn.remote_addr, 0) + 1
+            )
+        return True
+
+    async def _reject(self, reader, writer):
+        """
+        Send 503 and close, reading whatever the client sent first
+        so that closing with unread data doesn't reset the connection
+        """
+        try:
+            writer.write(self._overloaded_response)
+            await writer.drain()
+            if hasattr(writer, "can_write_eof") and writer.can_write_eof():
+                writer.write_eof()
+                await asyncio.wait_for(_discard_input(reader), 1)
+        except (OSError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    async def _run_websocket(self, conn, upgrade, reader, writer):
+        """
+        Run the handler of an upgraded connection until it returns
+        """
+        ws = upgrade.accept(reader, writer, self._timeout)
+        self._websockets[ws] = conn
+        try:
+            await upgrade.handler(upgrade.ctx, ws)
+        except Exception:
+            if not ws.closed:
+                from .websocket import CLOSE_INTERNAL_ERROR
+
+                await ws.close(CLOSE_INTERNAL_ERROR)
+            raise
+        finally:
+            self._websockets.pop(ws, None)
+        await ws.close()
+
+    async def _reap_idle(self):
+        """
+        Close connections idle for longer than the keep-alive timeout,
+        checking every reap_interval seconds
+        """
+        check_memory = self._min_free_memory is not None and hasattr(gc, "mem_free")
+        while True:
+            await asyncio.sleep(self._reap_interval)
+            now = monotonic()
+            expired = []
+            for conn, deadline in self._idle.items():
+                if deadline > now:
+                    break
+                expired.append(conn)
+            for conn in expired:
+                self._reap(conn)
+            if self._websockets:
+                for ws, conn in list(self._websockets.items()):
+                    if not ws.keepalive(now):
+                        self.logger.debug("websocket ping unanswered, closing")
+                        self._reap(conn)
+            if check_memory and self._idle and gc.mem_free() < self._min_free_memory:
+                gc.collect()
+                while self._idle and gc.mem_free() < self._min_free_memory:
+                    self._reap(next(iter(self._idle)))
+                    # let the closed connections free their buffers
+                    await asyncio.sleep(0)
+                    gc.collect()
+
     async def _handle_conn(self, reader, writer):
+        # tracked until fully closed, so stop() can wait for it
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            await self._serve_conn(reader, writer)
+        finally:
+            self._tasks.discard(task)
+
+    async def _serve_conn(self, reader, writer):
         keep_alive = True
         peer_name = writer.get_extra_info("peername")
-        print(f"new conn from {peer_name}")
+        remote_addr = peer_name[0] if peer_name else None
+        conn = _Conn(asyncio.current_task(), remote_addr)
+        if not await self._admit(conn):
+            await self._reject(reader, writer)
+            return
+        idle_timeout = self._keep_alive_timeout or self._timeout
+        self.logger.debug("new conn from %s", peer_name)
+        if self._on_conn_open:
+            now = monotonic()
+            for hook in self._on_conn_open:
+                hook(peer_name, now)
+        if self._conn_socket_options:
+            sock = writer.get_extra_info("socket")
+            if sock is not None:
+                for level, option, value in self._conn_socket_options:
+                    sock.setsockopt(level, option, value)
+        reader = BufferedReader(reader)
+        # responses waiting to be written, in request order, either
+        # (request, response, error) or a task that will return one
+        pending = []
         try:
-            while keep_alive:
-                http_request = await self._read_message(reader)
+            while keep_alive and not self._draining:
+                if idle_timeout:
+                    self._idle[conn] = monotonic() + idle_timeout
+                try:
+                    http_request, received_at = await self._read_message(reader, writer)
+                except EOFError:
+                    self.logger.debug("connection from %s closed mid-message", peer_name)
+                    break
+                except ValueError as err:
+                    pending.append(
+                        (None, self._read_error_response(err, peer_name), None)
+                    )
+                    break
+                finally:
+                    if idle_timeout:
+                        self._idle.pop(conn, None)
                 if not http_request:
-                    if keep_alive:
-                        # handle client signaling
-                        # keep-alive end
-                        break
-                    else:
-                        raise ValueError("message empty")
-                print(http_request)
+                    # client signalled keep-alive end
+                    break
+                self.logger.debug("%s", http_request)
 
                 # validate given http protocol version
                 if http_request.proto not in (HTTP_1_0, HTTP_1_1):
-                    print(
-                        f"invalid proto '{http_request.proto}' received from {peer_name}"
+                    self.logger.warning(
+                        "invalid proto '%s' received from %s",
+                        http_request.proto,
+                        peer_name,
                     )
-                    response = self.build_response_maker(HTTP_1_1, keep_alive).html(
+                    response = self.build_response_maker(HTTP_1_1, False).html(
                         STATUS_HTTP_VERSION_NOT_SUPPORTED_505,
                         "<h1>Version Not Supported</h1><p>Supported versions are: HTTP/1.0 or HTTP/1.1.</p>",
                     )
-                    await self._write_message(writer, response)
-                    return
+                    pending.append((None, response, None))
+                    break
 
                 # validate given http method
                 if http_request.method not in METHODS:
-                    print(
-                        f"invalid method '{http_request.method}' received from {peer_name}"
+                    self.logger.warning(
+                        "invalid method '%s' received from %s",
+                        http_request.method,
+                        peer_name,
                     )
-                    response = self.build_response_maker(HTTP_1_1, keep_alive).html(
+                    response = self.build_response_maker(HTTP_1_1, False).html(
                         STATUS_NOT_IMPLEMENTED_501,
                         f"<h1>Not Implemented</h1><p>The method '{http_request.method}' is not supported.</p>",
                     )
-                    await self._write_message(writer, response)
-                    return
-
-                # Convert raw http request into a request object
-                request = self._request_handler(http_request)
+                    pending.append((None, response, None))
+                    break
 
                 # support keep-alive and close connections
-                if request.headers["Connection"] == "close":
+                if header_has_token(http_request.headers["Connection"], "close"):
                     keep_alive = False
 
-                # get route handler function, if one exists
-                handler = self.get_route_handler(request.path, request.method)
-
-                # check if a handler is actually registered
-                if not handler:
-                    response = self.build_response_maker(
-                        http_request.proto, keep_alive
-                    ).html(STATUS_NOT_FOUND_404, "<h1>Page Not Found</h1>")
-                    await self._write_message(writer, response)
-                    return
-
-                # run handler, construct response
-                # and handle if handler raises an exception and handle it
-                try:
-                    response_maker = self.build_response_maker(
-                        http_request.proto, keep_alive
-                    )
-                    response = handler(
-                        HandlerContext(request, response_maker, self.globals)
+                request, handler, allowed_methods = self._route(
+                    http_request, received_at, remote_addr
+                )
+                if self._on_request_start:
+                    parsed_at = request.parsed_at = monotonic()
+                    for hook in self._on_request_start:
+                        hook(request, received_at, parsed_at)
+                body = request.body
+                stream_body, body.max_size = self._body_options.get(
+                    handler, (False, self._max_body_size)
+                )
+                if (
+                    body.length is not None
+                    and body.max_size is not None
+                    and body.length > body.max_size
+                ):
+                    # rejected up front, without reading any of it
+                    pending.append(
+                        (request, self._too_large_response(request.proto), None)
                     )
-                except Exception as err:
-                    response_maker = self.build_response_maker(
-                        http_request.proto, keep_alive
+                    break
+
+                if handler in self._websocket_endpoints:
+                    try:
+                        # only sent by requests that aren't upgrades
+                        await body.discard()
+                    except (ValueError, EOFError):
+                        break
+                    request, response, err = await self._handle_request(
+                        request, handler, allowed_methods, keep_alive
                     )
-                    response = response_maker.html(
-                        STATUS_INTERNAL_SERVER_ERROR_500,
-                        "<h1>Internal Server Error</h1>",
+                    upgrade = None
+                    if response.status_code == STATUS_SWITCHING_PROTOCOLS_101:
+                        upgrade = response.payload
+                        response = HTTPResponse(
+                            response.proto, response.status_code, response.headers, None
+                        )
+                    pending.append((request, response, err))
+                    if not await self._flush_responses(writer, pending):
+                        break
+                    if upgrade is None:
+                        continue
+                    if not self._draining:
+                        await self._run_websocket(conn, upgrade, reader, writer)
+                    break
+
+                if pending and not body.is_buffered():
+                    # earlier responses go out before waiting on the payload,
+                    # and before any interim "100 Continue"
+                    if not await self._flush_responses(writer, pending):
+                        break
+
+                if stream_body:
+                    # the handler consumes the payload, so must finish
+                    # before the next message can be read
+                    pending.append(
+                        await self._handle_request(
+                            request, handler, allowed_methods, keep_alive
+                        )
                     )
-                    await self._write_message(writer, response)
-                    raise err
+                    try:
+                        await body.discard()
+                    except (ValueError, EOFError):
+                        # payload was too large or malformed, the
+                        # connection can't be reused
+                        break
                 else:
-                    await self._write_message(writer, response)
+                    try:
+                        request.payload = await body.read() or None
+                    except LimitExceeded:
+                        pending.append(
+                            (request, self._too_large_response(request.proto), None)
+                        )
+                        break
+                    except ValueError as err:
+                        pending.append(
+                            (request, self._read_error_response(err, peer_name), None)
+                        )
+                        break
+                    except EOFError:
+                        self.logger.debug(
+                            "connection from %s closed mid-message", peer_name
+                        )
+                        break
+                    if self._pipeline_concurrent:
+                        pending.append(
+                            asyncio.create_task(
+                                self._handle_request(
+                                    request, handler, allowed_methods, keep_alive
+                                )
+                            )
+                        )
+                    else:
+                        pending.append(
+                            await self._handle_request(
+                                request, handler, allowed_methods, keep_alive
+                            )
+                        )
+
+                # keep parsing requests the client has already pipelined,
+                # writing before the next read would wait on the socket
+                # or once the queue is full
+                if not reader.has_head() or len(pending) >= self._max_pipeline:
+                    if not await self._flush_responses(writer, pending):
+                        break
+
+            await self._flush_responses(writer, pending)
 
         except asyncio.TimeoutError:
-            print(f"connection from {peer_name} timed out")
+            self.logger.debug("connection from %s timed out", peer_name)
+
+        except OSError as err:
+            # the client went away, e.g. mid-stream
+            self.logger.debug("connection from %s lost: %r", peer_name, err)
+
+        except asyncio.CancelledError:
+            if not conn.reaped:
+                raise
+            if hasattr(conn.task, "uncancel"):
+                conn.task.uncancel()
+            self.logger.debug("idle connection from %s closed", peer_name)
 
         finally:
-            writer.close()
-            await writer.wait_closed()
-            print(f"conn closed from {peer_name}")
+            for entry in pending:
+                if not isinstance(entry, tuple):
+                    entry.cancel()
+            try:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except OSError as err:
+                    # unsent data couldn't be written to a lost connection
+                    self.logger.debug("closing conn from %s: %r", peer_name, err)
+                self.logger.debug("conn closed from %s", peer_name)
+                if self._on_conn_close:
+                    now = monotonic()
+                    for hook in self._on_conn_close:
+                        hook(peer_name, now)
+            finally:
+                self._release(conn)
 
     async def start(
         self,
         host="127.0.0.1",
         port=8000,
         ssl=None,
+        reuse_port=False,
+        sock=None,
+        backlog=100,
+        nodelay=None,
+        keepalive=None,
+        recv_buffer=None,
+        send_buffer=None,
+        defer_accept=None,
     ):
+        """
+        Start listening, either on host and port or an already bound sock.
+        Socket options left as None keep the platform default.
+
+        :param reuse_port: bind with SO_REUSEPORT, so several processes can listen
+        :param backlog: queued connections waiting to be accepted
+        :param nodelay: set TCP_NODELAY on each connection
+        :param keepalive: set SO_KEEPALIVE on each connection
+        :param recv_buffer: SO_RCVBUF size in bytes
+        :param send_buffer: SO_SNDBUF size in bytes
+        :param defer_accept: TCP_DEFER_ACCEPT seconds, Linux only
+        """
         if self._server is not None:
             raise Exception("server already running")
 
+        listen_options = []
+        if (nodelay, keepalive, recv_buffer, send_buffer, defer_accept) != (
+            None, None, None, None, None
+        ):
+            self._conn_socket_options, listen_options = _socket_options(
+                nodelay, keepalive, recv_buffer, send_buffer, defer_accept
+            )
+
+        if sock is not None:
+            host, port = sock.getsockname()[:2]
         if ssl is None:
-            print(f"listening on: http://{host}:{port}")
+            self.logger.info("listening on: http://%s:%s", host, port)
         else:
-            print(f"listening on: https://{host}:{port}")
+            self.logger.info("listening on: https://%s:%s", host, port)
 
-        self._server = await asyncio.start_server(
-            self._handle_conn,
-            host=host,
-            port=port,
-            ssl=ssl,
-        )
+        # compile registered routes for fast matching
+        self._router = self._compile_routes()
+        self.logger.start()
+        if self._keep_alive_timeout or self._timeout:
+            self._reaper = asyncio.create_task(self._reap_idle())
+
+        if sock is not None:
+            self._server = await asyncio.start_server(
+                self._handle_conn, sock=sock, ssl=ssl, backlog=backlog
+            )
+        elif reuse_port:
+            # only CPython accepts reuse_port
+            self._server = await asyncio.start_server(
+                self._handle_conn,
+                host=host,
+                port=port,
+                ssl=ssl,
+                backlog=backlog,
+                reuse_port=True,
+            )
+        else:
+            self._server = await asyncio.start_server(
+                self._handle_conn,
+                host=host,
+                port=port,
+                ssl=ssl,
+                backlog=backlog,
+            )
+
+        for listening_sock in getattr(self._server, "sockets", ()):
+            for level, option, value in listen_options:
+                listening_sock.setsockopt(level, option, value)
+
+    async def stop(self, timeout=None):
+        """
+        Stop accepting and drain open connections; idle ones are closed,
+        busy ones are sent "Connection: close" with their next response.
+        Any still open after timeout seconds are closed.
 
-    async def stop(self):
+        :param timeout: defaults to the server's shutdown_timeout
+        """
         if self._server is None:
             raise Exception("server not running")
+        if timeout is None:
+            timeout = self._shutdown_timeout
 
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+
+        deadline = monotonic() + timeout
+        self._draining = True
         self._server.close()
+        for ws in self._websockets:
+            ws.going_away()
+        for conn in list(self._idle):
+            self._reap(conn)
+        if self._connections:
+            self.logger.info("draining %s connections", len(self._connections))
+            self._drained = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._drained.wait(), timeout)
+            except asyncio.TimeoutError:
+                self.logger.warning(
+                    "closing %s connections still open after %ss",
+                    len(self._connections),
+                    timeout,
+                )
+                for conn in list(self._connections):
+                    self._reap(conn)
+            self._drained = None
+        if self._tasks:
+            # reaped connections are still closing
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*self._tasks, return_exceptions=True),
+                    max(deadline - monotonic(), 1),
+                )
+            except asyncio.TimeoutError:
+                self.logger.warning(
+                    "%s connections did not finish closing", len(self._tasks)
+                )
+
         await self._server.wait_closed()
+        self._server = None
+        self._draining = False
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+        await self.logger.close()
+
+    def serve(
+        self,
+        host="127.0.0.1",
+        port=8000,
+        ssl=None,
+        workers=1,
+        loop_factory=None,
+        **start_options,
+    ):
+        """
+        Run the server until interrupted or sent SIGTERM/SIGHUP,
+        blocking the caller, then drain open connections with stop().
+        With several workers SIGHUP replaces them instead, see
+        workers.Supervisor, code is not reloaded either way.
+
+        :param workers: number of processes to fork,
+                        more than one is only supported on CPython
+        :param loop_factory: creates the event loop,
+                             defaults to uvloop when installed
+        :param start_options: passed on to start(), e.g. backlog or nodelay
+        """
+        if loop_factory is None:
+            loop_factory = default_loop_factory
+
+        if workers != 1:
+            from .workers import Supervisor
+
+            Supervisor(
+                self,
+                host,
+                port,
+                ssl,
+                workers,
+                loop_factory=loop_factory,
+                start_options=start_options,
+            ).run()
+            return
+
+        loop = loop_factory()
+        try:
+            loop.run_until_complete(self.start(host, port, ssl, **start_options))
+            _stop_on_signals(loop)
+            try:
+                loop.run_forever()
+            except KeyboardInterrupt:
+                pass
+            # drain connections before exiting
+            loop.run_until_complete(self.stop())
+        finally:
+            loop.close()
@@ -0,0 +1,208 @@
+import asyncio
+
+DEFAULT_MAX_QUEUE = 32
+DEFAULT_HISTORY = 64
+DEFAULT_HEARTBEAT = 15
+# a comment line, ignored by clients but keeps the connection active
+HEARTBEAT = b":\n\n"
+
+
+def format_event(data, event=None, id=None, retry=None):
+    """
+    Encode an event in the text/event-stream format,
+    data with several lines is sent as several data fields
+
+    :param data: str or bytes
+    :param retry: milliseconds clients wait before reconnecting
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    lines = []
+    if id is not None:
+        lines.append(b"id: " + str(id).encode())
+    if event is not None:
+        lines.append(b"event: " + event.encode())
+    if retry is not None:
+        lines.append(b"retry: " + str(int(retry)).encode())
+    for line in data.replace(b"\r\n", b"\n").split(b"\n"):
+        lines.append(b"data: " + line)
+    lines.append(b"\n")
+    return b"\n".join(lines)
+
+
+class Subscription:
+    """
+    One client's queue of encoded events, an async iterator of bytes
+    ending once closed, yielding a heartbeat comment when idle
+    """
+    def __init__(self, hub, backlog) -> None:
+        self._hub = hub
+        self._queue = backlog
+        self._ready = asyncio.Event()
+        self.closed = False
+        # events not queued as the client was too far behind
+        self.skipped = 0
+
+    def put(self, encoded):
+        """
+        :return: False if the client was dropped for being too slow
+        """
+        if self.closed:
+            return False
+        if len(self._queue) >= self._hub.max_queue:
+            if self._hub.drop_slow:
+                # removed from the hub by publish()
+                self.closed = True
+                self._ready.set()
+                return False
+            self.skipped += 1
+            return True
+        self._queue.append(encoded)
+        self._ready.set()
+        return True
+
+    def close(self):
+        """
+        Unsubscribe, ending the stream once queued events are sent
+        """
+        self.closed = True
+        self._hub._subscribers.discard(self)
+        self._ready.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._queue:
+            if self.closed:
+                raise StopAsyncIteration
+            self._ready.clear()
+            heartbeat = self._hub.heartbeat
+            try:
+                if heartbeat:
+                    await asyncio.wait_for(self._ready.wait(), heartbeat)
+                else:
+                    await self._ready.wait()
+            except asyncio.TimeoutError:
+                return HEARTBEAT
+            except asyncio.CancelledError:
+                # the connection is gone
+                self.close()
+                raise
+            if not self._queue:
+                raise StopAsyncIteration
+        queue = self._queue
+        self._queue = []
+        # everything queued goes out as one chunk
+        if len(queue) == 1:
+            return queue[0]
+        return b"".join(queue)
+
+
+class EventHub:
+    """
+    Publishes events to every subscribed Server-Sent Events client,
+    each event is encoded once and queued for each client
+
+    :param max_queue: events queued per client before it counts as slow
+    :param history: recent events kept for Last-Event-ID replay
+    :param heartbeat: seconds between comments sent to idle clients,
+                      None to disable
+    :param drop_slow: close the stream of slow clients, so they reconnect
+                      and catch up from history, rather than skip events
+    :param retry: milliseconds clients wait before reconnecting
+    """
+    def __init__(
+        self,
+        max_queue=DEFAULT_MAX_QUEUE,
+        history=DEFAULT_HISTORY,
+        heartbeat=DEFAULT_HEARTBEAT,
+        drop_slow=True,
+        retry=None,
+    ) -> None:
+        self.max_queue = max_queue
+        self.heartbeat = heartbeat
+        self.drop_slow = drop_slow
+        self.retry = retry
+        self._subscribers = set()
+        # ring buffer of (id, encoded), _history_start is the oldest
+        self._history = [None] * history
+        self._history_start = 0
+        self._history_len = 0
+        self._next_id = 1
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def _remember(self, id, encoded):
+        size = len(self._history)
+        if not size:
+            return
+        if self._history_len < size:
+            i = (self._history_start + self._history_len) % size
+            self._history[i] = (id, encoded)
+            self._history_len += 1
+        else:
+            self._history[self._history_start] = (id, encoded)
+            self._history_start = (self._history_start + 1) % size
+
+    def _replay(self, last_event_id):
+        """
+        :return: encoded events after last_event_id, all of the history
+                 if it is too old to be found
+        """
+        size = len(self._history)
+        events = [
+            self._history[(self._history_start + i) % size]
+            for i in range(self._history_len)
+        ]
+        for i in range(len(events) - 1, -1, -1):
+            if events[i][0] == last_event_id:
+                events = events[i + 1 :]
+                break
+        return [encoded for _, encoded in events]
+
+    def publish(self, data, event=None, id=None):
+        """
+        Send an event to all subscribers
+
+        :param id: defaults to an increasing number
+        :return: the event's id
+        """
+        if id is None:
+            id = str(self._next_id)
+            self._next_id += 1
+        encoded = format_event(data, event, id)
+        self._remember(id, encoded)
+        dropped = None
+        for subscriber in self._subscribers:
+            if not subscriber.put(encoded):
+                if dropped is None:
+                    dropped = []
+                dropped.append(subscriber)
+        if dropped:
+            for subscriber in dropped:
+                self._subscribers.discard(subscriber)
+        return id
+
+    def subscribe(self, last_event_id=None):
+        """
+        :param last_event_id: the client's Last-Event-ID header, events
+                              published since are queued first
+        :return: a Subscription, given to ResponseMaker.sse()
+        """
+        backlog = []
+        if self.retry is not None:
+            backlog.append(b"retry: " + str(int(self.retry)).encode() + b"\n\n")
+        if last_event_id is not None:
+            backlog.extend(self._replay(last_event_id))
+        subscriber = Subscription(self, backlog)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def close(self):
+        """
+        End every subscriber's stream, e.g. before stopping the server
+        """
+        for subscriber in list(self._subscribers):
+            subscriber.close()
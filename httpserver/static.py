@@ -0,0 +1,162 @@
+import os
+
+from .constants import (
+    STATUS_NOT_FOUND_404,
+    STATUS_NOT_MODIFIED_304,
+    STATUS_OK_200,
+)
+from .helpers import LRUCache, accepted_encodings, format_http_date
+
+# {".ext": "type", ...} used when guessing a file's content type
+CONTENT_TYPES = {
+    ".html": "text/html",
+    ".htm": "text/html",
+    ".css": "text/css",
+    ".js": "text/javascript",
+    ".mjs": "text/javascript",
+    ".json": "application/json",
+    ".txt": "text/plain",
+    ".csv": "text/csv",
+    ".xml": "application/xml",
+    ".svg": "image/svg+xml",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".ico": "image/x-icon",
+    ".woff": "font/woff",
+    ".woff2": "font/woff2",
+    ".wasm": "application/wasm",
+    ".pdf": "application/pdf",
+    ".bin": "application/octet-stream",
+}
+
+# (encoding, suffix) for precompressed siblings, in order of preference
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+_S_IFDIR = 0x4000
+
+
+def guess_content_type(path):
+    i = path.rfind(".")
+    if i != -1:
+        content_type = CONTENT_TYPES.get(path[i:].lower())
+        if content_type is not None:
+            return content_type
+    return "application/octet-stream"
+
+
+def _stat(path):
+    """
+    :return: (mode, size, mtime) or None if the path does not exist
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st[0], st[6], int(st[8])
+
+
+def _etag_matches(header, etag):
+    # weak comparison, as used for If-None-Match
+    for value in header.split(","):
+        value = value.strip()
+        if value.startswith("W/"):
+            value = value[2:]
+        if value == "*" or value == etag:
+            return True
+    return False
+
+
+class StaticFiles:
+    """
+    Route handler serving files from a directory, with conditional requests,
+    precompressed ".br"/".gz" siblings and an in-memory cache of small files
+    """
+    def __init__(
+        self,
+        directory,
+        index="index.html",
+        cache_max_size=128 * 1024,
+        cache_max_file_size=16 * 1024,
+        cache_max_entries=64,
+    ) -> None:
+        self._directory = directory.rstrip("/") or "/"
+        self._index = index
+        self._cache_max_file_size = cache_max_file_size
+        # {path: (mtime, content), ...}
+        self._cache = LRUCache(cache_max_entries, cache_max_size)
+
+    def _resolve(self, rel_path):
+        """
+        Map a request path, already percent-decoded by the router,
+        onto the directory, refusing to leave it
+        """
+        segments = rel_path.split("/")
+        for segment in segments:
+            if segment in ("..", ".") or "\\" in segment or "\0" in segment:
+                return None
+        path = self._directory + "/" + "/".join(s for s in segments if s)
+        st = _stat(path)
+        if st is not None and st[0] & _S_IFDIR:
+            if not self._index:
+                return None
+            path = path.rstrip("/") + "/" + self._index
+            st = _stat(path)
+        if st is None or st[0] & _S_IFDIR:
+            return None
+        return path, st
+
+    def _read_cached(self, path, size, mtime):
+        cached = self._cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(path, "rb") as fo:
+            content = fo.read()
+        if len(content) == size:
+            self._cache.set(path, (mtime, content), size)
+        return content
+
+    def __call__(self, ctx):
+        request = ctx.request
+        response = ctx.response
+
+        resolved = self._resolve(request.params.get("path", ""))
+        if resolved is None:
+            return response.html(STATUS_NOT_FOUND_404, "<h1>Page Not Found</h1>")
+        path, (_, size, mtime) = resolved
+        content_type = guess_content_type(path)
+
+        # pick a precompressed sibling if the client accepts it
+        accept_encoding = request.headers.get("Accept-Encoding")
+        if accept_encoding:
+            accepted = accepted_encodings(accept_encoding)
+            for encoding, suffix in PRECOMPRESSED:
+                if encoding in accepted:
+                    st = _stat(path + suffix)
+                    if st is not None and not st[0] & _S_IFDIR:
+                        path, size, mtime = path + suffix, st[1], st[2]
+                        response.set_header("Content-Encoding", encoding)
+                        break
+        response.set_header("Vary", "Accept-Encoding")
+
+        etag = f'"{size:x}-{mtime:x}"'
+        last_modified = format_http_date(mtime)
+        response.set_header("ETag", etag)
+        response.set_header("Last-Modified", last_modified)
+
+        # If-None-Match takes precedence over If-Modified-Since,
+        # the latter is compared exactly as clients echo back Last-Modified
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            if _etag_matches(if_none_match, etag):
+                return response.no_content(STATUS_NOT_MODIFIED_304)
+        elif request.headers.get("If-Modified-Since") == last_modified:
+            return response.no_content(STATUS_NOT_MODIFIED_304)
+
+        if size > self._cache_max_file_size or request.headers.get("Range"):
+            return response.file(path, content_type)
+        return response.content(
+            STATUS_OK_200, content_type, self._read_cached(path, size, mtime)
+        )
@@ -0,0 +1,437 @@
+import asyncio
+
+from .constants import (
+    DEFAULT_MAX_MESSAGE_SIZE,
+    DEFAULT_PING_INTERVAL,
+    HTTP_1_1,
+    METHOD_GET,
+    STATUS_BAD_REQUEST_400,
+    STATUS_SWITCHING_PROTOCOLS_101,
+    STATUS_UPGRADE_REQUIRED_426,
+)
+from .helpers import header_has_token, monotonic, write_parts
+from .response import HTTPResponse
+
+WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_GOING_AWAY = 1001
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_NO_STATUS = 1005
+# the connection was lost without a close frame
+CLOSE_ABNORMAL = 1006
+CLOSE_INVALID_DATA = 1007
+CLOSE_MESSAGE_TOO_BIG = 1009
+CLOSE_INTERNAL_ERROR = 1011
+
+
+class WebSocketClosed(Exception):
+    """
+    Raised when sending on a WebSocket that is closing or closed
+    """
+    def __init__(self, code) -> None:
+        super().__init__(f"websocket closed ({code})")
+        self.code = code
+
+
+class _ProtocolError(Exception):
+    def __init__(self, code, reason) -> None:
+        super().__init__(reason)
+        self.code = code
+
+
+def accept_key(key):
+    """
+    :return: the Sec-WebSocket-Accept value for a Sec-WebSocket-Key
+    """
+    import binascii
+    import hashlib
+
+    digest = hashlib.sha1(key.encode() + WEBSOCKET_GUID).digest()
+    return binascii.b2a_base64(digest).strip().decode()
+
+
+def frame_head(opcode, length, fin=True):
+    """
+    Encode an unmasked frame header, as sent by servers
+    """
+    first = opcode | 0x80 if fin else opcode
+    if length < 126:
+        return bytes((first, length))
+    if length < 65536:
+        return bytes((first, 126)) + length.to_bytes(2, "big")
+    return bytes((first, 127)) + length.to_bytes(8, "big")
+
+
+def unmask(data, mask):
+    """
+    XOR data with the repeating 4 byte mask, as one big integer
+    operation rather than a loop over each byte
+    """
+    n = len(data)
+    if not n:
+        return b""
+    key = (mask * (n // 4 + 1))[:n]
+    return (int.from_bytes(data, "big") ^ int.from_bytes(key, "big")).to_bytes(
+        n, "big"
+    )
+
+
+_PING_FRAME = frame_head(OP_PING, 0)
+
+
+class WebSocket:
+    """
+    The server side of an upgraded connection, given to handlers
+    registered with websocket(). Pings and close frames from the client
+    are answered while receiving; the client is pinged by the server
+    after ping_interval seconds without hearing from it.
+    """
+    def __init__(
+        self,
+        reader,
+        writer,
+        max_message_size=DEFAULT_MAX_MESSAGE_SIZE,
+        ping_interval=DEFAULT_PING_INTERVAL,
+        protocol=None,
+        timeout=5,
+    ) -> None:
+        self._reader = reader
+        self._writer = writer
+        self.max_message_size = max_message_size
+        self.ping_interval = ping_interval
+        # the negotiated Sec-WebSocket-Protocol, or None
+        self.protocol = protocol
+        self._timeout = timeout
+        # set once a close frame was sent or the connection was lost
+        self.closed = False
+        # the close code sent, or received from the client
+        self.close_code = None
+        # no more frames will arrive
+        self._input_done = False
+        # a send is draining the writer
+        self._sending = False
+        # frames are only read while the handler is receiving
+        self._receiving = False
+        self._last_seen = monotonic()
+        self._ping_sent_at = None
+
+    async def _read_payload(self, length):
+        reader = self._reader
+        parts = []
+        while length:
+            chunk = await reader.read(length)
+            if not chunk:
+                raise EOFError("connection closed mid-frame")
+            parts.append(chunk)
+            length -= len(chunk)
+        return b"".join(parts)
+
+    async def _read_frame(self, limit):
+        """
+        :return: (fin, opcode, payload) of the next frame, raising
+                 _ProtocolError for invalid ones or over limit bytes
+        """
+        reader = self._reader
+        head = await reader.readexactly(2)
+        first = head[0]
+        second = head[1]
+        if first & 0x70:
+            # no extensions are negotiated
+            raise _ProtocolError(CLOSE_PROTOCOL_ERROR, "reserved bits set")
+        if not second & 0x80:
+            raise _ProtocolError(CLOSE_PROTOCOL_ERROR, "unmasked client frame")
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if opcode >= OP_CLOSE:
+            if length > 125 or not first & 0x80:
+                raise _ProtocolError(CLOSE_PROTOCOL_ERROR, "invalid control frame")
+        elif length == 126:
+            length = int.from_bytes(await reader.readexactly(2), "big")
+        elif length == 127:
+            length = int.from_bytes(await reader.readexactly(8), "big")
+        if opcode < OP_CLOSE and length > limit:
+            # rejected before reading any of it
+            raise _ProtocolError(CLOSE_MESSAGE_TOO_BIG, "message too big")
+        mask = await reader.readexactly(4)
+        payload = unmask(await self._read_payload(length), mask)
+        self._last_seen = monotonic()
+        return first & 0x80, opcode, payload
+
+    async def _send_frame(self, opcode, payload=b""):
+        if payload:
+            write_parts(self._writer, (frame_head(opcode, len(payload)), payload))
+        else:
+            self._writer.write(frame_head(opcode, 0))
+        if self._sending:
+            # already being drained by another send
+            return
+        self._sending = True
+        try:
+            await self._writer.drain()
+        finally:
+            self._sending = False
+
+    async def _send_close(self, code, reason=""):
+        self.closed = True
+        if self.close_code is None:
+            self.close_code = code
+        payload = b""
+        if code != CLOSE_NO_STATUS:
+            payload = code.to_bytes(2, "big") + reason.encode()
+        try:
+            await self._send_frame(OP_CLOSE, payload)
+        except OSError:
+            pass
+
+    async def _close_received(self, payload):
+        self._input_done = True
+        if len(payload) == 1:
+            code = CLOSE_PROTOCOL_ERROR
+        elif payload:
+            code = int.from_bytes(payload[:2], "big")
+        else:
+            code = CLOSE_NO_STATUS
+        if not self.closed:
+            # echo the client's code back
+            self.close_code = code
+            await self._send_close(code)
+
+    async def receive(self):
+        """
+        Wait for the next message, reassembling fragmented ones
+
+        :return: str for text messages, bytes for binary ones,
+                 None once the connection is closed
+        """
+        if self._input_done:
+            return None
+        parts = []
+        size = 0
+        message_opcode = None
+        self._receiving = True
+        try:
+            while True:
+                fin, opcode, payload = await self._read_frame(
+                    self.max_message_size - size
+                )
+                if opcode == OP_PING:
+                    if not self.closed:
+                        await self._send_frame(OP_PONG, payload)
+                    continue
+                if opcode == OP_PONG:
+                    continue
+                if opcode == OP_CLOSE:
+                    await self._close_received(payload)
+                    return None
+                if opcode == OP_CONTINUATION:
+                    if message_opcode is None:
+                        raise _ProtocolError(
+                            CLOSE_PROTOCOL_ERROR, "unexpected continuation frame"
+                        )
+                elif opcode == OP_TEXT or opcode == OP_BINARY:
+                    if message_opcode is not None:
+                        raise _ProtocolError(
+                            CLOSE_PROTOCOL_ERROR, "expected continuation frame"
+                        )
+                    message_opcode = opcode
+                else:
+                    raise _ProtocolError(CLOSE_PROTOCOL_ERROR, "unknown opcode")
+                if payload:
+                    parts.append(payload)
+                    size += len(payload)
+                if fin:
+                    break
+        except _ProtocolError as err:
+            self._input_done = True
+            if not self.closed:
+                await self._send_close(err.code)
+            return None
+        except (EOFError, OSError):
+            self._input_done = True
+            self.closed = True
+            if self.close_code is None:
+                self.close_code = CLOSE_ABNORMAL
+            return None
+        finally:
+            self._receiving = False
+
+        data = b"".join(parts)
+        if message_opcode == OP_TEXT:
+            try:
+                return data.decode()
+            except UnicodeError:
+                self._input_done = True
+                if not self.closed:
+                    await self._send_close(CLOSE_INVALID_DATA)
+                return None
+        return data
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.receive()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    async def send(self, data):
+        """
+        Send a message, str as text and bytes as binary
+
+        :raises WebSocketClosed: once closing
+        """
+        if self.closed:
+            raise WebSocketClosed(self.close_code)
+        if isinstance(data, str):
+            await self._send_frame(OP_TEXT, data.encode())
+        else:
+            await self._send_frame(OP_BINARY, data)
+
+    async def ping(self, data=b""):
+        if self.closed:
+            raise WebSocketClosed(self.close_code)
+        await self._send_frame(OP_PING, data)
+
+    async def close(self, code=CLOSE_NORMAL, reason=""):
+        """
+        Send a close frame, if not already sent, then wait up to the
+        server's timeout for the client's, discarding any messages
+        """
+        if not self.closed:
+            await self._send_close(code, reason)
+        try:
+            while not self._input_done:
+                opcode = (
+                    await asyncio.wait_for(
+                        self._read_frame(self.max_message_size), self._timeout
+                    )
+                )[1]
+                if opcode == OP_CLOSE:
+                    self._input_done = True
+        except (asyncio.TimeoutError, EOFError, OSError, _ProtocolError):
+            self._input_done = True
+
+    def going_away(self):
+        """
+        Start closing with 1001 as the server is stopping,
+        without waiting on the write
+        """
+        if not self.closed:
+            self.closed = True
+            self.close_code = CLOSE_GOING_AWAY
+            self._writer.write(
+                frame_head(OP_CLOSE, 2) + CLOSE_GOING_AWAY.to_bytes(2, "big")
+            )
+
+    def keepalive(self, now):
+        """
+        Called by the server's reaper, pings the client
+        once it has been quiet for ping_interval
+
+        :return: False if a ping went unanswered for ping_interval
+                 while the handler was receiving
+        """
+        interval = self.ping_interval
+        if self.closed or not interval or now - self._last_seen < interval:
+            return True
+        ping_pending = (
+            self._ping_sent_at is not None and self._ping_sent_at >= self._last_seen
+        )
+        if ping_pending and now - self._ping_sent_at < interval:
+            return True
+        if ping_pending and self._receiving:
+            return False
+        # handlers only sending never read the pong, pinging still
+        # keeps intermediaries from dropping the connection
+        self._ping_sent_at = now
+        if not self._sending:
+            # the frame is small enough to not need draining
+            self._writer.write(_PING_FRAME)
+        return True
+
+
+class WebSocketUpgrade:
+    """
+    Payload of a 101 response from a websocket route,
+    the server runs the handler once the response is written
+    """
+    def __init__(self, handler, ctx, protocol, max_message_size, ping_interval) -> None:
+        self.handler = handler
+        self.ctx = ctx
+        self.protocol = protocol
+        self.max_message_size = max_message_size
+        self.ping_interval = ping_interval
+
+    def accept(self, reader, writer, timeout):
+        return WebSocket(
+            reader,
+            writer,
+            self.max_message_size,
+            self.ping_interval,
+            self.protocol,
+            timeout,
+        )
+
+
+def handshake(
+    ctx,
+    handler,
+    subprotocols=(),
+    max_message_size=DEFAULT_MAX_MESSAGE_SIZE,
+    ping_interval=DEFAULT_PING_INTERVAL,
+):
+    """
+    Validate an upgrade request
+
+    :return: a 101 response with a WebSocketUpgrade payload, or
+             426 for plain requests and 400 for malformed upgrades
+    """
+    request = ctx.request
+    response = ctx.response
+    headers = request.headers
+    if (
+        request.method != METHOD_GET
+        or not header_has_token(headers.get("Upgrade", ""), "websocket")
+        or not header_has_token(headers.get("Connection", ""), "upgrade")
+    ):
+        response.set_header("Upgrade", "websocket")
+        return response.html(STATUS_UPGRADE_REQUIRED_426, "<h1>Upgrade Required</h1>")
+    if headers.get("Sec-WebSocket-Version", "").strip() != "13":
+        response.set_header("Sec-WebSocket-Version", "13")
+        return response.html(STATUS_UPGRADE_REQUIRED_426, "<h1>Upgrade Required</h1>")
+    key = headers.get("Sec-WebSocket-Key", "").strip()
+    if request.proto != HTTP_1_1 or len(key) != 24:
+        return response.html(STATUS_BAD_REQUEST_400, "<h1>Bad Request</h1>")
+
+    protocol = None
+    if subprotocols:
+        offered = [
+            value.strip()
+            for value in headers.get("Sec-WebSocket-Protocol", "").split(",")
+        ]
+        for subprotocol in subprotocols:
+            if subprotocol in offered:
+                protocol = subprotocol
+                break
+
+    response.set_header("Upgrade", "websocket")
+    response.set_header("Connection", "Upgrade")
+    response.set_header("Sec-WebSocket-Accept", accept_key(key))
+    if protocol is not None:
+        response.set_header("Sec-WebSocket-Protocol", protocol)
+    switching = response.no_content(STATUS_SWITCHING_PROTOCOLS_101)
+    return HTTPResponse(
+        switching.proto,
+        switching.status_code,
+        switching.headers,
+        WebSocketUpgrade(handler, ctx, protocol, max_message_size, ping_interval),
+    )
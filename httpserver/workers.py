@@ -0,0 +1,282 @@
+"""
+Multi-process serving for CPython, not available on MicroPython
+"""
+import asyncio
+import json
+import os
+import select
+import signal
+import socket
+import time
+import traceback
+
+# reported stats that aren't running totals, so aren't kept once a worker exits
+_GAUGES = ("pid", "active_connections")
+
+
+class Supervisor:
+    """
+    Forks worker processes that each run the server on their own event loop,
+    restarting any that crash and passing on shutdown signals.
+    SIGHUP replaces the workers one at a time, each old one draining
+    its connections while its replacement accepts new ones.
+
+    Replacements are forked from the supervisor, so they start from fresh
+    worker state but run the code and config it was started with, to
+    deploy changes restart the supervisor itself (SIGTERM drains it).
+
+    Workers bind with SO_REUSEPORT where supported, otherwise
+    they share a listening socket created before forking.
+    """
+    def __init__(
+        self,
+        server,
+        host="127.0.0.1",
+        port=8000,
+        ssl=None,
+        workers=None,
+        reuse_port=None,
+        stats_interval=5.0,
+        restart_delay=1.0,
+        loop_factory=asyncio.new_event_loop,
+        start_options=None,
+    ) -> None:
+        self._server = server
+        self._host = host
+        self._port = port
+        self._ssl = ssl
+        self._workers = workers or os.cpu_count() or 1
+        # passed on to HTTPServer.start(), e.g. backlog or nodelay
+        start_options = dict(start_options or {})
+        if "reuse_port" in start_options:
+            # e.g. given to serve(), decided here as workers may share a socket
+            option = start_options.pop("reuse_port")
+            if reuse_port is None:
+                reuse_port = option
+        if reuse_port is None:
+            reuse_port = hasattr(socket, "SO_REUSEPORT")
+        self._reuse_port = reuse_port
+        self._stats_interval = stats_interval
+        self._restart_delay = restart_delay
+        self._loop_factory = loop_factory
+        self._start_options = start_options
+        self._sock = None
+        self._stopping = False
+        self._reloading = False
+        # {pid, ...} replaced workers left to drain, not restarted on exit
+        self._retiring = set()
+        # {pid: (index, read_fd), ...}
+        self._children = {}
+        # {pid: {"pid": ..., "requests": ..., ...}, ...} last report from each worker
+        self.worker_stats = {}
+        # {"requests": ..., ...} running totals of workers that have exited
+        self._exited_stats = {}
+
+    @property
+    def stats(self):
+        """
+        Totals of the latest stats reported by each worker, counters
+        include workers that have since exited so never go backwards
+        """
+        totals = dict(self._exited_stats)
+        totals["workers"] = len(self._children)
+        for worker_stats in self.worker_stats.values():
+            for key, value in worker_stats.items():
+                if key != "pid":
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def _parse_stats(self, pid, data):
+        for line in data.splitlines():
+            try:
+                self.worker_stats[pid] = json.loads(line)
+            except ValueError:
+                pass
+
+    def _worker_exited(self, pid, read_fd):
+        """
+        Read a worker's final report and keep its counters
+        """
+        while True:
+            data = os.read(read_fd, 65536)
+            if not data:
+                break
+            self._parse_stats(pid, data)
+        os.close(read_fd)
+        for key, value in self.worker_stats.pop(pid, {}).items():
+            if key not in _GAUGES:
+                self._exited_stats[key] = self._exited_stats.get(key, 0) + value
+
+    def _bind(self):
+        family = socket.AF_INET6 if ":" in self._host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self._host, self._port))
+        sock.listen(self._start_options.get("backlog", 100))
+        sock.setblocking(False)
+        return sock
+
+    async def _worker_main(self, stats_fd):
+        server = self._server
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+
+        stats = {"pid": os.getpid(), "requests": 0, "connections": 0, "active_connections": 0}
+
+        def conn_open(peer_name, timestamp):
+            stats["connections"] += 1
+            stats["active_connections"] += 1
+
+        def conn_close(peer_name, timestamp):
+            stats["active_connections"] -= 1
+
+        def response_written(request, response, timestamp):
+            stats["requests"] += 1
+
+        server.on_conn_open(conn_open)
+        server.on_conn_close(conn_close)
+        server.on_response_written(response_written)
+
+        if self._sock is not None:
+            await server.start(ssl=self._ssl, sock=self._sock, **self._start_options)
+        else:
+            await server.start(
+                self._host, self._port, self._ssl, reuse_port=True, **self._start_options
+            )
+        try:
+            while not stop.is_set():
+                try:
+                    await asyncio.wait_for(stop.wait(), self._stats_interval)
+                except asyncio.TimeoutError:
+                    pass
+                os.write(stats_fd, json.dumps(stats).encode() + b"\n")
+        finally:
+            await server.stop()
+            # including requests finished while draining
+            os.write(stats_fd, json.dumps(stats).encode() + b"\n")
+
+    def _spawn(self, index):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # worker process
+            os.close(read_fd)
+            for _, sibling_fd in self._children.values():
+                os.close(sibling_fd)
+            self._children = {}
+            # the terminal sends SIGINT to the whole group, only the supervisor acts on it
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            code = 0
+            loop = self._loop_factory()
+            try:
+                loop.run_until_complete(self._worker_main(write_fd))
+            except BaseException:
+                code = 1
+                traceback.print_exc()
+            finally:
+                loop.close()
+            os._exit(code)
+        os.close(write_fd)
+        self._children[pid] = (index, read_fd)
+        self._server.logger.debug("started worker %s with pid %s", index, pid)
+
+    def _read_stats(self, timeout):
+        fds = {read_fd: pid for pid, (_, read_fd) in self._children.items()}
+        if not fds:
+            time.sleep(timeout)
+            return
+        ready, _, _ = select.select(list(fds), [], [], timeout)
+        for fd in ready:
+            self._parse_stats(fds[fd], os.read(fd, 65536))
+
+    def _reap(self):
+        while self._children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            index, read_fd = self._children.pop(pid, (None, None))
+            if index is None:
+                continue
+            self._worker_exited(pid, read_fd)
+            if pid in self._retiring:
+                self._retiring.discard(pid)
+                continue
+            if not self._stopping:
+                self._server.logger.warning(
+                    "worker %s (pid %s) exited with status %s, restarting",
+                    index, pid, status,
+                )
+                # avoid spinning if workers crash straight away
+                time.sleep(self._restart_delay)
+                self._spawn(index)
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+
+    def _reload(self, signum, frame):
+        self._reloading = True
+
+    def _replace_workers(self):
+        """
+        Start a new worker for each running one, then ask the old to drain,
+        nothing is reloaded as the new ones are forked from this process
+        """
+        self._server.logger.info("replacing %s workers", len(self._children))
+        for pid, (index, _) in list(self._children.items()):
+            if pid in self._retiring:
+                continue
+            self._spawn(index)
+            self._retiring.add(pid)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        """
+        Start the workers and block until SIGINT or SIGTERM, then stop them,
+        waiting for each to drain its connections
+        """
+        if not self._reuse_port:
+            self._sock = self._bind()
+        previous_handlers = (
+            signal.signal(signal.SIGINT, self._stop),
+            signal.signal(signal.SIGTERM, self._stop),
+            signal.signal(signal.SIGHUP, self._reload),
+        )
+        try:
+            self._server.logger.info(
+                "starting %s workers on: %s:%s", self._workers, self._host, self._port
+            )
+            for index in range(self._workers):
+                self._spawn(index)
+            last_report = time.monotonic()
+            while not self._stopping:
+                if self._reloading:
+                    self._reloading = False
+                    self._replace_workers()
+                self._read_stats(0.5)
+                self._reap()
+                if time.monotonic() - last_report >= self._stats_interval:
+                    last_report = time.monotonic()
+                    self._server.logger.debug("worker stats: %s", self.stats)
+        finally:
+            self._stopping = True
+            for pid in self._children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            while self._children:
+                pid, _ = os.waitpid(-1, 0)
+                _, read_fd = self._children.pop(pid, (None, None))
+                if read_fd is not None:
+                    self._worker_exited(pid, read_fd)
+            signal.signal(signal.SIGINT, previous_handlers[0])
+            signal.signal(signal.SIGTERM, previous_handlers[1])
+            signal.signal(signal.SIGHUP, previous_handlers[2])
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
@@ -1,5 +1,4 @@
 import asyncio
-from time import sleep
 
 from httpserver import HTTPServer
 from httpserver.constants import STATUS_OK_200
@@ -24,14 +23,27 @@ def get_index(ctx):
     )
 
 
+class MyStream:
+    # async generators are not available on MicroPython,
+    # so an async iterator is written out in full
+    def __init__(self, count):
+        self._i = 0
+        self._count = count
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._i >= self._count:
+            raise StopAsyncIteration
+        await asyncio.sleep(0.01)
+        self._i += 1
+        return "Hello '{0}'\n".format(self._i - 1).encode()
+
+
 @server.route("/stream")
 def get_stream(ctx):
-    def my_stream():
-        for i in range(100):
-            yield "Hello '{0}'\n".format(i).encode()
-            sleep(0.01)
-
-    return ctx.response.content_stream(STATUS_OK_200, "text/plain", my_stream())
+    return ctx.response.content_stream(STATUS_OK_200, "text/plain", MyStream(100))
 
 
 @server.route("/LICENSE.txt")
@@ -45,7 +57,7 @@ def post_name(ctx):
     return ctx.response.html(STATUS_OK_200, f"<h1>Hello {form['name']}!</h1>")
 
 
-@server.route("/api")
+@server.route("/api", cache_ttl=5)
 def get_api_index(ctx):
     return ctx.response.json(STATUS_OK_200, {"message": "Hello World!"})
 
@@ -56,11 +68,4 @@ def post_api_name(ctx):
     return ctx.response.json(STATUS_OK_200, {"message": f"Hello {form['name']}!"})
 
 
-loop = asyncio.new_event_loop()
-try:
-    loop.run_until_complete(server.start("127.0.0.1", 8000))
-    loop.run_forever()
-except KeyboardInterrupt:
-    loop.run_until_complete(server.stop())
-finally:
-    loop.close()
+server.serve("127.0.0.1", 8000)
@@ -0,0 +1,101 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from httpserver.cache import ResponseCache
+from httpserver.response import RawResponse, ResponseMaker
+from httpserver.server import HandlerContext
+
+
+class FakeRequest:
+    def __init__(self, path="/", query_string="", method="GET", headers=None):
+        self.method = method
+        self.path = path
+        self.query_string = query_string
+        self.headers = headers or {}
+
+
+def make_ctx(request):
+    return HandlerContext(
+        request, ResponseMaker("HTTP/1.1", {"Connection": "keep-alive"}), {}
+    )
+
+
+class TestResponseCache(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.calls = 0
+
+    async def handler(self, ctx):
+        self.calls += 1
+        await asyncio.sleep(0)
+        return ctx.response.text(200, f"{ctx.request.path} {self.calls}")
+
+    async def test_hit(self):
+        cache = ResponseCache()
+        endpoint = cache.wrap(self.handler, 5)
+        first = await endpoint(make_ctx(FakeRequest()))
+        second = await endpoint(make_ctx(FakeRequest()))
+        self.assertEqual(b"/ 1", first.payload)
+        self.assertIsInstance(second.payload, RawResponse)
+        self.assertTrue(
+            second.payload.render("HTTP/1.1", "close").endswith(b"\r\n\r\n/ 1")
+        )
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    async def test_request_headers_not_cached(self):
+        endpoint = ResponseCache().wrap(self.handler, 5)
+        for i in range(3):
+            ctx = make_ctx(FakeRequest())
+            # as set by middleware before calling the endpoint
+            ctx.response.set_header("X-Request-Id", str(i))
+            response = await endpoint(ctx)
+        rendered = response.payload.render_with("HTTP/1.1", response.headers)
+        self.assertIn(b"\r\nX-Request-Id: 2\r\n", rendered)
+        self.assertEqual(1, rendered.count(b"X-Request-Id"))
+        self.assertEqual(1, self.calls)
+
+    async def test_keyed_by_query_and_vary(self):
+        endpoint = ResponseCache().wrap(self.handler, 5, ("Accept-Language",))
+        for request in (
+            FakeRequest(),
+            FakeRequest(query_string="a=1"),
+            FakeRequest(headers={"Accept-Language": "en"}),
+            FakeRequest(headers={"Accept-Language": "en"}),
+        ):
+            await endpoint(make_ctx(request))
+        self.assertEqual(3, self.calls)
+
+    async def test_expires(self):
+        endpoint = ResponseCache().wrap(self.handler, 0.01)
+        await endpoint(make_ctx(FakeRequest()))
+        await asyncio.sleep(0.02)
+        await endpoint(make_ctx(FakeRequest()))
+        self.assertEqual(2, self.calls)
+
+    async def test_bounded(self):
+        cache = ResponseCache(max_entries=2)
+        endpoint = cache.wrap(self.handler, 5)
+        for path in ("/a", "/b", "/a", "/c", "/a", "/b"):
+            await endpoint(make_ctx(FakeRequest(path)))
+        # /b was least recently used when /c was added
+        self.assertEqual(4, self.calls)
+        self.assertEqual(2, len(cache))
+
+    async def test_single_flight(self):
+        cache = ResponseCache()
+        endpoint = cache.wrap(self.handler, 5)
+        responses = await asyncio.gather(
+            *(endpoint(make_ctx(FakeRequest())) for _ in range(10))
+        )
+        self.assertEqual(1, self.calls)
+        self.assertEqual(9, cache.hits)
+        self.assertEqual(b"/ 1", responses[0].payload)
+
+    async def test_uncacheable(self):
+        async def handler(ctx):
+            self.calls += 1
+            ctx.response.set_header("Set-Cookie", "a=1")
+            return ctx.response.text(200, "private")
+
+        endpoint = ResponseCache().wrap(handler, 5)
+        await asyncio.gather(*(endpoint(make_ctx(FakeRequest())) for _ in range(3)))
+        self.assertEqual(3, self.calls)
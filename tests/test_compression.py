@@ -0,0 +1,98 @@
+import gzip
+import zlib
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from httpserver.compression import Compression
+from httpserver.response import HTTPResponse, ResponseStream
+
+from .test_response import FakeWriter, decode_chunked
+
+
+class FakeRequest:
+    def __init__(self, accept_encoding=None):
+        self.headers = {}
+        if accept_encoding is not None:
+            self.headers["Accept-Encoding"] = accept_encoding
+
+
+def make_response(payload, content_type="text/html", **headers):
+    headers["Content-Type"] = content_type
+    if not isinstance(payload, ResponseStream):
+        headers["Content-Length"] = str(len(payload))
+    return HTTPResponse("HTTP/1.1", 200, headers, payload)
+
+
+class TestCompression(TestCase):
+    payload = b"<p>hello world</p>" * 100
+
+    def test_gzip(self):
+        response = Compression().apply(
+            FakeRequest("deflate, gzip;q=0.5"), make_response(self.payload, ETag='"1"')
+        )
+        self.assertEqual("gzip", response.headers["Content-Encoding"])
+        self.assertEqual("Accept-Encoding", response.headers["Vary"])
+        self.assertEqual('W/"1"', response.headers["ETag"])
+        self.assertEqual(str(len(response.payload)), response.headers["Content-Length"])
+        self.assertEqual(self.payload, gzip.decompress(response.payload))
+
+    def test_deflate(self):
+        response = Compression().apply(
+            FakeRequest("deflate, gzip;q=0"), make_response(self.payload)
+        )
+        self.assertEqual("deflate", response.headers["Content-Encoding"])
+        self.assertEqual(self.payload, zlib.decompress(response.payload))
+
+    def test_not_accepted(self):
+        response = Compression().apply(
+            FakeRequest("br"), make_response(self.payload, Vary="Origin")
+        )
+        self.assertEqual(self.payload, response.payload)
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual("Origin, Accept-Encoding", response.headers["Vary"])
+
+    def test_skipped(self):
+        compression = Compression(min_size=100)
+        for response in (
+            make_response(b"small"),
+            make_response(self.payload, "image/png"),
+            make_response(self.payload, **{"Content-Encoding": "br"}),
+        ):
+            with self.subTest(headers=response.headers):
+                self.assertIs(response, compression.apply(FakeRequest("gzip"), response))
+        response = compression.apply(
+            FakeRequest("gzip"), make_response(self.payload, "image/svg+xml")
+        )
+        self.assertEqual("gzip", response.headers["Content-Encoding"])
+
+
+class TestCompressedStream(IsolatedAsyncioTestCase):
+    async def test_chunks_decodable_as_sent(self):
+        async def source():
+            yield b"first "
+            yield b"second"
+
+        response = Compression().apply(
+            FakeRequest("gzip"),
+            make_response(ResponseStream(source(), flush_interval=0)),
+        )
+        self.assertEqual("gzip", response.headers["Content-Encoding"])
+        writer = FakeWriter()
+        await response.payload.write_to(writer)
+        chunks = decode_chunked(b"".join(writer.writes))
+        decompressor = zlib.decompressobj(31)
+        # each source chunk can be decoded without waiting on the next
+        self.assertEqual(b"first ", decompressor.decompress(chunks[0]))
+        self.assertEqual(b"second", decompressor.decompress(b"".join(chunks[1:])))
+        self.assertTrue(decompressor.eof)
+
+    async def test_small_chunks_coalesced(self):
+        lines = [b"line %d of the stream\n" % i for i in range(2000)]
+        response = Compression().apply(
+            FakeRequest("gzip"), make_response(ResponseStream(iter(lines)))
+        )
+        writer = FakeWriter()
+        await response.payload.write_to(writer)
+        compressed = b"".join(decode_chunked(b"".join(writer.writes)))
+        self.assertEqual(b"".join(lines), gzip.decompress(compressed))
+        # flushed per HTTP chunk, not per source chunk
+        self.assertLess(len(compressed), len(b"".join(lines)) // 3)
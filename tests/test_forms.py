@@ -0,0 +1,77 @@
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from httpserver.forms import MultipartParser, UrlEncodedParser, parse_header_params
+from httpserver.request import BytesBody
+
+
+class SlowBody(BytesBody):
+    """
+    Hands out the payload a few bytes at a time, to split fields across reads
+    """
+    async def read_chunk(self, n=3):
+        return await super().read_chunk(3)
+
+
+class TestParseHeaderParams(TestCase):
+    def test_params(self):
+        self.assertEqual(
+            ("form-data", {"name": "file", "filename": "a.txt"}),
+            parse_header_params('form-data; name="file"; filename="a.txt"'),
+        )
+
+    def test_boundary(self):
+        self.assertEqual(
+            ("multipart/form-data", {"boundary": "xyz"}),
+            parse_header_params("Multipart/Form-Data; boundary=xyz"),
+        )
+
+
+class TestUrlEncodedParser(IsolatedAsyncioTestCase):
+    async def test_fields(self):
+        parser = UrlEncodedParser(SlowBody(b"name=Leo+S&admin=1&&note=%21"))
+        fields = [field async for field in parser]
+        self.assertEqual(
+            [("name", b"Leo S"), ("admin", b"1"), ("note", b"!")], fields
+        )
+
+    async def test_invalid_utf8_name(self):
+        parser = UrlEncodedParser(SlowBody(b"%ff=1&\xff=2"))
+        fields = [field async for field in parser]
+        self.assertEqual([("%ff", b"1"), ("\xff", b"2")], fields)
+
+
+class TestMultipartParser(IsolatedAsyncioTestCase):
+    payload = (
+        b"preamble\r\n"
+        b"--xyz\r\n"
+        b'Content-Disposition: form-data; name="title"\r\n'
+        b"\r\n"
+        b"hello\r\n"
+        b"--xyz\r\n"
+        b'Content-Disposition: form-data; name="file"; filename="a.txt"\r\n'
+        b"Content-Type: text/plain\r\n"
+        b"\r\n"
+        b"line one\r\n--xy line two\r\n"
+        b"--xyz--\r\n"
+    )
+
+    async def test_parts(self):
+        parts = []
+        async for part in MultipartParser(SlowBody(self.payload), b"xyz"):
+            parts.append((part.name, part.filename, part.content_type, await part.read()))
+        self.assertEqual(
+            [
+                ("title", None, "text/plain", b"hello"),
+                ("file", "a.txt", "text/plain", b"line one\r\n--xy line two"),
+            ],
+            parts,
+        )
+
+    async def test_unread_parts_skipped(self):
+        names = [part.name async for part in MultipartParser(BytesBody(self.payload), b"xyz")]
+        self.assertEqual(["title", "file"], names)
+
+    async def test_truncated(self):
+        with self.assertRaises(ValueError):
+            async for part in MultipartParser(BytesBody(self.payload[:-12]), b"xyz"):
+                await part.read()
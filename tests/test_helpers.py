@@ -1,5 +1,5 @@
 from collections import OrderedDict
-from unittest import TestCase
+from unittest import IsolatedAsyncioTestCase, TestCase
 
 from httpserver import helpers
 
@@ -19,6 +19,17 @@ class TestPercentDecode(TestCase):
 
         self.assertEqual(expected, actual)
 
+    def test_bytes_and_memoryview(self):
+        v = b"%E2%9C%93+ok%2b"
+        expected = "\u2713 ok+".encode()
+        self.assertEqual(expected, helpers.perc_decode(v, True))
+        self.assertEqual(expected, helpers.perc_decode(memoryview(v), True))
+
+    def test_malformed_kept(self):
+        self.assertEqual(b"100%", helpers.perc_decode("100%"))
+        self.assertEqual(b"%zz%4", helpers.perc_decode("%zz%4"))
+        self.assertEqual(b"%A", helpers.perc_decode("%%41"))
+
 
 class TestProcessQueryString(TestCase):
     def test_valid(self):
@@ -32,6 +43,26 @@ class TestProcessQueryString(TestCase):
                 actual = helpers.process_query_string(query_string)
                 self.assertEqual(expected, actual)
 
+    def test_missing_values(self):
+        query = helpers.process_query_string("debug&name=&&a%20b=c")
+        self.assertEqual(["debug", "name", "a b"], list(query))
+        self.assertEqual(b"", query["debug"])
+        self.assertEqual(b"c", query["a b"])
+
+    def test_invalid_utf8_key(self):
+        query = helpers.process_query_string("%ff=1&a%20b=%ff")
+        self.assertEqual([("%ff", b"1"), ("a b", b"\xff")], query.multi_items())
+
+    def test_repeated_keys(self):
+        query = helpers.process_query_string(b"tag=a&id=1&tag=b")
+        self.assertEqual(b"b", query["tag"])
+        self.assertEqual([b"a", b"b"], query.getall("tag"))
+        self.assertEqual([], query.getall("missing"))
+        self.assertIsNone(query.get("missing"))
+        self.assertEqual(
+            [("tag", b"a"), ("tag", b"b"), ("id", b"1")], query.multi_items()
+        )
+
 
 class TestSeperatePathAndQueries(TestCase):
     def test_valid(self):
@@ -41,8 +72,158 @@ class TestSeperatePathAndQueries(TestCase):
             ("/?q=", ("/", OrderedDict([("q", b"")]))),
             ("/?name=Leo", ("/", OrderedDict([("name", b"Leo")]))),
             ("/hello-world?name=Leo&admin=1", ("/hello-world", OrderedDict([("name", b"Leo"), ("admin", b"1")]))),
+            ("/?next=/a?b=1", ("/", OrderedDict([("next", b"/a?b=1")]))),
         )
         for path, expected in test_values:
             with self.subTest(path=path, expected=expected):
                 actual = helpers.seperate_path_and_query(path)
                 self.assertEqual(expected, actual)
+
+
+class FakeReader:
+    def __init__(self, *blocks):
+        self._blocks = list(blocks)
+
+    async def read(self, n):
+        if not self._blocks:
+            return b""
+        return self._blocks.pop(0)
+
+
+class TestBufferedReader(IsolatedAsyncioTestCase):
+    async def test_read_head_split_blocks(self):
+        reader = helpers.BufferedReader(
+            FakeReader(b"GET / HTTP/1.1\r\nHo", b"st: a\r\n", b"\r\nbody")
+        )
+        head = await reader.read_head(1024)
+        self.assertEqual(b"GET / HTTP/1.1\r\nHost: a\r\n\r\n", head)
+        self.assertEqual(b"body", await reader.readexactly(4))
+
+    async def test_read_head_pipelined(self):
+        reader = helpers.BufferedReader(
+            FakeReader(b"GET /a HTTP/1.1\r\n\r\nGET /b HTTP/1.1\r\n\r\n")
+        )
+        self.assertEqual(b"GET /a HTTP/1.1\r\n\r\n", await reader.read_head(1024))
+        self.assertEqual(b"GET /b HTTP/1.1\r\n\r\n", await reader.read_head(1024))
+        self.assertEqual(b"", await reader.read_head(1024))
+
+    async def test_read_head_skips_empty_lines(self):
+        reader = helpers.BufferedReader(FakeReader(b"\r\n\r\nGET / HTTP/1.1\r\n\r\n"))
+        self.assertEqual(b"GET / HTTP/1.1\r\n\r\n", await reader.read_head(1024))
+
+    async def test_has_head(self):
+        reader = helpers.BufferedReader(
+            FakeReader(b"GET /a HTTP/1.1\r\n\r\n\r\n\r\nGET /b HT")
+        )
+        self.assertFalse(reader.has_head())
+        await reader.read_head(1024)
+        # only the start of the next head, after empty lines
+        self.assertFalse(reader.has_head())
+
+    async def test_read_head_limit(self):
+        reader = helpers.BufferedReader(FakeReader(b"GET / HTTP/1.1\r\n" + b"a" * 64))
+        with self.assertRaises(helpers.LimitExceeded):
+            await reader.read_head(32)
+
+    async def test_readexactly_eof(self):
+        reader = helpers.BufferedReader(FakeReader(b"abc"))
+        with self.assertRaises(EOFError):
+            await reader.readexactly(4)
+
+
+class TestParseHead(TestCase):
+    def test_valid(self):
+        head = b"GET /?q=1 HTTP/1.1\r\nHost: localhost\r\nAccept:*/*\r\n\r\n"
+        expected = (
+            "GET",
+            "/?q=1",
+            "HTTP/1.1",
+            OrderedDict([("Host", "localhost"), ("Accept", "*/*")]),
+        )
+        self.assertEqual(expected, helpers.parse_head(head))
+
+    def test_case_insensitive(self):
+        headers = helpers.parse_head(
+            b"GET / HTTP/1.1\r\nconnection: Close\r\nAccept: a\r\n"
+            b"ACCEPT:  b \r\n\r\n"
+        )[3]
+        self.assertEqual("Close", headers["Connection"])
+        self.assertEqual("a, b", headers.get("accept"))
+        self.assertIn("CONNECTION", headers)
+        self.assertNotIn("Host", headers)
+        self.assertIsNone(headers.get("Host"))
+        with self.assertRaises(KeyError):
+            headers["Host"]
+        headers["Host"] = "localhost"
+        self.assertEqual("localhost", headers["host"])
+
+    def test_malformed_header(self):
+        headers = helpers.parse_head(b"GET / HTTP/1.1\r\nbroken\r\n\r\n")[3]
+        with self.assertRaises(ValueError):
+            headers.get("Host")
+
+    def test_obs_text(self):
+        headers = helpers.parse_head(
+            b"GET / HTTP/1.1\r\nUser-Agent: caf\xe9\r\nX-Name: \xc3\xa9\r\n\r\n"
+        )[3]
+        self.assertEqual("caf\xe9", headers["User-Agent"])
+        self.assertEqual("\xc3\xa9", headers["X-Name"])
+
+    def test_has_token(self):
+        self.assertTrue(helpers.header_has_token("keep-alive, Close", "close"))
+        self.assertFalse(helpers.header_has_token("closed", "close"))
+
+    def test_is_token_list(self):
+        self.assertTrue(helpers.is_token_list("keep-alive, Upgrade"))
+        self.assertTrue(helpers.is_token_list("close,"))
+        self.assertFalse(helpers.is_token_list("\xe9"))
+        self.assertFalse(helpers.is_token_list("keep alive"))
+
+
+class TestParseRange(TestCase):
+    def test_valid(self):
+        test_values = (
+            ("bytes=0-9", (0, 10)),
+            ("bytes=5-", (5, 95)),
+            ("bytes=-10", (90, 10)),
+            ("bytes=90-200", (90, 10)),
+            ("bytes=-200", (0, 100)),
+            ("bytes=100-", None),
+        )
+        for value, expected in test_values:
+            with self.subTest(value=value, expected=expected):
+                self.assertEqual(expected, helpers.parse_range(value, 100))
+
+    def test_invalid(self):
+        for value in ("items=0-1", "bytes=0-1,5-6", "bytes=5-1", "bytes=abc"):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    helpers.parse_range(value, 100)
+
+
+class TestLRUCache(TestCase):
+    def test_entry_limit(self):
+        cache = helpers.LRUCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(1, cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(3, cache.get("c"))
+
+    def test_size_limit(self):
+        cache = helpers.LRUCache(max_size=10)
+        cache.set("a", b"a" * 6, 6)
+        cache.set("b", b"b" * 6, 6)
+        cache.set("c", b"c" * 20, 20)
+        self.assertNotIn("a", cache)
+        self.assertNotIn("c", cache)
+        self.assertEqual(6, cache.size)
+
+
+class TestFormatHttpDate(TestCase):
+    def test_valid(self):
+        self.assertEqual(
+            "Sun, 06 Nov 1994 08:49:37 GMT", helpers.format_http_date(784111777)
+        )
@@ -0,0 +1,76 @@
+import json
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from httpserver.jsoncodec import (
+    STDLIB_CODEC,
+    JSONCodec,
+    default_codec,
+    json_array_stream,
+)
+from httpserver.response import ResponseMaker
+
+from .test_response import FakeWriter, decode_chunked
+
+
+class TestCodec(TestCase):
+    def test_stdlib_bytes(self):
+        self.assertEqual(b'{"a": [1, 2]}', STDLIB_CODEC.dumps({"a": [1, 2]}))
+        self.assertEqual({"a": [1, 2]}, STDLIB_CODEC.loads(b'{"a": [1, 2]}'))
+
+    def test_default_round_trip(self):
+        codec = default_codec()
+        data = codec.dumps({"name": "Leo", 1: [True, None]})
+        self.assertIsInstance(data, bytes)
+        self.assertEqual({"name": "Leo", "1": [True, None]}, codec.loads(data))
+
+    def test_json_array_stream(self):
+        self.assertEqual(b"[]", b"".join(json_array_stream([], STDLIB_CODEC.dumps)))
+        self.assertEqual(
+            [1, {"a": 2}],
+            json.loads(b"".join(json_array_stream(iter([1, {"a": 2}]), STDLIB_CODEC.dumps))),
+        )
+
+
+class TestResponseMaker(IsolatedAsyncioTestCase):
+    def make(self, codec=None, proto="HTTP/1.1"):
+        return ResponseMaker(proto, {}, json_codec=codec)
+
+    async def test_custom_codec(self):
+        codec = JSONCodec(lambda obj: b"custom", json.loads)
+        response = self.make(codec).json(200, {"a": 1})
+        self.assertEqual(b"custom", response.payload)
+        self.assertEqual("6", response.headers["Content-Length"])
+
+    async def test_json_bytes(self):
+        response = self.make().json_bytes(200, b"[1]")
+        self.assertEqual(b"[1]", response.payload)
+        self.assertEqual("application/json", response.headers["Content-Type"])
+
+    async def test_json_stream_async(self):
+        class Rows:
+            def __init__(self):
+                self.i = 0
+
+            def __aiter__(self):
+                return self
+
+            async def __anext__(self):
+                if self.i == 3:
+                    raise StopAsyncIteration
+                self.i += 1
+                return {"row": self.i}
+
+        response = self.make(STDLIB_CODEC).json_stream(200, Rows())
+        self.assertEqual("chunked", response.headers["Transfer-Encoding"])
+        writer = FakeWriter()
+        await response.payload.write_to(writer)
+        body = b"".join(decode_chunked(b"".join(writer.writes)))
+        self.assertEqual([{"row": 1}, {"row": 2}, {"row": 3}], json.loads(body))
+
+    async def test_json_stream_http_1_0(self):
+        response = self.make(STDLIB_CODEC, "HTTP/1.0").json_stream(200, [1, 2])
+        self.assertNotIn("Transfer-Encoding", response.headers)
+        self.assertEqual("close", response.headers["Connection"])
+        writer = FakeWriter()
+        await response.payload.write_to(writer)
+        self.assertEqual(b"[1,2]", b"".join(writer.writes))
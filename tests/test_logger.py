@@ -0,0 +1,49 @@
+import asyncio
+import io
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from httpserver import logger
+
+
+class ListSink:
+    def __init__(self):
+        self.lines = []
+
+    def write(self, line):
+        self.lines.append(line)
+
+
+class TestLogger(TestCase):
+    def test_level(self):
+        sink = ListSink()
+        log = logger.Logger(logger.LEVEL_WARNING, sink)
+        log.debug("hidden %s", "value")
+        log.info("hidden")
+        log.warning("shown %s", "value")
+        log.error("shown")
+        self.assertEqual(["WARNING shown value", "ERROR shown"], sink.lines)
+
+
+class TestBufferedSink(IsolatedAsyncioTestCase):
+    async def test_flush_interval(self):
+        stream = io.StringIO()
+        sink = logger.BufferedSink(stream, flush_interval=0.01)
+        sink.start()
+        sink.write("a")
+        sink.write("b")
+        self.assertEqual("", stream.getvalue())
+        await asyncio.sleep(0.05)
+        self.assertEqual("a\nb\n", stream.getvalue())
+        await sink.close()
+
+    async def test_max_lines(self):
+        stream = io.StringIO()
+        sink = logger.BufferedSink(stream, max_lines=2, flush_interval=10)
+        sink.start()
+        sink.write("a")
+        sink.write("b")
+        await asyncio.sleep(0.01)
+        self.assertEqual("a\nb\n", stream.getvalue())
+        sink.write("c")
+        await sink.close()
+        self.assertEqual("a\nb\nc\n", stream.getvalue())
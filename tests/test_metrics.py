@@ -0,0 +1,69 @@
+from unittest import TestCase
+
+from httpserver.metrics import Histogram, Metrics
+
+
+class FakeRequest:
+    def __init__(self, route, received_at):
+        self.route = route
+        self.method = "GET"
+        self.received_at = received_at
+        self.parsed_at = 0
+        self.handler_done_at = 0
+
+
+class FakeResponse:
+    status_code = 200
+
+
+class TestHistogram(TestCase):
+    def test_buckets(self):
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        # per bucket, the last one for values above every bound
+        self.assertEqual([2, 1, 1], histogram.counts)
+        self.assertEqual(4, histogram.count)
+        self.assertAlmostEqual(2.65, histogram.sum)
+
+
+class TestMetrics(TestCase):
+    def test_request_phases(self):
+        metrics = Metrics(buckets=(0.1, 1.0))
+        request = FakeRequest("/users/<int:id>", 10.0)
+        # as the server sets these before calling each hook
+        request.parsed_at = 10.05
+        metrics._request_start(request, 10.0, 10.05)
+        request.handler_done_at = 10.5
+        metrics._handler_done(request, FakeResponse(), 10.5)
+        metrics._response_written(request, FakeResponse(), 12.0)
+
+        route = "/users/<int:id>"
+        self.assertEqual([1, 0, 0], metrics.parse_seconds[route].counts)
+        self.assertEqual([0, 1, 0], metrics.handler_seconds[route].counts)
+        self.assertEqual([0, 0, 1], metrics.write_seconds[route].counts)
+        self.assertEqual([0, 0, 1], metrics.duration_seconds[route].counts)
+        self.assertEqual({(route, "GET", 200): 1}, metrics.requests_total)
+
+    def test_render(self):
+        metrics = Metrics(buckets=(0.1, 1.0))
+        metrics._conn_open("peer", 0)
+        request = FakeRequest("/", 1.0)
+        request.parsed_at = 1.5
+        metrics._request_start(request, 1.0, 1.5)
+        metrics._response_written(request, FakeResponse(), 2.0)
+        lines = metrics.render().split("\n")
+        for line in (
+            "http_active_connections 1",
+            "http_connections_total 1",
+            'http_requests_total{route="/",method="GET",status="200"} 1',
+            "# TYPE http_request_parse_seconds histogram",
+            'http_request_parse_seconds_bucket{route="/",le="0.1"} 0',
+            'http_request_parse_seconds_bucket{route="/",le="1.0"} 1',
+            'http_request_parse_seconds_bucket{route="/",le="+Inf"} 1',
+            'http_request_parse_seconds_sum{route="/"} 0.5',
+            'http_request_parse_seconds_count{route="/"} 1',
+        ):
+            self.assertIn(line, lines)
+        # never reached the handler, so no handler or write timings
+        self.assertNotIn('http_request_duration_seconds_count{route="/"} 1', lines)
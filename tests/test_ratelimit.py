@@ -0,0 +1,35 @@
+from unittest import TestCase
+
+from httpserver.ratelimit import RateLimit
+
+
+class TestRateLimit(TestCase):
+    def test_burst_then_refill(self):
+        limit = RateLimit(2, burst=3)
+        for _ in range(3):
+            self.assertEqual(0, limit.acquire("a", now=10))
+        self.assertAlmostEqual(0.5, limit.acquire("a", now=10))
+        # other keys have their own bucket
+        self.assertEqual(0, limit.acquire("b", now=10))
+        self.assertEqual(0, limit.acquire("a", now=10.5))
+        self.assertAlmostEqual(0.5, limit.acquire("a", now=10.5))
+        # refills up to the burst size only
+        for _ in range(3):
+            self.assertEqual(0, limit.acquire("a", now=100))
+        self.assertTrue(limit.acquire("a", now=100))
+
+    def test_lru_eviction(self):
+        limit = RateLimit(1, burst=1, max_keys=2)
+        limit.acquire("a", now=0)
+        limit.acquire("b", now=0)
+        self.assertTrue(limit.acquire("a", now=0))
+        limit.acquire("c", now=0)
+        self.assertEqual(2, len(limit))
+        # "b" was least recently used, so starts again with a full bucket
+        self.assertEqual(0, limit.acquire("b", now=0))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            RateLimit(0)
+        with self.assertRaises(ValueError):
+            RateLimit(1, key="user")
@@ -0,0 +1,51 @@
+from unittest import TestCase
+
+from httpserver.helpers import parse_head
+from httpserver.jsoncodec import JSONCodec
+from httpserver.request import HTTPRequest, Request
+
+
+def make_request(head, payload=None):
+    method, path, proto, headers = parse_head(head)
+    request = Request(HTTPRequest(proto, method, path, headers, None))
+    request.payload = payload
+    return request
+
+
+class TestRequest(TestCase):
+    def test_lazy_path_and_query(self):
+        request = make_request(b"GET /search?q=a+b&q=c HTTP/1.1\r\n\r\n")
+        self.assertIsNone(request._path)
+        self.assertEqual("/search", request.path)
+        self.assertEqual("q=a+b&q=c", request.query_string)
+        self.assertEqual([b"a b", b"c"], request.query.getall("q"))
+        self.assertIs(request.query, request.query)
+
+    def test_json(self):
+        request = make_request(
+            b"POST / HTTP/1.1\r\ncontent-type: application/json; charset=utf-8\r\n\r\n",
+            b'{"name": "Leo"}',
+        )
+        self.assertEqual({"name": "Leo"}, request.json())
+        self.assertIs(request.json(), request.json())
+
+    def test_json_codec(self):
+        request = make_request(
+            b"POST / HTTP/1.1\r\nContent-Type: application/json\r\n\r\n", b"[1]"
+        )
+        request.json_codec = JSONCodec(None, lambda data: ("decoded", data))
+        self.assertEqual(("decoded", b"[1]"), request.json())
+
+    def test_form(self):
+        request = make_request(
+            b"POST / HTTP/1.1\r\nContent-Type: application/x-www-form-urlencoded\r\n\r\n",
+            b"name=Leo&admin",
+        )
+        self.assertEqual(b"Leo", request.form()["name"])
+        self.assertEqual(b"", request.form()["admin"])
+        with self.assertRaises(ValueError):
+            request.json()
+
+    def test_slots(self):
+        with self.assertRaises(AttributeError):
+            make_request(b"GET / HTTP/1.1\r\n\r\n").unknown = 1
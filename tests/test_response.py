@@ -0,0 +1,106 @@
+import asyncio
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from httpserver.response import RawResponse, ResponseFile, ResponseStream, encode_head
+
+
+class FakeWriter:
+    def __init__(self):
+        self.writes = []
+        self.drains = 0
+
+    def write(self, data):
+        # copied like a transport would, buffers may be reused
+        self.writes.append(bytes(data))
+
+    async def drain(self):
+        self.drains += 1
+
+
+def decode_chunked(data):
+    chunks = []
+    while True:
+        size_line, data = data.split(b"\r\n", 1)
+        size = int(size_line, 16)
+        if size == 0:
+            return chunks
+        chunks.append(data[:size])
+        data = data[size + 2 :]
+
+
+class TestResponseStream(IsolatedAsyncioTestCase):
+    async def test_sync_coalesced(self):
+        writer = FakeWriter()
+        stream = ResponseStream((b"ab" for _ in range(10)), flush_size=8)
+        await stream.write_to(writer)
+        self.assertEqual(
+            [b"abababab", b"abababab", b"abab"], decode_chunked(b"".join(writer.writes))
+        )
+
+    async def test_async_iterable(self):
+        async def source():
+            for i in range(3):
+                yield b"%d" % i
+
+        writer = FakeWriter()
+        await ResponseStream(source(), flush_interval=None).write_to(writer)
+        self.assertEqual([b"0", b"1", b"2"], decode_chunked(b"".join(writer.writes)))
+
+    async def test_async_stall_flushes(self):
+        async def source():
+            yield b"first"
+            await asyncio.sleep(0.2)
+            yield b"second"
+
+        writer = FakeWriter()
+        task = asyncio.create_task(
+            ResponseStream(source(), flush_interval=0.01).write_to(writer)
+        )
+        await asyncio.sleep(0.1)
+        self.assertEqual(b"5\r\nfirst\r\n", b"".join(writer.writes))
+        await task
+        self.assertEqual([b"first", b"second"], decode_chunked(b"".join(writer.writes)))
+
+
+class TestResponseFile(IsolatedAsyncioTestCase):
+    async def test_sendfile_unsupported(self):
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, "wb") as fo:
+            fo.write(b"0123456789")
+        self.addCleanup(os.remove, path)
+
+        async def sendfile(*args):
+            raise NotImplementedError
+
+        asyncio.get_running_loop().sendfile = sendfile
+        writer = FakeWriter()
+        writer.transport = object()
+        await ResponseFile(path, 2, 6, block_size=4).write_to(writer)
+        self.assertEqual(b"234567", b"".join(writer.writes))
+
+
+class TestEncodeHead(TestCase):
+    def test_valid(self):
+        expected = b"HTTP/1.1 404 Not Found\r\nConnection: close\r\nContent-Length: 0\r\n\r\n"
+        for _ in range(2):
+            actual = encode_head(
+                "HTTP/1.1", 404, {"Connection": "close", "Content-Length": "0"}
+            )
+            self.assertEqual(expected, actual)
+
+    def test_unknown_status(self):
+        self.assertEqual(b"HTTP/1.0 599 \r\n\r\n", encode_head("HTTP/1.0", 599, {}))
+
+
+class TestRawResponse(TestCase):
+    def test_render(self):
+        raw = RawResponse(200, {"Content-Type": "text/plain"}, b"hi")
+        expected = (
+            b"HTTP/1.1 200 OK\r\nConnection: keep-alive\r\n"
+            b"Content-Type: text/plain\r\nContent-Length: 2\r\n\r\nhi"
+        )
+        self.assertEqual(expected, raw.render("HTTP/1.1", "keep-alive"))
+        self.assertIs(raw.render("HTTP/1.1", "keep-alive"), raw.render("HTTP/1.1", "keep-alive"))
+        self.assertEqual(expected[:-2], raw.head().render("HTTP/1.1", "keep-alive"))
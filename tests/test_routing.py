@@ -0,0 +1,79 @@
+from unittest import TestCase
+
+from httpserver.routing import RouteGroup, Router
+
+
+class TestRouter(TestCase):
+    def setUp(self):
+        group = RouteGroup()
+        for path, method in (
+            ("/", "GET"),
+            ("/users", "GET"),
+            ("/users/me", "GET"),
+            ("/users/<int:id>", "GET"),
+            ("/users/<int:id>", "DELETE"),
+            ("/users/<name>/posts", "GET"),
+            ("/files/<path:rest>", "GET"),
+            ("/any/*/end", "GET"),
+        ):
+            group.route(path, method)((path, method))
+        self.router = Router(group.routes)
+
+    def test_match(self):
+        test_values = (
+            ("/", "GET", ("/", "GET"), {}),
+            ("/users", "GET", ("/users", "GET"), {}),
+            ("/users/me", "GET", ("/users/me", "GET"), {}),
+            ("/users/12", "GET", ("/users/<int:id>", "GET"), {"id": 12}),
+            ("/users/12", "DELETE", ("/users/<int:id>", "DELETE"), {"id": 12}),
+            ("/users/leo/posts", "GET", ("/users/<name>/posts", "GET"), {"name": "leo"}),
+            ("/users/12/posts", "GET", ("/users/<name>/posts", "GET"), {"name": "12"}),
+            ("/files/a/b.txt", "GET", ("/files/<path:rest>", "GET"), {"rest": "a/b.txt"}),
+            ("/any/thing/end", "GET", ("/any/*/end", "GET"), {}),
+            # parameters are percent-decoded
+            ("/users/%31%32", "GET", ("/users/<int:id>", "GET"), {"id": 12}),
+            (
+                "/users/John%20Doe/posts",
+                "GET",
+                ("/users/<name>/posts", "GET"),
+                {"name": "John Doe"},
+            ),
+            ("/files/a%20b/c.txt", "GET", ("/files/<path:rest>", "GET"), {"rest": "a b/c.txt"}),
+        )
+        for path, method, expected, expected_params in test_values:
+            with self.subTest(path=path, method=method):
+                handler, params, _, pattern = self.router.match(path, method)
+                self.assertEqual(expected, handler)
+                self.assertEqual(expected_params, params)
+                self.assertEqual(expected[0], pattern)
+
+    def test_not_found(self):
+        for path in ("/missing", "/users/", "/files/", "/any/thing", "/files/%ff"):
+            with self.subTest(path=path):
+                self.assertEqual((None, {}, None, None), self.router.match(path, "GET"))
+
+    def test_method_not_allowed(self):
+        handler, _, allowed, _ = self.router.match("/users/12", "POST")
+        self.assertIsNone(handler)
+        self.assertEqual(["DELETE", "GET", "HEAD"], sorted(allowed))
+
+    def test_invalid_routes(self):
+        router = Router()
+        with self.assertRaises(ValueError):
+            router.add("/<path:rest>/more", "GET", None)
+        with self.assertRaises(ValueError):
+            router.add("/<float:n>", "GET", None)
+
+
+class TestRouteGroup(TestCase):
+    def test_blocking_coroutine_function(self):
+        group = RouteGroup()
+
+        async def handler(ctx):
+            pass
+
+        with self.assertRaises(ValueError):
+            group.route("/", blocking=True)(handler)
+        group.route("/")(handler)
+        group.route("/sync", blocking=True)(lambda ctx: None)
+        self.assertEqual(2, len(group.routes))
@@ -0,0 +1,921 @@
+import asyncio
+import gzip
+import os
+import socket
+import tempfile
+import threading
+from unittest import IsolatedAsyncioTestCase
+
+from httpserver import HTTPServer
+from httpserver.compression import Compression
+from httpserver.constants import STATUS_OK_200
+from httpserver.logger import LEVEL_NONE, Logger
+from httpserver.metrics import Metrics
+from httpserver.response import RawResponse
+from httpserver.ratelimit import RateLimit
+from httpserver.routing import RouteGroup
+from httpserver.sse import EventHub
+from httpserver.websocket import OP_CLOSE, OP_TEXT
+
+from .test_websocket import client_frame, parse_frames
+
+
+class ServerTestCase(IsolatedAsyncioTestCase):
+    server_options = {}
+
+    async def asyncSetUp(self):
+        self.server = self.make_server()
+        self.register_routes(self.server)
+        await self.server.start("127.0.0.1", 0)
+        self.port = self.server._server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+    def make_server(self):
+        return HTTPServer(**self.server_options)
+
+    def register_routes(self, server):
+        pass
+
+    async def send(self, raw):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(raw)
+        await writer.drain()
+        data = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        await writer.wait_closed()
+        return data
+
+
+class TestPipelining(ServerTestCase):
+    server_options = {"pipeline_concurrent": True}
+
+    def register_routes(self, server):
+        @server.route("/")
+        def get_index(ctx):
+            return ctx.response.text(STATUS_OK_200, ctx.request.query["n"].decode())
+
+    async def test_responses_in_order(self):
+        raw = b"".join(
+            b"GET /?n=%d HTTP/1.1\r\n\r\n" % i for i in range(20)
+        ) + b"GET /?n=end HTTP/1.1\r\nConnection: close\r\n\r\n"
+        data = await self.send(raw)
+        bodies = [part.split(b"\r\n\r\n", 1)[1] for part in data.split(b"HTTP/1.1 200")[1:]]
+        self.assertEqual([b"%d" % i for i in range(20)] + [b"end"], bodies)
+
+    async def test_lower_case_connection_close(self):
+        data = await self.send(b"GET /?n=1 HTTP/1.1\r\nconnection: Close\r\n\r\n")
+        self.assertTrue(data.endswith(b"\r\n\r\n1"))
+
+    async def test_partial_next_request(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(b"GET /?n=1 HTTP/1.1\r\n\r\nGET /?n=2 HT")
+        data = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n1"), 1)
+        self.assertTrue(data.startswith(b"HTTP/1.1 200"))
+        writer.write(b"TP/1.1\r\nConnection: close\r\n\r\n")
+        self.assertTrue((await asyncio.wait_for(reader.read(), 1)).endswith(b"2"))
+        writer.close()
+        await writer.wait_closed()
+
+    async def test_not_found_keeps_connection(self):
+        data = await self.send(
+            b"GET /missing HTTP/1.1\r\n\r\nGET /?n=1 HTTP/1.1\r\nConnection: close\r\n\r\n"
+        )
+        self.assertTrue(data.startswith(b"HTTP/1.1 404"))
+        self.assertTrue(data.endswith(b"\r\n\r\n1"))
+
+
+class TestRouting(ServerTestCase):
+    def register_routes(self, server):
+        @server.route("/users/<int:id>")
+        def get_user(ctx):
+            return ctx.response.json(STATUS_OK_200, ctx.request.params)
+
+    async def test_path_params(self):
+        data = await self.send(b"GET /users/7 HTTP/1.0\r\n\r\n")
+        self.assertTrue(data.endswith(self.server.json_codec.dumps({"id": 7})))
+
+    async def test_method_not_allowed(self):
+        data = await self.send(b"POST /users/7 HTTP/1.0\r\n\r\n")
+        self.assertTrue(data.startswith(b"HTTP/1.0 405"))
+        self.assertIn(b"\r\nAllow: GET, HEAD\r\n", data)
+
+
+class TestHandlers(ServerTestCase):
+    def register_routes(self, server):
+        @server.route("/async")
+        async def get_async(ctx):
+            await asyncio.sleep(0)
+            return ctx.response.text(STATUS_OK_200, "async")
+
+        raw = RawResponse(STATUS_OK_200, {"Content-Type": "text/plain"}, b"raw")
+
+        @server.route("/raw")
+        def get_raw(ctx):
+            return ctx.response.raw_cached(raw)
+
+        @server.route("/rows")
+        def get_rows(ctx):
+            return ctx.response.json_stream(STATUS_OK_200, range(3))
+
+        @server.route("/blocking", blocking=True)
+        def get_blocking(ctx):
+            return ctx.response.text(STATUS_OK_200, threading.current_thread().name)
+
+    async def test_async_handler(self):
+        data = await self.send(b"GET /async HTTP/1.0\r\n\r\n")
+        self.assertTrue(data.endswith(b"\r\n\r\nasync"))
+
+    async def test_raw_cached(self):
+        data = await self.send(b"GET /raw HTTP/1.1\r\nConnection: close\r\n\r\n")
+        self.assertEqual(
+            b"HTTP/1.1 200 OK\r\nConnection: close\r\nContent-Type: text/plain\r\n"
+            b"Content-Length: 3\r\n\r\nraw",
+            data,
+        )
+        data = await self.send(b"HEAD /raw HTTP/1.0\r\n\r\n")
+        self.assertTrue(data.endswith(b"Content-Length: 3\r\n\r\n"))
+
+    async def test_stream_http_1_0(self):
+        # the stream ends with the connection, so the next request is dropped
+        data = await self.send(
+            b"GET /rows HTTP/1.0\r\nConnection: keep-alive\r\n\r\n"
+            b"GET /async HTTP/1.0\r\n\r\n"
+        )
+        self.assertTrue(data.startswith(b"HTTP/1.0 200"))
+        self.assertIn(b"\r\nConnection: close\r\n", data)
+        self.assertNotIn(b"Transfer-Encoding", data)
+        self.assertTrue(data.endswith(b"\r\n\r\n[0,1,2]"))
+
+    async def test_obs_text_header(self):
+        data = await self.send(
+            b"GET /async HTTP/1.1\r\nUser-Agent: caf\xe9\r\nConnection: close\r\n\r\n"
+        )
+        self.assertTrue(data.startswith(b"HTTP/1.1 200"))
+        data = await self.send(b"GET /async HTTP/1.1\r\nConnection: \xe9\r\n\r\n")
+        self.assertTrue(data.startswith(b"HTTP/1.1 400"))
+
+    async def test_blocking_handler_off_loop(self):
+        data = await self.send(b"GET /blocking HTTP/1.0\r\n\r\n")
+        self.assertTrue(data.startswith(b"HTTP/1.0 200"))
+        self.assertNotIn(threading.current_thread().name.encode(), data.split(b"\r\n\r\n", 1)[1])
+
+
+class TestRequestBody(ServerTestCase):
+    server_options = {"max_body_size": 16}
+
+    def register_routes(self, server):
+        @server.route("/echo", "POST")
+        def post_echo(ctx):
+            return ctx.response.content(
+                STATUS_OK_200, "text/plain", ctx.request.payload or b""
+            )
+
+        @server.route("/upload", "POST", stream_body=True, max_body_size=64)
+        async def post_upload(ctx):
+            size = 0
+            async for chunk in ctx.request.body:
+                size += len(chunk)
+            return ctx.response.text(STATUS_OK_200, str(size))
+
+        @server.route("/ignore", "POST", stream_body=True)
+        def post_ignore(ctx):
+            return ctx.response.text(STATUS_OK_200, "ok")
+
+    async def test_content_length(self):
+        data = await self.send(
+            b"POST /echo HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello"
+            b"GET /missing HTTP/1.1\r\nConnection: close\r\n\r\n"
+        )
+        self.assertIn(b"\r\n\r\nhelloHTTP/1.1 404", data)
+
+    async def test_chunked(self):
+        data = await self.send(
+            b"POST /echo HTTP/1.1\r\nTransfer-Encoding: chunked\r\n"
+            b"Connection: close\r\n\r\n"
+            b"3\r\nhel\r\n2;ext=1\r\nlo\r\n0\r\n\r\n"
+        )
+        self.assertTrue(data.endswith(b"\r\n\r\nhello"))
+
+    async def test_too_large(self):
+        data = await self.send(
+            b"POST /echo HTTP/1.1\r\nContent-Length: 17\r\n\r\n" + b"x" * 17
+        )
+        self.assertTrue(data.startswith(b"HTTP/1.1 413"))
+        self.assertIn(b"\r\nConnection: close\r\n", data)
+
+    async def test_chunked_too_large(self):
+        data = await self.send(
+            b"POST /echo HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+            b"11\r\n" + b"x" * 17 + b"\r\n0\r\n\r\n"
+        )
+        self.assertTrue(data.startswith(b"HTTP/1.1 413"))
+
+    async def test_conflicting_framing(self):
+        data = await self.send(
+            b"POST /echo HTTP/1.1\r\nContent-Length: 1\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n0\r\n\r\n"
+        )
+        self.assertTrue(data.startswith(b"HTTP/1.1 400"))
+
+    async def test_malformed_framing(self):
+        for length in (b"1_0", b"+5", b"-1", b"0x5", b"5, 5"):
+            data = await self.send(
+                b"POST /echo HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n"
+                b"0123456789"
+            )
+            self.assertTrue(data.startswith(b"HTTP/1.1 400"), length)
+        for size in (b"-5", b"+5", b"0x5", b"5 ", b"1_0", b""):
+            data = await self.send(
+                b"POST /echo HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+                + size + b"\r\nxxxxx\r\n0\r\n\r\n"
+            )
+            self.assertTrue(data.startswith(b"HTTP/1.1 400"), size)
+        data = await self.send(
+            b"POST /echo HTTP/1.1\r\nTransfer-Encoding: chunked\r\n"
+            b"Connection: close\r\n\r\n5 ;ext=1\r\nxxxxx\r\n0\r\n\r\n"
+        )
+        self.assertTrue(data.endswith(b"xxxxx"))
+
+    async def test_stream_route_limit(self):
+        data = await self.send(
+            b"POST /upload HTTP/1.1\r\nTransfer-Encoding: chunked\r\n"
+            b"Connection: close\r\n\r\n"
+            b"20\r\n" + b"x" * 32 + b"\r\n20\r\n" + b"x" * 32 + b"\r\n0\r\n\r\n"
+        )
+        self.assertTrue(data.endswith(b"\r\n\r\n64"))
+        data = await self.send(
+            b"POST /upload HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+            b"41\r\n" + b"x" * 65 + b"\r\n0\r\n\r\n"
+        )
+        self.assertTrue(data.startswith(b"HTTP/1.1 413"))
+
+    async def test_unread_stream_discarded(self):
+        data = await self.send(
+            b"POST /ignore HTTP/1.1\r\nContent-Length: 10\r\n\r\n0123456789"
+            b"GET /missing HTTP/1.1\r\nConnection: close\r\n\r\n"
+        )
+        self.assertIn(b"\r\n\r\nokHTTP/1.1 404", data)
+
+    async def test_expect_continue(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(
+            b"POST /echo HTTP/1.1\r\nContent-Length: 2\r\n"
+            b"Expect: 100-continue\r\nConnection: close\r\n\r\n"
+        )
+        interim = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+        self.assertEqual(b"HTTP/1.1 100 Continue\r\n\r\n", interim)
+        writer.write(b"hi")
+        data = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        await writer.wait_closed()
+        self.assertTrue(data.endswith(b"\r\n\r\nhi"))
+
+
+    async def test_expect_continue_pipelined(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(
+            b"GET /missing HTTP/1.1\r\n\r\n"
+            b"POST /echo HTTP/1.1\r\nContent-Length: 2\r\n"
+            b"Expect: 100-continue\r\nConnection: close\r\n\r\n"
+        )
+        data = await asyncio.wait_for(reader.readuntil(b"100 Continue\r\n\r\n"), 5)
+        # the earlier response is written before the interim one
+        self.assertTrue(data.startswith(b"HTTP/1.1 404"))
+        writer.write(b"hi")
+        data = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        await writer.wait_closed()
+        self.assertTrue(data.endswith(b"\r\n\r\nhi"))
+
+    async def test_partial_payload_pipelined(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(
+            b"GET /missing HTTP/1.1\r\n\r\n"
+            b"POST /echo HTTP/1.1\r\nContent-Length: 4\r\nConnection: close\r\n\r\nhi"
+        )
+        data = await asyncio.wait_for(reader.readuntil(b"Page Not Found</h1>"), 1)
+        self.assertTrue(data.startswith(b"HTTP/1.1 404"))
+        writer.write(b"!!")
+        data = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        await writer.wait_closed()
+        self.assertTrue(data.endswith(b"\r\n\r\nhi!!"))
+
+class TestCompression(ServerTestCase):
+    server_options = {"compression": Compression(min_size=10)}
+
+    def register_routes(self, server):
+        @server.route("/")
+        def get_index(ctx):
+            return ctx.response.html(STATUS_OK_200, "<p>compressed</p>")
+
+        @server.route("/plain", compress=False)
+        def get_plain(ctx):
+            return ctx.response.html(STATUS_OK_200, "<p>not compressed</p>")
+
+    async def test_route_options(self):
+        data = await self.send(
+            b"GET / HTTP/1.1\r\nAccept-Encoding: gzip\r\n\r\n"
+            b"GET /plain HTTP/1.1\r\nAccept-Encoding: gzip\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        first, second = data.split(b"HTTP/1.1 200 OK")[1:]
+        self.assertIn(b"\r\nContent-Encoding: gzip\r\n", first)
+        self.assertEqual(
+            b"<p>compressed</p>", gzip.decompress(first.split(b"\r\n\r\n", 1)[1])
+        )
+        self.assertNotIn(b"Content-Encoding", second)
+        self.assertTrue(second.endswith(b"<p>not compressed</p>"))
+
+
+class TestMiddleware(ServerTestCase):
+    def register_routes(self, server):
+        calls = self.calls = []
+
+        @server.middleware
+        async def cors(ctx, call_next):
+            calls.append("cors")
+            if ctx.request.method == "OPTIONS":
+                return ctx.response.no_content(204)
+            response = await call_next(ctx)
+            response.headers["Access-Control-Allow-Origin"] = "*"
+            return response
+
+        api = RouteGroup("/api")
+
+        @api.before_request
+        def auth(ctx):
+            calls.append("auth")
+            if ctx.request.headers.get("Authorization") != "secret":
+                return ctx.response.text(401, "unauthorized")
+
+        @api.after_request
+        async def tag(ctx, response):
+            response.headers["X-Api"] = "1"
+            return response
+
+        @api.route("/me")
+        def get_me(ctx):
+            calls.append("handler")
+            return ctx.response.text(STATUS_OK_200, "me")
+
+        @server.route("/")
+        def get_index(ctx):
+            return ctx.response.text(STATUS_OK_200, "index")
+
+        server.register_route_group(api)
+
+    async def test_group_scoped(self):
+        data = await self.send(b"GET / HTTP/1.0\r\n\r\n")
+        self.assertIn(b"\r\nAccess-Control-Allow-Origin: *\r\n", data)
+        self.assertNotIn(b"X-Api", data)
+        self.assertEqual(["cors"], self.calls)
+
+    async def test_short_circuit(self):
+        data = await self.send(b"GET /api/me HTTP/1.0\r\n\r\n")
+        self.assertTrue(data.startswith(b"HTTP/1.0 401"))
+        # registered after auth, so inside it and skipped
+        self.assertNotIn(b"X-Api", data)
+        self.assertEqual(["cors", "auth"], self.calls)
+
+    async def test_order(self):
+        data = await self.send(
+            b"GET /api/me HTTP/1.0\r\nAuthorization: secret\r\n\r\n"
+        )
+        self.assertTrue(data.endswith(b"me"))
+        self.assertIn(b"\r\nX-Api: 1\r\n", data)
+        self.assertEqual(["cors", "auth", "handler"], self.calls)
+
+    async def test_unmatched(self):
+        data = await self.send(b"OPTIONS /api/me HTTP/1.0\r\n\r\n")
+        self.assertTrue(data.startswith(b"HTTP/1.0 204"))
+        data = await self.send(b"GET /missing HTTP/1.0\r\n\r\n")
+        self.assertTrue(data.startswith(b"HTTP/1.0 404"))
+        self.assertIn(b"\r\nAccess-Control-Allow-Origin: *\r\n", data)
+
+
+class TestResponseCache(ServerTestCase):
+    server_options = {"compression": Compression(min_size=10)}
+
+    def register_routes(self, server):
+        self.calls = 0
+
+        @server.after_request
+        def add_header(ctx, response):
+            response.headers["X-Frame-Options"] = "DENY"
+            return response
+
+        @server.route("/", cache_ttl=5)
+        def get_index(ctx):
+            self.calls += 1
+            return ctx.response.json(STATUS_OK_200, {"calls": self.calls})
+
+    async def test_cached(self):
+        request = b"GET / HTTP/1.1\r\n\r\n"
+        data = await self.send(
+            request * 2 + b"HEAD / HTTP/1.1\r\nConnection: close\r\n\r\n"
+        )
+        first, second, head = data.split(b"HTTP/1.1 200 OK")[1:]
+        payload = self.server.json_codec.dumps({"calls": 1})
+        self.assertTrue(first.endswith(payload))
+        self.assertTrue(second.endswith(payload))
+        self.assertIn(b"\r\nX-Frame-Options: DENY\r\n", second)
+        self.assertIn(b"\r\nContent-Length: %d\r\n" % len(payload), head)
+        self.assertTrue(head.endswith(b"\r\n\r\n"))
+        self.assertEqual(1, self.calls)
+
+    async def test_cached_per_encoding(self):
+        await self.send(b"GET / HTTP/1.0\r\n\r\n")
+        data = await self.send(b"GET / HTTP/1.0\r\nAccept-Encoding: gzip\r\n\r\n")
+        self.assertEqual(
+            self.server.json_codec.dumps({"calls": 2}), gzip.decompress(data.split(b"\r\n\r\n", 1)[1])
+        )
+        data = await self.send(b"GET / HTTP/1.0\r\n\r\n")
+        self.assertTrue(data.endswith(self.server.json_codec.dumps({"calls": 1})))
+        self.assertEqual(1, self.server.response_cache.hits)
+
+    def test_only_get(self):
+        with self.assertRaises(ValueError):
+            self.server.route("/", "POST", cache_ttl=5)
+
+
+class TestRateLimit(ServerTestCase):
+    def register_routes(self, server):
+        api = RouteGroup("/api")
+        api.middleware(RateLimit(0.01, burst=2, key="ip_route"))
+
+        @api.route("/a")
+        def get_a(ctx):
+            return ctx.response.text(STATUS_OK_200, "a")
+
+        @api.route("/b")
+        def get_b(ctx):
+            return ctx.response.text(STATUS_OK_200, "b")
+
+        @server.route("/login", "POST", rate_limit=RateLimit(0.01, burst=1))
+        def post_login(ctx):
+            return ctx.response.text(STATUS_OK_200, "ok")
+
+        server.register_route_group(api)
+
+    async def test_group(self):
+        data = await self.send(
+            b"GET /api/a HTTP/1.1\r\n\r\n" * 3
+            + b"GET /api/b HTTP/1.1\r\nConnection: close\r\n\r\n"
+        )
+        statuses = [part[1:4] for part in data.split(b"HTTP/1.1")[1:]]
+        self.assertEqual([b"200", b"200", b"429", b"200"], statuses)
+        self.assertIn(b"\r\nRetry-After: 100\r\n", data)
+
+    async def test_route(self):
+        data = await self.send(
+            b"POST /login HTTP/1.1\r\n\r\n"
+            + b"POST /login HTTP/1.1\r\nConnection: close\r\n\r\n"
+        )
+        self.assertTrue(data.startswith(b"HTTP/1.1 200 "))
+        self.assertIn(b"HTTP/1.1 429 ", data)
+
+
+class TestConnectionLimits(ServerTestCase):
+    server_options = {
+        "max_connections": 1,
+        "keep_alive_timeout": 0.1,
+        "reap_interval": 0.01,
+    }
+
+    def register_routes(self, server):
+        self.release = asyncio.Event()
+
+        @server.route("/slow")
+        async def get_slow(ctx):
+            await self.release.wait()
+            return ctx.response.text(STATUS_OK_200, "slow")
+
+        @server.route("/")
+        def get_index(ctx):
+            return ctx.response.text(STATUS_OK_200, "index")
+
+    async def test_idle_reaped(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        self.assertEqual(b"", await asyncio.wait_for(reader.read(), 1))
+        writer.close()
+        self.assertEqual(0, len(self.server._connections))
+
+    async def test_idle_reclaimed(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        await asyncio.sleep(0.01)
+        data = await self.send(b"GET / HTTP/1.0\r\n\r\n")
+        self.assertTrue(data.endswith(b"index"))
+        self.assertEqual(b"", await asyncio.wait_for(reader.read(), 1))
+        writer.close()
+
+    async def test_busy_rejected(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(b"GET /slow HTTP/1.0\r\n\r\n")
+        await asyncio.sleep(0.01)
+        data = await self.send(b"GET / HTTP/1.0\r\n\r\n")
+        self.assertTrue(data.startswith(b"HTTP/1.1 503"))
+        self.assertIn(b"\r\nRetry-After: 1\r\n", data)
+        self.release.set()
+        self.assertTrue((await asyncio.wait_for(reader.read(), 1)).endswith(b"slow"))
+        writer.close()
+
+
+class TestConnectionQueue(TestConnectionLimits):
+    server_options = dict(
+        TestConnectionLimits.server_options, queue_connections=True
+    )
+
+    async def test_busy_rejected(self):
+        pass
+
+    async def test_busy_queued(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(b"GET /slow HTTP/1.0\r\n\r\n")
+        await asyncio.sleep(0.01)
+        queued = asyncio.ensure_future(self.send(b"GET / HTTP/1.0\r\n\r\n"))
+        await asyncio.sleep(0.01)
+        self.assertFalse(queued.done())
+        self.release.set()
+        self.assertTrue((await queued).endswith(b"index"))
+        writer.close()
+
+
+class TestConnectionsPerIP(ServerTestCase):
+    server_options = {"max_connections_per_ip": 1}
+
+    async def test_rejected(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        await asyncio.sleep(0.01)
+        data = await self.send(b"GET / HTTP/1.0\r\n\r\n")
+        self.assertTrue(data.startswith(b"HTTP/1.1 503"))
+        writer.close()
+        await writer.wait_closed()
+        await asyncio.sleep(0.01)
+        data = await self.send(b"GET / HTTP/1.0\r\n\r\n")
+        self.assertTrue(data.startswith(b"HTTP/1.0 404"))
+
+
+class TestGracefulShutdown(ServerTestCase):
+    def register_routes(self, server):
+        self.release = asyncio.Event()
+
+        @server.route("/slow")
+        async def get_slow(ctx):
+            await self.release.wait()
+            return ctx.response.text(STATUS_OK_200, "slow")
+
+        @server.route("/")
+        def get_index(ctx):
+            return ctx.response.text(STATUS_OK_200, "index")
+
+    async def asyncTearDown(self):
+        if self.server._server is not None:
+            await self.server.stop()
+
+    async def test_drain(self):
+        idle_reader, idle_writer = await asyncio.open_connection("127.0.0.1", self.port)
+        idle_writer.write(b"GET / HTTP/1.1\r\n\r\n")
+        await idle_reader.readuntil(b"index")
+        busy_reader, busy_writer = await asyncio.open_connection("127.0.0.1", self.port)
+        busy_writer.write(b"GET /slow HTTP/1.1\r\n\r\n")
+        await asyncio.sleep(0.01)
+
+        stopping = asyncio.ensure_future(self.server.stop())
+        self.assertEqual(b"", await asyncio.wait_for(idle_reader.read(), 1))
+        await asyncio.sleep(0.01)
+        self.assertFalse(stopping.done())
+        self.release.set()
+        data = await asyncio.wait_for(busy_reader.read(), 1)
+        self.assertIn(b"\r\nConnection: close\r\n", data)
+        self.assertTrue(data.endswith(b"slow"))
+        await asyncio.wait_for(stopping, 1)
+        with self.assertRaises(OSError):
+            await asyncio.open_connection("127.0.0.1", self.port)
+        idle_writer.close()
+        busy_writer.close()
+
+    async def test_waits_for_closing(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(b"GET / HTTP/1.1\r\n\r\n")
+        await reader.readuntil(b"index")
+        tasks = set(self.server._tasks)
+        self.assertEqual(1, len(tasks))
+        await asyncio.wait_for(self.server.stop(), 1)
+        self.assertTrue(all(task.done() for task in tasks))
+        self.assertEqual(0, len(self.server._tasks))
+        writer.close()
+
+    async def test_deadline(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(b"GET /slow HTTP/1.1\r\n\r\n")
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(self.server.stop(0.05), 1)
+        self.assertEqual(b"", await asyncio.wait_for(reader.read(), 1))
+        writer.close()
+
+
+class TestWebSocket(ServerTestCase):
+    upgrade = (
+        b"GET /ws HTTP/1.1\r\n"
+        b"Upgrade: websocket\r\n"
+        b"Connection: keep-alive, Upgrade\r\n"
+        b"Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+        b"Sec-WebSocket-Version: 13\r\n"
+        b"Sec-WebSocket-Protocol: other, chat\r\n\r\n"
+    )
+
+    def register_routes(self, server):
+        @server.websocket("/ws", max_message_size=16, subprotocols=("chat",))
+        async def ws_echo(ctx, ws):
+            async for message in ws:
+                await ws.send(message.upper())
+
+        @server.route("/")
+        def get_index(ctx):
+            return ctx.response.text(STATUS_OK_200, "index")
+
+    async def open(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(self.upgrade)
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+        return reader, writer, head
+
+    async def test_echo(self):
+        reader, writer, head = await self.open()
+        self.assertTrue(head.startswith(b"HTTP/1.1 101 "))
+        self.assertIn(b"Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=\r\n", head)
+        self.assertIn(b"Sec-WebSocket-Protocol: chat\r\n", head)
+        writer.write(client_frame(OP_TEXT, b"hello"))
+        writer.write(client_frame(OP_CLOSE, (1000).to_bytes(2, "big")))
+        data = await asyncio.wait_for(reader.read(), 5)
+        self.assertEqual(
+            [(True, OP_TEXT, b"HELLO"), (True, OP_CLOSE, b"\x03\xe8")],
+            parse_frames(data),
+        )
+        writer.close()
+
+    async def test_message_too_big(self):
+        reader, writer, _ = await self.open()
+        writer.write(client_frame(OP_TEXT, b"a" * 17))
+        frames = parse_frames(await asyncio.wait_for(reader.read(2 + 2), 5))
+        self.assertEqual([(True, OP_CLOSE, (1009).to_bytes(2, "big"))], frames)
+        writer.write(client_frame(OP_CLOSE, (1009).to_bytes(2, "big")))
+        self.assertEqual(b"", await asyncio.wait_for(reader.read(), 5))
+        writer.close()
+
+    async def test_not_upgrade(self):
+        data = await self.send(
+            b"GET /ws HTTP/1.1\r\n\r\nGET / HTTP/1.1\r\nConnection: close\r\n\r\n"
+        )
+        self.assertTrue(data.startswith(b"HTTP/1.1 426 "))
+        self.assertIn(b"\r\nUpgrade: websocket\r\n", data)
+        self.assertTrue(data.endswith(b"index"))
+
+    async def test_stop_going_away(self):
+        reader, writer, _ = await self.open()
+        await asyncio.sleep(0.01)
+        stopping = asyncio.ensure_future(self.server.stop())
+        frames = parse_frames(await asyncio.wait_for(reader.read(4), 5))
+        self.assertEqual([(True, OP_CLOSE, (1001).to_bytes(2, "big"))], frames)
+        writer.write(client_frame(OP_CLOSE, (1001).to_bytes(2, "big")))
+        self.assertEqual(b"", await asyncio.wait_for(reader.read(), 5))
+        await asyncio.wait_for(stopping, 5)
+        await self.server.start("127.0.0.1", 0)
+        writer.close()
+
+
+class TestServerSentEvents(ServerTestCase):
+    def register_routes(self, server):
+        self.hub = EventHub()
+
+        @server.route("/events")
+        def get_events(ctx):
+            return ctx.response.sse(self.hub)
+
+    async def test_stream(self):
+        self.hub.publish("missed")
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(b"GET /events HTTP/1.1\r\nLast-Event-ID: 0\r\n\r\n")
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+        self.assertIn(b"\r\nContent-Type: text/event-stream\r\n", head)
+        self.assertIn(b"id: 1\ndata: missed\n\n", await reader.readuntil(b"\n\n"))
+        self.hub.publish("live")
+        self.assertIn(b"id: 2\ndata: live\n\n", await reader.readuntil(b"\n\n"))
+        self.hub.close()
+        self.assertTrue((await asyncio.wait_for(reader.readuntil(b"0\r\n\r\n"), 5)))
+        writer.close()
+        await writer.wait_closed()
+
+    async def test_stream_http_1_0(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(b"GET /events HTTP/1.0\r\n\r\n")
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+        self.assertTrue(head.startswith(b"HTTP/1.0 200"))
+        self.assertNotIn(b"Transfer-Encoding", head)
+        self.hub.publish("live")
+        self.assertEqual(b"id: 1\ndata: live\n\n", await reader.readuntil(b"\n\n"))
+        self.hub.close()
+        self.assertEqual(b"", await asyncio.wait_for(reader.read(), 5))
+        writer.close()
+        await writer.wait_closed()
+
+    async def test_disconnect_unsubscribes(self):
+        errors = []
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: errors.append(context)
+        )
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(b"GET /events HTTP/1.1\r\n\r\n")
+        await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+        self.assertEqual(1, len(self.hub))
+        writer.close()
+        await writer.wait_closed()
+        for _ in range(100):
+            self.hub.publish("ping")
+            await asyncio.sleep(0.01)
+            if not len(self.hub) and not self.server._tasks:
+                break
+        self.assertEqual(0, len(self.hub))
+        self.assertEqual(0, len(self.server._tasks))
+        # the lost connection isn't reported as unhandled
+        self.assertEqual([], errors)
+
+
+class TestFile(ServerTestCase):
+    def register_routes(self, server):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, "wb") as fo:
+            fo.write(bytes(range(256)) * 100)
+
+        @server.route("/file")
+        def get_file(ctx):
+            return ctx.response.file(self.path)
+
+    async def asyncTearDown(self):
+        await super().asyncTearDown()
+        os.remove(self.path)
+
+    async def test_full(self):
+        data = await self.send(b"GET /file HTTP/1.0\r\n\r\n")
+        head, body = data.split(b"\r\n\r\n", 1)
+        self.assertIn(b"\r\nContent-Length: 25600", head)
+        self.assertEqual(bytes(range(256)) * 100, body)
+
+    async def test_range(self):
+        data = await self.send(b"GET /file HTTP/1.0\r\nRange: bytes=10-19\r\n\r\n")
+        head, body = data.split(b"\r\n\r\n", 1)
+        self.assertTrue(head.startswith(b"HTTP/1.0 206"))
+        self.assertIn(b"\r\nContent-Range: bytes 10-19/25600", head)
+        self.assertEqual(bytes(range(10, 20)), body)
+
+    async def test_range_not_satisfiable(self):
+        data = await self.send(b"GET /file HTTP/1.0\r\nRange: bytes=30000-\r\n\r\n")
+        self.assertTrue(data.startswith(b"HTTP/1.0 416"))
+
+    async def test_head(self):
+        data = await self.send(b"HEAD /file HTTP/1.0\r\n\r\n")
+        head, body = data.split(b"\r\n\r\n", 1)
+        self.assertIn(b"\r\nContent-Length: 25600", head)
+        self.assertEqual(b"", body)
+
+
+class TestStatic(ServerTestCase):
+    def register_routes(self, server):
+        self.directory = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.directory.name, "index.html"), "wb") as fo:
+            fo.write(b"<h1>index</h1>")
+        with open(os.path.join(self.directory.name, "app.js"), "wb") as fo:
+            fo.write(b"plain")
+        with open(os.path.join(self.directory.name, "app.js.gz"), "wb") as fo:
+            fo.write(b"gzipped")
+        with open(os.path.join(self.directory.name, "my file.txt"), "wb") as fo:
+            fo.write(b"spaced")
+        server.mount_static("/static", self.directory.name)
+
+    async def asyncTearDown(self):
+        await super().asyncTearDown()
+        self.directory.cleanup()
+
+    async def test_index(self):
+        data = await self.send(b"GET /static/ HTTP/1.0\r\n\r\n")
+        self.assertIn(b"\r\nContent-Type: text/html", data)
+        self.assertTrue(data.endswith(b"<h1>index</h1>"))
+
+    async def test_precompressed(self):
+        data = await self.send(
+            b"GET /static/app.js HTTP/1.0\r\nAccept-Encoding: gzip, br;q=0\r\n\r\n"
+        )
+        self.assertIn(b"\r\nContent-Encoding: gzip", data)
+        self.assertIn(b"\r\nContent-Type: text/javascript", data)
+        self.assertTrue(data.endswith(b"gzipped"))
+
+    async def test_not_modified(self):
+        data = await self.send(b"GET /static/app.js HTTP/1.0\r\n\r\n")
+        etag = data.split(b"\r\nETag: ", 1)[1].split(b"\r\n", 1)[0]
+        data = await self.send(
+            b"GET /static/app.js HTTP/1.0\r\nIf-None-Match: " + etag + b"\r\n\r\n"
+        )
+        self.assertTrue(data.startswith(b"HTTP/1.0 304"))
+        self.assertTrue(data.endswith(b"\r\n\r\n"))
+
+    async def test_traversal(self):
+        data = await self.send(b"GET /static/../etc/passwd HTTP/1.0\r\n\r\n")
+        self.assertTrue(data.startswith(b"HTTP/1.0 404"))
+
+    async def test_percent_encoded(self):
+        data = await self.send(b"GET /static/my%20file.txt HTTP/1.0\r\n\r\n")
+        self.assertTrue(data.startswith(b"HTTP/1.0 200"))
+        self.assertTrue(data.endswith(b"spaced"))
+        for path in (b"%2e%2e/etc/passwd", b"..%2fetc%2fpasswd", b"app.js%00", b"%ff"):
+            data = await self.send(b"GET /static/" + path + b" HTTP/1.0\r\n\r\n")
+            self.assertTrue(data.startswith(b"HTTP/1.0 404"), path)
+
+
+class TestMetrics(ServerTestCase):
+    def register_routes(self, server):
+        self.events = []
+        server.on_conn_open(lambda peer_name, t: self.events.append("open"))
+        server.on_conn_close(lambda peer_name, t: self.events.append("close"))
+        self.metrics = Metrics()
+        self.metrics.install(server)
+
+        @server.route("/users/<int:id>")
+        def get_user(ctx):
+            return ctx.response.text(STATUS_OK_200, "user")
+
+        @server.route("/upload", "POST")
+        def post_upload(ctx):
+            return ctx.response.text(STATUS_OK_200, "uploaded")
+
+    async def test_metrics(self):
+        await self.send(b"GET /users/1 HTTP/1.1\r\n\r\nGET /users/2 HTTP/1.1\r\nConnection: close\r\n\r\n")
+        await self.send(b"GET /missing HTTP/1.0\r\n\r\n")
+        data = await self.send(b"GET /metrics HTTP/1.0\r\n\r\n")
+        self.assertIn(
+            b'\nhttp_requests_total{route="/users/<int:id>",method="GET",status="200"} 2\n',
+            data,
+        )
+        self.assertIn(b'\nhttp_requests_total{route="",method="GET",status="404"} 1\n', data)
+        self.assertIn(
+            b'\nhttp_request_duration_seconds_count{route="/users/<int:id>"} 2\n', data
+        )
+        self.assertIn(b"\nhttp_active_connections 1\n", data)
+        self.assertEqual(["open", "close", "open", "close", "open"], self.events[:5])
+
+    async def test_parse_excludes_upload(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(b"POST /upload HTTP/1.0\r\nContent-Length: 4\r\n\r\n")
+        await writer.drain()
+        await asyncio.sleep(0.2)
+        writer.write(b"data")
+        self.assertTrue((await asyncio.wait_for(reader.read(), 5)).endswith(b"uploaded"))
+        writer.close()
+        await writer.wait_closed()
+        # the payload arriving late counts towards the handler, not parsing
+        self.assertLess(self.metrics.parse_seconds["/upload"].sum, 0.1)
+        self.assertGreaterEqual(self.metrics.handler_seconds["/upload"].sum, 0.15)
+
+
+class TestAccessLog(ServerTestCase):
+    def make_server(self):
+        self.lines = []
+        return HTTPServer(logger=Logger(LEVEL_NONE, self, access_log=True))
+
+    def register_routes(self, server):
+        @server.route("/")
+        def get_index(ctx):
+            return ctx.response.text(STATUS_OK_200, "hello")
+
+    # acts as the logger's sink
+    def write(self, line):
+        self.lines.append(line)
+
+    def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def test_access_line(self):
+        await self.send(b"GET / HTTP/1.0\r\n\r\n")
+        self.assertEqual(1, len(self.lines))
+        self.assertRegex(self.lines[0], r'^127\.0\.0\.1 "GET /" 200 5 [0-9.]+ms$')
+
+
+class TestSocketOptions(IsolatedAsyncioTestCase):
+    async def test_options_applied(self):
+        server = HTTPServer()
+        await server.start("127.0.0.1", 0, keepalive=True, recv_buffer=65536)
+        try:
+            listening = server._server.sockets[0]
+            self.assertGreaterEqual(
+                listening.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF), 65536
+            )
+            self.assertIn(
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1), server._conn_socket_options
+            )
+        finally:
+            await server.stop()
@@ -0,0 +1,76 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from httpserver.sse import HEARTBEAT, EventHub, format_event
+
+
+async def next_chunk(subscription):
+    return await asyncio.wait_for(subscription.__anext__(), 1)
+
+
+class TestFormatEvent(TestCase):
+    def test_fields(self):
+        self.assertEqual(
+            b"id: 7\nevent: update\ndata: a\ndata: b\n\n",
+            format_event("a\r\nb", event="update", id=7),
+        )
+        self.assertEqual(b"retry: 1000\ndata: \n\n", format_event(b"", retry=1000))
+
+
+class TestEventHub(IsolatedAsyncioTestCase):
+    async def test_publish(self):
+        hub = EventHub()
+        first = hub.subscribe()
+        second = hub.subscribe()
+        self.assertEqual("1", hub.publish("one"))
+        hub.publish("two", event="update")
+        expected = b"id: 1\ndata: one\n\nid: 2\nevent: update\ndata: two\n\n"
+        self.assertEqual(expected, await next_chunk(first))
+        self.assertEqual(expected, await next_chunk(second))
+
+    async def test_replay(self):
+        hub = EventHub(history=2, retry=500)
+        for i in range(4):
+            hub.publish(str(i))
+        self.assertEqual(
+            b"retry: 500\n\nid: 4\ndata: 3\n\n", await next_chunk(hub.subscribe("3"))
+        )
+        # too old, everything kept is replayed
+        self.assertEqual(
+            b"retry: 500\n\nid: 3\ndata: 2\n\nid: 4\ndata: 3\n\n",
+            await next_chunk(hub.subscribe("1")),
+        )
+
+    async def test_drop_slow(self):
+        hub = EventHub(max_queue=2)
+        subscription = hub.subscribe()
+        for i in range(3):
+            hub.publish(str(i))
+        self.assertTrue(subscription.closed)
+        self.assertEqual(0, len(hub))
+        self.assertEqual(b"id: 1\ndata: 0\n\nid: 2\ndata: 1\n\n", await next_chunk(subscription))
+        with self.assertRaises(StopAsyncIteration):
+            await next_chunk(subscription)
+
+    async def test_skip_slow(self):
+        hub = EventHub(max_queue=1, drop_slow=False)
+        subscription = hub.subscribe()
+        hub.publish("0")
+        hub.publish("1")
+        self.assertEqual(1, subscription.skipped)
+        self.assertEqual(b"id: 1\ndata: 0\n\n", await next_chunk(subscription))
+        hub.publish("2")
+        self.assertEqual(b"id: 3\ndata: 2\n\n", await next_chunk(subscription))
+
+    async def test_heartbeat(self):
+        hub = EventHub(heartbeat=0.01)
+        self.assertEqual(HEARTBEAT, await next_chunk(hub.subscribe()))
+
+    async def test_cancel_unsubscribes(self):
+        hub = EventHub()
+        task = asyncio.ensure_future(hub.subscribe().__anext__())
+        await asyncio.sleep(0)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(0, len(hub))
@@ -0,0 +1,165 @@
+import asyncio
+import os
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from httpserver.helpers import BufferedReader
+from httpserver.websocket import (
+    CLOSE_GOING_AWAY,
+    CLOSE_MESSAGE_TOO_BIG,
+    CLOSE_PROTOCOL_ERROR,
+    OP_BINARY,
+    OP_CLOSE,
+    OP_CONTINUATION,
+    OP_PING,
+    OP_PONG,
+    OP_TEXT,
+    WebSocket,
+    WebSocketClosed,
+    accept_key,
+    frame_head,
+    unmask,
+)
+
+from .test_response import FakeWriter
+
+
+def client_frame(opcode, payload=b"", fin=True, masked=True):
+    """
+    Encode a frame as a client sends it, masked
+    """
+    head = bytearray(frame_head(opcode, len(payload), fin))
+    if not masked:
+        return bytes(head) + payload
+    head[1] |= 0x80
+    mask = os.urandom(4)
+    return bytes(head) + mask + unmask(payload, mask)
+
+
+def parse_frames(data):
+    """
+    Decode unmasked server frames into [(fin, opcode, payload), ...]
+    """
+    frames = []
+    while data:
+        length = data[1] & 0x7F
+        start = 2
+        if length == 126:
+            length = int.from_bytes(data[2:4], "big")
+            start = 4
+        elif length == 127:
+            length = int.from_bytes(data[2:10], "big")
+            start = 10
+        frames.append((bool(data[0] & 0x80), data[0] & 0x0F, data[start : start + length]))
+        data = data[start + length :]
+    return frames
+
+
+def make_websocket(data, **options):
+    stream = asyncio.StreamReader()
+    stream.feed_data(data)
+    stream.feed_eof()
+    writer = FakeWriter()
+    return WebSocket(BufferedReader(stream), writer, **options), writer
+
+
+class TestFrames(TestCase):
+    def test_accept_key(self):
+        # example from RFC 6455
+        self.assertEqual(
+            "s3pPLMBiTxaQ9kYGzzhZRbK+xOo=", accept_key("dGhlIHNhbXBsZSBub25jZQ==")
+        )
+
+    def test_frame_head_lengths(self):
+        self.assertEqual(b"\x81\x05", frame_head(OP_TEXT, 5))
+        self.assertEqual(b"\x02\x7e\x01\x00", frame_head(OP_BINARY, 256, fin=False))
+        self.assertEqual(b"\x82\x7f" + (70000).to_bytes(8, "big"), frame_head(OP_BINARY, 70000))
+
+    def test_unmask(self):
+        mask = b"\x37\xfa\x21\x3d"
+        # example from RFC 6455
+        self.assertEqual(b"Hello", unmask(b"\x7f\x9f\x4d\x51\x58", mask))
+        self.assertEqual(b"", unmask(b"", mask))
+
+
+class TestWebSocket(IsolatedAsyncioTestCase):
+    async def test_messages(self):
+        ws, _ = make_websocket(
+            client_frame(OP_TEXT, "héllo".encode())
+            + client_frame(OP_BINARY, bytes(300))
+            + client_frame(OP_BINARY, bytes(70000)),
+            max_message_size=100000,
+        )
+        self.assertEqual("héllo", await ws.receive())
+        self.assertEqual(bytes(300), await ws.receive())
+        self.assertEqual(bytes(70000), await ws.receive())
+        self.assertIsNone(await ws.receive())
+        self.assertEqual(1006, ws.close_code)
+
+    async def test_fragmented_with_ping(self):
+        ws, writer = make_websocket(
+            client_frame(OP_TEXT, b"frag", fin=False)
+            + client_frame(OP_PING, b"hi")
+            + client_frame(OP_CONTINUATION, b"men", fin=False)
+            + client_frame(OP_CONTINUATION, b"ted")
+        )
+        self.assertEqual("fragmented", await ws.receive())
+        self.assertEqual([(True, OP_PONG, b"hi")], parse_frames(b"".join(writer.writes)))
+
+    async def test_close_echoed(self):
+        ws, writer = make_websocket(client_frame(OP_CLOSE, (1000).to_bytes(2, "big")))
+        self.assertIsNone(await ws.receive())
+        self.assertTrue(ws.closed)
+        self.assertEqual(
+            [(True, OP_CLOSE, b"\x03\xe8")], parse_frames(b"".join(writer.writes))
+        )
+        with self.assertRaises(WebSocketClosed):
+            await ws.send("late")
+
+    async def test_message_too_big(self):
+        ws, writer = make_websocket(
+            client_frame(OP_TEXT, b"a" * 60, fin=False)
+            + client_frame(OP_CONTINUATION, b"a" * 60),
+            max_message_size=100,
+        )
+        self.assertIsNone(await ws.receive())
+        self.assertEqual(CLOSE_MESSAGE_TOO_BIG, ws.close_code)
+        self.assertEqual(OP_CLOSE, parse_frames(b"".join(writer.writes))[0][1])
+
+    async def test_protocol_errors(self):
+        for data in (
+            client_frame(OP_TEXT, b"plain", masked=False),
+            client_frame(OP_CONTINUATION, b"orphan"),
+            client_frame(OP_PING, b"", fin=False),
+            client_frame(OP_TEXT, b"a", fin=False) + client_frame(OP_TEXT, b"b"),
+        ):
+            ws, _ = make_websocket(data)
+            self.assertIsNone(await ws.receive())
+            self.assertEqual(CLOSE_PROTOCOL_ERROR, ws.close_code)
+
+    async def test_send(self):
+        ws, writer = make_websocket(b"")
+        await ws.send("text")
+        await ws.send(b"\x00\x01")
+        self.assertEqual(
+            [(True, OP_TEXT, b"text"), (True, OP_BINARY, b"\x00\x01")],
+            parse_frames(b"".join(writer.writes)),
+        )
+
+    async def test_keepalive(self):
+        ws, writer = make_websocket(b"", ping_interval=10)
+        now = ws._last_seen
+        self.assertTrue(ws.keepalive(now + 5))
+        self.assertEqual([], writer.writes)
+        self.assertTrue(ws.keepalive(now + 10))
+        self.assertEqual([(True, OP_PING, b"")], parse_frames(b"".join(writer.writes)))
+        self.assertTrue(ws.keepalive(now + 15))
+        ws._receiving = True
+        self.assertFalse(ws.keepalive(now + 20))
+
+    async def test_going_away(self):
+        ws, writer = make_websocket(b"")
+        ws.going_away()
+        self.assertEqual(CLOSE_GOING_AWAY, ws.close_code)
+        self.assertEqual(
+            [(True, OP_CLOSE, b"\x03\xe9")], parse_frames(b"".join(writer.writes))
+        )
@@ -0,0 +1,178 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from unittest import TestCase, skipUnless
+
+from httpserver.workers import Supervisor
+
+# a server reporting which worker answered
+SCRIPT = """
+import asyncio
+import os
+import sys
+
+from httpserver import HTTPServer
+from httpserver.constants import STATUS_OK_200
+from httpserver.logger import LEVEL_NONE, Logger
+from httpserver.workers import Supervisor
+
+server = HTTPServer(logger=Logger(LEVEL_NONE))
+
+@server.route("/pid")
+def get_pid(ctx):
+    return ctx.response.text(STATUS_OK_200, str(os.getpid()))
+
+@server.route("/slow")
+async def get_slow(ctx):
+    await asyncio.sleep(0.5)
+    return ctx.response.text(STATUS_OK_200, "slow")
+
+port = int(sys.argv[1])
+if sys.argv[2] == "serve":
+    server.serve(port=port)
+else:
+    Supervisor(server, port=port, workers=1, stats_interval=0.2, restart_delay=0.1).run()
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def read_all(sock):
+    data = b""
+    while True:
+        chunk = sock.recv(1024)
+        if not chunk:
+            return data
+        data += chunk
+
+
+def get_pid(port):
+    with socket.create_connection(("127.0.0.1", port), timeout=1) as sock:
+        sock.sendall(b"GET /pid HTTP/1.0\r\n\r\n")
+        data = read_all(sock)
+    return int(data.rsplit(b"\r\n\r\n", 1)[1])
+
+
+def pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def wait_for_pid(port, not_pid=None, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            pid = get_pid(port)
+            if pid != not_pid:
+                return pid
+        except (OSError, ValueError):
+            pass
+        if time.monotonic() > deadline:
+            raise AssertionError("no worker answered")
+        time.sleep(0.05)
+
+
+def start(port, mode):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.Popen(
+        [sys.executable, "-c", SCRIPT, str(port), mode],
+        cwd=root,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+
+
+class ProcessTestCase(TestCase):
+    mode = None
+
+    def setUp(self):
+        self.port = free_port()
+        self.process = start(self.port, self.mode)
+
+    def tearDown(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.communicate()
+
+    def assert_stops(self, signum=signal.SIGTERM):
+        self.process.send_signal(signum)
+        _, stderr = self.process.communicate(timeout=10)
+        self.assertEqual(0, self.process.returncode, stderr)
+
+
+@skipUnless(hasattr(os, "fork"), "workers need fork")
+class TestSupervisor(ProcessTestCase):
+    mode = "supervisor"
+
+    def test_restart_and_stop(self):
+        pid = wait_for_pid(self.port)
+        self.assertNotEqual(self.process.pid, pid)
+
+        # a crashed worker is replaced
+        os.kill(pid, signal.SIGKILL)
+        self.assertNotEqual(pid, wait_for_pid(self.port, not_pid=pid))
+        self.assert_stops()
+
+    def test_replace_on_sighup(self):
+        pid = wait_for_pid(self.port)
+        with socket.create_connection(("127.0.0.1", self.port), timeout=5) as sock:
+            sock.sendall(b"GET /slow HTTP/1.0\r\n\r\n")
+            time.sleep(0.1)
+            self.process.send_signal(signal.SIGHUP)
+            # the old worker finishes what it was handling
+            self.assertTrue(read_all(sock).endswith(b"\r\n\r\nslow"))
+        self.assertNotEqual(pid, wait_for_pid(self.port, not_pid=pid))
+        # the supervisor keeps running, having reaped the old worker
+        self.assertIsNone(self.process.poll())
+        deadline = time.monotonic() + 10
+        while pid_exists(pid) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(pid_exists(pid))
+        self.assert_stops()
+
+
+@skipUnless(hasattr(signal, "SIGTERM"), "needs signals")
+class TestServe(ProcessTestCase):
+    mode = "serve"
+
+    def test_drain_on_sigterm(self):
+        self.assertEqual(self.process.pid, wait_for_pid(self.port))
+        with socket.create_connection(("127.0.0.1", self.port), timeout=5) as sock:
+            sock.sendall(b"GET /slow HTTP/1.0\r\n\r\n")
+            time.sleep(0.1)
+            self.process.send_signal(signal.SIGTERM)
+            self.assertTrue(read_all(sock).endswith(b"\r\n\r\nslow"))
+        _, stderr = self.process.communicate(timeout=10)
+        self.assertEqual(0, self.process.returncode, stderr)
+
+
+class TestSupervisorStats(TestCase):
+    def test_reuse_port_start_option(self):
+        supervisor = Supervisor(None, start_options={"reuse_port": False, "backlog": 5})
+        self.assertFalse(supervisor._reuse_port)
+        self.assertEqual({"backlog": 5}, supervisor._start_options)
+
+    def test_counters_kept_after_exit(self):
+        supervisor = Supervisor(None)
+        report = {"pid": 10, "requests": 3, "connections": 2, "active_connections": 1}
+        supervisor.worker_stats = {10: report, 11: dict(report, pid=11)}
+        read_fd, write_fd = os.pipe()
+        # the worker's last report, sent as it exits
+        os.write(write_fd, json.dumps(dict(report, requests=5)).encode() + b"\n")
+        os.close(write_fd)
+        supervisor._worker_exited(10, read_fd)
+        stats = supervisor.stats
+        self.assertEqual(8, stats["requests"])
+        self.assertEqual(4, stats["connections"])
+        self.assertEqual(1, stats["active_connections"])